@@ -24,6 +24,14 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata# tells Alembic to use our SQLAlchemy models.
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Keeps autogenerate away from the FTS5 search table and its shadow tables,
+    which are managed by hand-written migrations."""
+    if type_ == "table" and name.startswith("book_search"):
+        return False
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -42,10 +50,11 @@ def run_migrations_offline() -> None:
     script output.
 
     """
-    url = config.get_main_option("sqlalchemy.url")
+    url = engine.url.render_as_string(hide_password=False) # same database the app is configured for
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -64,8 +73,13 @@ def run_migrations_online() -> None:
     connectable = engine
 
     with connectable.connect() as connection:
+        # batch migrations rebuild tables, which foreign key enforcement would block on SQLite
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            include_object=include_object
         )
 
         with context.begin_transaction():
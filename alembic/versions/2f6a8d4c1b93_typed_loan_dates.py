@@ -0,0 +1,78 @@
+"""store loan dates as DATE columns
+
+Revision ID: 2f6a8d4c1b93
+Revises: 7b3e9c1d0f42
+Create Date: 2026-10-18 16:12:41.207365
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f6a8d4c1b93'
+down_revision: Union[str, None] = '7b3e9c1d0f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 50000 # loans rewritten per UPDATE
+
+
+def normalize_dates(connection):
+    """Rewrites every SQLite loan date as a plain YYYY-MM-DD string, BATCH_SIZE loans at a time.
+
+    SQLite keeps DATE values as ISO text, so this is the whole conversion there; a value
+    date() can't parse is left alone and counted.
+    """
+    highest = connection.execute(sa.text("SELECT MAX(id) FROM loans")).scalar() or 0
+    for start in range(0, highest, BATCH_SIZE):
+        connection.execute(sa.text(
+            "UPDATE loans SET loan_date = COALESCE(date(loan_date), loan_date), "
+            "return_date = COALESCE(date(return_date), return_date) "
+            "WHERE id > :start AND id <= :end"
+        ), {'start': start, 'end': start + BATCH_SIZE})
+    unparsed = connection.execute(sa.text(
+        "SELECT COUNT(*) FROM loans WHERE date(loan_date) IS NULL "
+        "OR (return_date IS NOT NULL AND date(return_date) IS NULL)"
+    )).scalar()
+    if unparsed:
+        print(f"{unparsed} loan(s) have a date that isn't YYYY-MM-DD; fix them by hand.")
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    op.drop_index('ix_loans_return_date', table_name='loans')
+    if connection.dialect.name == 'sqlite':
+        normalize_dates(connection)
+        # rebuild the table with DATE columns. They're reflected as DATE already so the
+        # rows are copied as they are: a CAST to SQLite's DATE (NUMERIC) affinity would
+        # turn '2024-05-01' into 2024.
+        with op.batch_alter_table('loans', recreate='always', reflect_args=[
+            sa.Column('loan_date', sa.Date(), nullable=False),
+            sa.Column('return_date', sa.Date(), nullable=True),
+        ]):
+            pass
+    else:
+        op.alter_column('loans', 'loan_date', type_=sa.Date(), existing_type=sa.String(),
+                        existing_nullable=False, postgresql_using='loan_date::date')
+        op.alter_column('loans', 'return_date', type_=sa.Date(), existing_type=sa.String(),
+                        existing_nullable=True, postgresql_using='return_date::date')
+    op.create_index('ix_loans_loan_date', 'loans', ['loan_date'], unique=False)
+    op.create_index('ix_loans_return_date_loan_date', 'loans', ['return_date', 'loan_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_loans_return_date_loan_date', table_name='loans')
+    op.drop_index('ix_loans_loan_date', table_name='loans')
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('loans', recreate='always', reflect_args=[
+            sa.Column('loan_date', sa.String(), nullable=False),
+            sa.Column('return_date', sa.String(), nullable=True),
+        ]):
+            pass
+    else:
+        op.alter_column('loans', 'loan_date', type_=sa.String(), existing_type=sa.Date(), existing_nullable=False)
+        op.alter_column('loans', 'return_date', type_=sa.String(), existing_type=sa.Date(), existing_nullable=True)
+    op.create_index('ix_loans_return_date', 'loans', ['return_date'], unique=False)
@@ -0,0 +1,38 @@
+"""add books.current_loan_id
+
+Revision ID: 5d17b08c2e9a
+Revises: a3c9e41f7b20
+Create Date: 2026-10-18 10:03:27.604511
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d17b08c2e9a'
+down_revision: Union[str, None] = 'a3c9e41f7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # batch mode so SQLite can take the new foreign key (it rebuilds the table)
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.add_column(sa.Column('current_loan_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_books_current_loan_id', 'loans', ['current_loan_id'], ['id'], ondelete='SET NULL')
+
+    # backfill from the loans history
+    op.execute(
+        "UPDATE books SET current_loan_id = ("
+        "SELECT MAX(loans.id) FROM loans "
+        "WHERE loans.book_id = books.id AND loans.return_date IS NULL)"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.drop_constraint('fk_books_current_loan_id', type_='foreignkey')
+        batch_op.drop_column('current_loan_id')
@@ -0,0 +1,54 @@
+"""add fuzzy match index tables
+
+Revision ID: 7b3e9c1d0f42
+Revises: e4b2d6f81a37
+Create Date: 2026-10-18 15:06:18.442930
+
+The tables start empty; lib/db/fuzzy.py builds the index the first time it's searched
+(or run `python lib/db/fuzzy.py --rebuild`).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3e9c1d0f42'
+down_revision: Union[str, None] = 'e4b2d6f81a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('fuzzy_terms',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('text', sa.String(), nullable=False),
+    sa.Column('trigram_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('kind', 'entity_id', name='uq_fuzzy_terms_kind_entity')
+    )
+    op.create_table('fuzzy_trigrams',
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('trigram', sa.String(), nullable=False),
+    sa.Column('term_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['term_id'], ['fuzzy_terms.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('kind', 'trigram', 'term_id'),
+    sqlite_with_rowid=False
+    )
+    op.create_table('fuzzy_trigram_stats',
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('trigram', sa.String(), nullable=False),
+    sa.Column('term_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'trigram'),
+    sqlite_with_rowid=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('fuzzy_trigram_stats')
+    op.drop_table('fuzzy_trigrams')
+    op.drop_table('fuzzy_terms')
@@ -0,0 +1,56 @@
+"""add loan due dates and genre loan periods
+
+Revision ID: 9d4e7a2b6c15
+Revises: 2f6a8d4c1b93
+Create Date: 2026-10-18 17:40:09.118254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e7a2b6c15'
+down_revision: Union[str, None] = '2f6a8d4c1b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 50000 # loans backfilled per UPDATE
+DEFAULT_LOAN_PERIOD_DAYS = 21 # circulation.DEFAULT_LOAN_PERIOD_DAYS when this migration was written
+
+GENRE_PERIOD = (
+    "COALESCE((SELECT genres.loan_period_days FROM books JOIN genres ON genres.id = books.genre_id "
+    f"WHERE books.id = loans.book_id), {DEFAULT_LOAN_PERIOD_DAYS})"
+)
+
+
+def upgrade() -> None:
+    op.add_column('genres', sa.Column('loan_period_days', sa.Integer(), nullable=True))
+    op.add_column('loans', sa.Column('due_date', sa.Date(), nullable=True))
+
+    # every existing loan is due back one loan period after it was made
+    connection = op.get_bind()
+    if connection.dialect.name == 'sqlite':
+        due_date = f"COALESCE(date(loan_date, '+' || {GENRE_PERIOD} || ' days'), loan_date)"
+    else:
+        due_date = f"loan_date + {GENRE_PERIOD}"
+    highest = connection.execute(sa.text("SELECT MAX(id) FROM loans")).scalar() or 0
+    for start in range(0, highest, BATCH_SIZE):
+        connection.execute(
+            sa.text(f"UPDATE loans SET due_date = {due_date} WHERE id > :start AND id <= :end"),
+            {'start': start, 'end': start + BATCH_SIZE}
+        )
+
+    with op.batch_alter_table('loans') as batch_op:
+        batch_op.alter_column('due_date', existing_type=sa.Date(), nullable=False)
+    op.create_index('ix_loans_return_date_due_date', 'loans', ['return_date', 'due_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_loans_return_date_due_date', table_name='loans')
+    with op.batch_alter_table('loans') as batch_op:
+        batch_op.drop_column('due_date')
+    with op.batch_alter_table('genres') as batch_op:
+        batch_op.drop_column('loan_period_days')
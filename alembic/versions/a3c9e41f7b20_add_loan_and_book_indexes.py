@@ -0,0 +1,41 @@
+"""add loan and book indexes
+
+Revision ID: a3c9e41f7b20
+Revises: 795915e37dec
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e41f7b20'
+down_revision: Union[str, None] = '795915e37dec'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_books_title'), 'books', ['title'], unique=False)
+    op.create_index(op.f('ix_books_author_id'), 'books', ['author_id'], unique=False)
+    op.create_index(op.f('ix_books_genre_id'), 'books', ['genre_id'], unique=False)
+    op.create_index(op.f('ix_loans_book_id'), 'loans', ['book_id'], unique=False)
+    op.create_index(op.f('ix_loans_borrower_id'), 'loans', ['borrower_id'], unique=False)
+    op.create_index(op.f('ix_loans_return_date'), 'loans', ['return_date'], unique=False)
+    # outstanding loans only - keeps the "is this book on loan?" lookup small
+    op.create_index('ix_loans_open_book_id', 'loans', ['book_id'], unique=False,
+                    sqlite_where=sa.text('return_date IS NULL'),
+                    postgresql_where=sa.text('return_date IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_loans_open_book_id', table_name='loans')
+    op.drop_index(op.f('ix_loans_return_date'), table_name='loans')
+    op.drop_index(op.f('ix_loans_borrower_id'), table_name='loans')
+    op.drop_index(op.f('ix_loans_book_id'), table_name='loans')
+    op.drop_index(op.f('ix_books_genre_id'), table_name='books')
+    op.drop_index(op.f('ix_books_author_id'), table_name='books')
+    op.drop_index(op.f('ix_books_title'), table_name='books')
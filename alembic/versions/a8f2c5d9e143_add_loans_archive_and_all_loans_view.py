@@ -0,0 +1,65 @@
+"""add the loans_archive table, the all_loans view and an index on books.current_loan_id
+
+Revision ID: a8f2c5d9e143
+Revises: f3d81b6a4c27
+Create Date: 2026-10-18 23:05:52.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8f2c5d9e143'
+down_revision: Union[str, None] = 'f3d81b6a4c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LOAN_COLUMNS = 'id, loan_date, return_date, due_date, borrower_id, book_id'
+
+
+def upgrade() -> None:
+    # Deleting a loan checks books.current_loan_id's ON DELETE SET NULL, a scan of every book
+    # without an index (~40 ms a loan at 100k books). Only the books that are out are indexed.
+    op.create_index('ix_books_current_loan_id', 'books', ['current_loan_id'], unique=False,
+                    sqlite_where=sa.text('current_loan_id IS NOT NULL'),
+                    postgresql_where=sa.text('current_loan_id IS NOT NULL'))
+    op.create_table('loans_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('loan_date', sa.Date(), nullable=False),
+    sa.Column('return_date', sa.Date(), nullable=False),
+    sa.Column('due_date', sa.Date(), nullable=False),
+    sa.Column('borrower_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.ForeignKeyConstraint(['borrower_id'], ['borrowers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_loans_archive_book_id'), 'loans_archive', ['book_id'], unique=False)
+    op.create_index(op.f('ix_loans_archive_borrower_id'), 'loans_archive', ['borrower_id'], unique=False)
+    op.create_index('ix_loans_archive_loan_date_covering', 'loans_archive', ['loan_date', 'book_id', 'borrower_id', 'return_date'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        # Without AUTOINCREMENT SQLite hands out MAX(id) + 1, so once the newest loans were
+        # archived their ids would be given out again. The rebuild copies every loan once.
+        with op.batch_alter_table('loans', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+    # (a PostgreSQL sequence never goes back)
+
+    op.execute(f"CREATE VIEW all_loans AS SELECT {LOAN_COLUMNS} FROM loans UNION ALL SELECT {LOAN_COLUMNS} FROM loans_archive")
+
+
+def downgrade() -> None:
+    op.execute("DROP VIEW IF EXISTS all_loans")
+    # archived loans go back where they came from, so no history is lost
+    op.execute(f"INSERT INTO loans ({LOAN_COLUMNS}) SELECT {LOAN_COLUMNS} FROM loans_archive")
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('loans', recreate='always'):
+            pass
+    op.drop_index('ix_loans_archive_loan_date_covering', table_name='loans_archive')
+    op.drop_index(op.f('ix_loans_archive_borrower_id'), table_name='loans_archive')
+    op.drop_index(op.f('ix_loans_archive_book_id'), table_name='loans_archive')
+    op.drop_table('loans_archive')
+    op.drop_index('ix_books_current_loan_id', table_name='books')
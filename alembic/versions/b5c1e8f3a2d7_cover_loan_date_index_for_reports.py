@@ -0,0 +1,29 @@
+"""cover the loan date index for the circulation reports
+
+Revision ID: b5c1e8f3a2d7
+Revises: 9d4e7a2b6c15
+Create Date: 2026-10-18 18:52:27.604913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5c1e8f3a2d7'
+down_revision: Union[str, None] = '9d4e7a2b6c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the covering index starts with loan_date, so it serves every lookup the old one did
+    op.create_index('ix_loans_loan_date_covering', 'loans', ['loan_date', 'book_id', 'borrower_id', 'return_date'], unique=False)
+    op.drop_index('ix_loans_loan_date', table_name='loans')
+
+
+def downgrade() -> None:
+    op.create_index('ix_loans_loan_date', 'loans', ['loan_date'], unique=False)
+    op.drop_index('ix_loans_loan_date_covering', table_name='loans')
@@ -0,0 +1,78 @@
+"""add borrowers.phone_key, a digits-only phone number with a unique index
+
+Revision ID: c4e9a7b2d815
+Revises: a8f2c5d9e143
+Create Date: 2026-10-18 23:41:08.664920
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e9a7b2d815'
+down_revision: Union[str, None] = 'a8f2c5d9e143'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000 # borrowers keyed per UPDATE
+
+
+def phone_key(phone_number):
+    """lib.db.models.phone_key as of this revision."""
+    number, _, extension = phone_number.lower().partition('x')
+    digits = re.sub(r'\D', '', number)
+    if len(digits) == 13 and digits.startswith('001'):
+        digits = digits[3:]
+    elif len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return digits + re.sub(r'\D', '', extension)
+
+
+def backfill_phone_keys(connection):
+    """Keys every borrower's phone number, BATCH_SIZE borrowers at a time, oldest first.
+
+    A number with no digits, or one an older borrower already has (written differently),
+    is left without a key, since the unique index would refuse it. Returns those as
+    (id, phone_number).
+    """
+    borrowers = sa.table('borrowers', sa.column('id', sa.Integer), sa.column('phone_number', sa.String), sa.column('phone_key', sa.String))
+    set_key = borrowers.update().where(borrowers.c.id == sa.bindparam('borrower_id')).values(phone_key=sa.bindparam('key'))
+    seen, unkeyed, last_id = set(), [], 0
+    while True:
+        rows = connection.execute(
+            sa.select(borrowers.c.id, borrowers.c.phone_number).where(borrowers.c.id > last_id).order_by(borrowers.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return unkeyed
+        keys = []
+        for borrower_id, phone_number in rows:
+            key = phone_key(phone_number)
+            if not key or key in seen:
+                unkeyed.append((borrower_id, phone_number))
+            else:
+                seen.add(key)
+                keys.append({'borrower_id': borrower_id, 'key': key})
+        if keys:
+            connection.execute(set_key, keys)
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    op.add_column('borrowers', sa.Column('phone_key', sa.String(), nullable=True))
+    unkeyed = backfill_phone_keys(op.get_bind())
+    op.create_index(op.f('ix_borrowers_phone_key'), 'borrowers', ['phone_key'], unique=True)
+    if unkeyed:
+        print(f"{len(unkeyed)} borrower(s) got no phone key, so can't be found by phone: their number "
+              "has no digits, or is an older borrower's written differently. Fix them by hand:")
+        for borrower_id, phone_number in unkeyed[:20]:
+            print(f"  Borrower ID {borrower_id}: '{phone_number}'")
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_borrowers_phone_key'), table_name='borrowers')
+    with op.batch_alter_table('borrowers') as batch_op:
+        batch_op.drop_column('phone_key')
@@ -0,0 +1,45 @@
+"""unique open loan per book
+
+Revision ID: c81f4a9d3e56
+Revises: 5d17b08c2e9a
+Create Date: 2026-10-18 11:20:05.331872
+
+Older databases (including seeded ones) can hold more than one outstanding loan
+for the same book. Before the index becomes unique, every outstanding loan that
+has a later loan for the same book is closed on the date that later loan began,
+since the book must have come back by then. The newest loan stays open.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81f4a9d3e56'
+down_revision: Union[str, None] = '5d17b08c2e9a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE loans SET return_date = ("
+        "SELECT MIN(later.loan_date) FROM loans AS later "
+        "WHERE later.book_id = loans.book_id AND later.id > loans.id) "
+        "WHERE return_date IS NULL AND EXISTS ("
+        "SELECT 1 FROM loans AS later "
+        "WHERE later.book_id = loans.book_id AND later.return_date IS NULL AND later.id > loans.id)"
+    )
+    op.drop_index('ix_loans_open_book_id', table_name='loans')
+    op.create_index('ix_loans_open_book_id', 'loans', ['book_id'], unique=True,
+                    sqlite_where=sa.text('return_date IS NULL'),
+                    postgresql_where=sa.text('return_date IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_loans_open_book_id', table_name='loans')
+    op.create_index('ix_loans_open_book_id', 'loans', ['book_id'], unique=False,
+                    sqlite_where=sa.text('return_date IS NULL'),
+                    postgresql_where=sa.text('return_date IS NULL'))
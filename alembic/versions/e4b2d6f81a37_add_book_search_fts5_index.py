@@ -0,0 +1,64 @@
+"""add book_search fts5 index
+
+Revision ID: e4b2d6f81a37
+Revises: c81f4a9d3e56
+Create Date: 2026-10-18 13:41:52.907316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b2d6f81a37'
+down_revision: Union[str, None] = 'c81f4a9d3e56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # FTS5 is SQLite only; other databases keep the LIKE fallback in lib/db/search.py
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute(
+        "CREATE VIRTUAL TABLE book_search USING fts5(title, author_name, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER book_search_ai AFTER INSERT ON books BEGIN "
+        "INSERT INTO book_search(rowid, title, author_name) "
+        "VALUES (new.id, new.title, (SELECT name FROM authors WHERE id = new.author_id)); END"
+    )
+    op.execute(
+        "CREATE TRIGGER book_search_ad AFTER DELETE ON books BEGIN "
+        "DELETE FROM book_search WHERE rowid = old.id; END"
+    )
+    op.execute(
+        "CREATE TRIGGER book_search_au AFTER UPDATE OF title, author_id ON books BEGIN "
+        "UPDATE book_search SET title = new.title, author_name = (SELECT name FROM authors WHERE id = new.author_id) "
+        "WHERE rowid = new.id; END"
+    )
+    op.execute(
+        "CREATE TRIGGER book_search_author_au AFTER UPDATE OF name ON authors BEGIN "
+        "UPDATE book_search SET author_name = new.name "
+        "WHERE rowid IN (SELECT id FROM books WHERE author_id = new.id); END"
+    )
+    # index the existing catalogue
+    op.execute(
+        "INSERT INTO book_search(rowid, title, author_name) "
+        "SELECT books.id, books.title, authors.name FROM books LEFT JOIN authors ON authors.id = books.author_id"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS book_search_author_au")
+    op.execute("DROP TRIGGER IF EXISTS book_search_au")
+    op.execute("DROP TRIGGER IF EXISTS book_search_ad")
+    op.execute("DROP TRIGGER IF EXISTS book_search_ai")
+    op.execute("DROP TABLE IF EXISTS book_search")
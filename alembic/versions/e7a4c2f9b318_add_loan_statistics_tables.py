@@ -0,0 +1,72 @@
+"""add loan statistics tables
+
+Revision ID: e7a4c2f9b318
+Revises: b5c1e8f3a2d7
+Create Date: 2026-10-18 19:36:05.481729
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a4c2f9b318'
+down_revision: Union[str, None] = 'b5c1e8f3a2d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('book_loan_stats',
+    sa.Column('book_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('loan_count', sa.Integer(), nullable=False),
+    sa.Column('returned_count', sa.Integer(), nullable=False),
+    sa.Column('total_loan_days', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+    op.create_index(op.f('ix_book_loan_stats_loan_count'), 'book_loan_stats', ['loan_count'], unique=False)
+    op.create_table('borrower_loan_stats',
+    sa.Column('borrower_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('loan_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('borrower_id')
+    )
+    op.create_index(op.f('ix_borrower_loan_stats_loan_count'), 'borrower_loan_stats', ['loan_count'], unique=False)
+    op.create_table('genre_month_stats',
+    sa.Column('genre_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('month', sa.String(), nullable=False),
+    sa.Column('loan_count', sa.Integer(), nullable=False),
+    sa.Column('returned_count', sa.Integer(), nullable=False),
+    sa.Column('total_loan_days', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('genre_id', 'month')
+    )
+
+    # fill them from the existing loans
+    if op.get_bind().dialect.name == 'sqlite':
+        month, days = "substr(loans.loan_date, 1, 7)", "julianday(loans.return_date) - julianday(loans.loan_date)"
+    else:
+        month, days = "to_char(loans.loan_date, 'YYYY-MM')", "loans.return_date - loans.loan_date"
+    op.execute(
+        "INSERT INTO book_loan_stats (book_id, loan_count, returned_count, total_loan_days) "
+        f"SELECT book_id, COUNT(id), COUNT(return_date), CAST(COALESCE(SUM({days}), 0) AS INTEGER) "
+        "FROM loans GROUP BY book_id"
+    )
+    op.execute(
+        "INSERT INTO borrower_loan_stats (borrower_id, loan_count) "
+        "SELECT borrower_id, COUNT(id) FROM loans GROUP BY borrower_id"
+    )
+    op.execute(
+        "INSERT INTO genre_month_stats (genre_id, month, loan_count, returned_count, total_loan_days) "
+        f"SELECT books.genre_id, {month}, COUNT(loans.id), COUNT(loans.return_date), "
+        f"CAST(COALESCE(SUM({days}), 0) AS INTEGER) "
+        f"FROM loans JOIN books ON books.id = loans.book_id GROUP BY books.genre_id, {month}"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('genre_month_stats')
+    op.drop_index(op.f('ix_borrower_loan_stats_loan_count'), table_name='borrower_loan_stats')
+    op.drop_table('borrower_loan_stats')
+    op.drop_index(op.f('ix_book_loan_stats_loan_count'), table_name='book_loan_stats')
+    op.drop_table('book_loan_stats')
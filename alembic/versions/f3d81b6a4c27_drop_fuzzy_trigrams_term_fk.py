@@ -0,0 +1,51 @@
+"""drop the fuzzy_trigrams foreign key to fuzzy_terms
+
+Revision ID: f3d81b6a4c27
+Revises: e7a4c2f9b318
+Create Date: 2026-10-18 21:47:13.562081
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3d81b6a4c27'
+down_revision: Union[str, None] = 'e7a4c2f9b318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def trigrams_table(*foreign_keys):
+    """fuzzy_trigrams as created by 7b3e9c1d0f42, with the given foreign keys."""
+    return sa.Table('fuzzy_trigrams', sa.MetaData(),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('trigram', sa.String(), nullable=False),
+        sa.Column('term_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'trigram', 'term_id'),
+        *foreign_keys,
+        sqlite_with_rowid=False
+    )
+
+
+def upgrade() -> None:
+    # Every deleted term made SQLite scan all the postings to check the ON DELETE CASCADE
+    # (term_id is last in the key); lib/db/fuzzy.py deletes the postings itself.
+    if op.get_bind().dialect.name == 'sqlite':
+        # the constraint has no name, so the table is rebuilt from a definition without it
+        with op.batch_alter_table('fuzzy_trigrams', recreate='always', copy_from=trigrams_table()):
+            pass
+    else:
+        op.drop_constraint('fuzzy_trigrams_term_id_fkey', 'fuzzy_trigrams', type_='foreignkey')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('fuzzy_trigrams', recreate='always', copy_from=trigrams_table(
+            sa.ForeignKeyConstraint(['term_id'], ['fuzzy_terms.id'], ondelete='CASCADE'))):
+            pass
+    else:
+        op.create_foreign_key('fuzzy_trigrams_term_id_fkey', 'fuzzy_trigrams', 'fuzzy_terms',
+                              ['term_id'], ['id'], ondelete='CASCADE')
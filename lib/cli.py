@@ -5,74 +5,120 @@ import datetime
 # Ensure the project root is in the path for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from lib.db.models import Author, Genre, Book, Borrower, Loan, session
+if __name__ == '__main__' and len(sys.argv) > 1:
+    # a command (python lib/cli.py borrow --borrower 12 --book 99) runs without the menu,
+    # so it skips importing the modules only the menu uses
+    from lib.db.commands import run_command_line
+    sys.exit(run_command_line(sys.argv[1:]))
+
+from sqlalchemy.orm import joinedload
+
+from lib.db.models import Author, Book, Borrower, Loan, session, phone_key
+from lib.db.catalogue import catalogue_query
+from lib.db.listing import fetch_page, stream_rows, author_rows_query, borrower_rows_query, loan_rows_query, STREAM_BATCH_SIZE
+from lib.db.search import search_books, SEARCH_LIMIT
+from lib.db.fuzzy import fuzzy_search
+from lib.db.circulation import check_out_many, check_in_many, DEFAULT_LOAN_PERIOD_DAYS
+from lib.db.deletion import delete_authors, delete_books, delete_borrowers
+from lib.db.overdue import outstanding_loans_query, overdue_loans, days_overdue
+from lib.db.analytics import print_report, window_start, REPORT_MONTHS
+from lib.db.refcache import reference_cache, genre_rows, genre_row, author_row, author_page
+from lib.db.profiling import start_operation, finish_operation
+
+
+# Paged Listing Helper
+def show_listing(query, id_column, title, empty_message, format_row, fetch=None):
+    """Prints a listing one keyset page at a time, with next/previous page navigation.
+
+    fetch(after_id=..., before_id=...) gets a page; by default straight from the query.
+    """
+    fetch = fetch or (lambda after_id=None, before_id=None: fetch_page(query, id_column, after_id=after_id, before_id=before_id))
+    page = fetch()
+    if not page.rows:
+        print(empty_message)
+        return
 
+    print(f"\n--- {title} ---")
+    while True:
+        for row in page.rows:
+            print(format_row(row))
+        if not (page.has_next or page.has_previous):
+            return # everything fit on one page
+
+        options = []
+        if page.has_next:
+            options += ["n = next page", "a = show all remaining"]
+        if page.has_previous:
+            options.append("p = previous page")
+        choice = input(f"({', '.join(options)}, Enter = done): ").strip().lower()
+        if choice == 'n' and page.has_next:
+            page = fetch(after_id=page.last_id)
+        elif choice == 'p' and page.has_previous:
+            page = fetch(before_id=page.first_id)
+        elif choice == 'a' and page.has_next:
+            # stream the rest in batches instead of loading it all at once
+            for row in stream_rows(query, id_column, after_id=page.last_id):
+                print(format_row(row))
+            return
+        else:
+            return
 
 #Views the Data Functions
 def list_all_authors():
-    """Lists all authors in the database."""
-    authors = session.query(Author).all()
-    if authors:
-        print("\n--- All Authors ---")
-        for author in authors:
-            print(f"ID: {author.id}, Name: {author.name}")
-    else:
-        print("\nNo authors found in the library.")
+    """Lists all authors in the database, a page at a time (pages come from the reference cache)."""
+    show_listing(
+        author_rows_query(session), Author.id, "All Authors", "\nNo authors found in the library.",
+        lambda author: f"ID: {author.id}, Name: {author.name}",
+        fetch=lambda after_id=None, before_id=None: author_page(session, after_id, before_id)
+    )
 
 #List All Genres Function 
 def list_all_genres():
-    """Lists all genres in the database."""
-    genres = session.query(Genre).all()
+    """Lists all genres in the database (from the reference cache)."""
+    genres = genre_rows(session)
     if genres:
         print("\n--- All Genres ---")
         for genre in genres:
-            print(f"ID: {genre.id}, Name: {genre.name}")
+            print(f"ID: {genre.id}, Name: {genre.name}, Loan Period: {genre.loan_period_days or DEFAULT_LOAN_PERIOD_DAYS} days")
     else:
         print("\nNo genres found in the library.")
 
 # List All Books Function
+def format_book_row(book):
+    author_name = book.author_name if book.author_name else "N/A"
+    genre_name = book.genre_name if book.genre_name else "N/A"
+    status = "Available" if book.open_loan_id is None else "On Loan"
+    return f"ID: {book.id}, Title: '{book.title}', Published Year: {book.published_year}, Author: '{author_name}', Genre: '{genre_name}', Status: {status}"
+
 def list_all_books():
-    """Lists all books with their author and genre."""
-    books = session.query(Book).all()
-    if books:
-        print("\n--- All Books ---")
-        for book in books:
-            author_name = book.author.name if book.author else "N/A"
-            genre_name = book.genre.name if book.genre else "N/A"
-            # Check for existing outstanding loans
-            outstanding_loans = session.query(Loan).filter(
-                Loan.book_id == book.id,
-                Loan.return_date == None # Check for null return_date
-            ).count()
-            status = "Available" if outstanding_loans == 0 else "On Loan"
-            print(f"ID: {book.id}, Title: '{book.title}', Published Year: {book.published_year}, Author: '{author_name}', Genre: '{genre_name}', Status: {status}")
-    else:
-        print("\nNo books found in the library.")
+    """Lists all books with their author and genre, a page at a time."""
+    # One joined query builds every row (author, genre and loan status included)
+    show_listing(
+        catalogue_query(session), Book.id, "All Books", "\nNo books found in the library.",
+        format_book_row
+    )
 
 # List All Borrowers Function
 def list_all_borrowers():
-    """Lists all borrowers."""
-    borrowers = session.query(Borrower).all()
-    if borrowers:
-        print("\n--- All Borrowers ---")
-        for borrower in borrowers:
-            print(f"ID: {borrower.id}, Name: '{borrower.name}', Phone: '{borrower.phone_number}'")
-    else:
-        print("\nNo borrowers found.")
+    """Lists all borrowers, a page at a time."""
+    show_listing(
+        borrower_rows_query(session), Borrower.id, "All Borrowers", "\nNo borrowers found.",
+        lambda borrower: f"ID: {borrower.id}, Name: '{borrower.name}', Phone: '{borrower.phone_number}'"
+    )
 
 # List All Loans Function
+def format_loan_row(loan):
+    borrower_name = loan.borrower_name if loan.borrower_name else "N/A"
+    book_title = loan.book_title if loan.book_title else "N/A"
+    status = "Returned" if loan.return_date else "Outstanding"
+    return f"Loan ID: {loan.id}, Borrower: '{borrower_name}', Book: '{book_title}', Loan Date: {loan.loan_date}, Return Date: {loan.return_date if loan.return_date else 'N/A'} (Status: {status})"
+
 def list_all_loans():
-    """Lists all loans with borrower and book details."""
-    loans = session.query(Loan).all()
-    if loans:
-        print("\n--- All Loans ---")
-        for loan in loans:
-            borrower_name = loan.borrower.name if loan.borrower else "N/A"
-            book_title = loan.book.title if loan.book else "N/A"
-            status = "Returned" if loan.return_date else "Outstanding"
-            print(f"Loan ID: {loan.id}, Borrower: '{borrower_name}', Book: '{book_title}', Loan Date: {loan.loan_date}, Return Date: {loan.return_date if loan.return_date else 'N/A'} (Status: {status})")
-    else:
-        print("\nNo loan records found.")
+    """Lists the loans (archived ones aside, see lib/db/archive.py) with borrower and book details, a page at a time."""
+    show_listing(
+        loan_rows_query(session), Loan.id, "All Loans", "\nNo loan records found.",
+        format_loan_row
+    )
 
 #Add Data Functions
 
@@ -120,7 +166,7 @@ def add_book():
     author_id_str = input("Enter Author ID for the book: ").strip()
     try:
         author_id = int(author_id_str)
-        author = session.query(Author).get(author_id)
+        author = author_row(session, author_id)
         if not author:
             print(f"Author with ID {author_id} not found.")
             return
@@ -133,7 +179,7 @@ def add_book():
     genre_id_str = input("Enter Genre ID for the book: ").strip()
     try:
         genre_id = int(genre_id_str)
-        genre = session.query(Genre).get(genre_id)
+        genre = genre_row(session, genre_id)
         if not genre:
             print(f"Genre with ID {genre_id} not found.")
             return
@@ -145,12 +191,12 @@ def add_book():
         new_book = Book(
             title=title,
             published_year=published_year,
-            author=author,
-            genre=genre
+            author_id=author.id,
+            genre_id=genre.id
         )
         session.add(new_book)
         session.commit()
-        print(f"Book '{new_book.title}' by {new_book.author.name} added with ID: {new_book.id}.")
+        print(f"Book '{new_book.title}' by {author.name} added with ID: {new_book.id}.")
     except Exception as e:
         session.rollback()
         print(f"Error adding book: {e}")
@@ -168,11 +214,14 @@ def add_borrower():
     if not phone_number:
         print("Phone number cannot be empty.")
         return
+    if not phone_key(phone_number):
+        print("Phone number must contain digits.")
+        return
 
-    # Check if phone number already exists
-    existing_borrower = session.query(Borrower).filter_by(phone_number=phone_number).first()
+    # Check if phone number already exists, however it was written
+    existing_borrower = session.query(Borrower).filter_by(phone_key=phone_key(phone_number)).first()
     if existing_borrower:
-        print(f"Borrower with phone number '{phone_number}' already exists (ID: {existing_borrower.id}).")
+        print(f"Borrower with phone number '{existing_borrower.phone_number}' already exists (ID: {existing_borrower.id}).")
         return
 
     try:
@@ -186,131 +235,161 @@ def add_borrower():
 
 # Delete Data Functions
 
+def confirm_delete(rows, kind, consequence):
+    """Lists the rows (id, name) about to be deleted and asks for a yes."""
+    if len(rows) == 1:
+        [(row_id, name)] = rows
+        what = f"'{name}' (ID: {row_id})"
+    else:
+        for row_id, name in rows:
+            print(f"ID: {row_id}, '{name}'")
+        what = f"these {len(rows)} {kind}s"
+    return input(f"Are you sure you want to delete {what}{consequence}? (yes/no): ").lower().strip() == 'yes'
+
 def delete_author():
-    """Deletes an author and cascades to their books."""
+    """Deletes one or more authors and their books (set-based: a few statements for the lot)."""
     print("\n--- Delete Author ---")
     list_all_authors()
-    author_id_str = input("Enter Author ID to delete: ").strip()
-    try:
-        author_id = int(author_id_str)
-        author_to_delete = session.query(Author).get(author_id)
-        if not author_to_delete:
-            print(f"Author with ID {author_id} not found.")
-            return
-    except ValueError:
-        print("Invalid Author ID. Please enter a number.")
+    author_ids = parse_ids(input("Enter Author ID(s) to delete (separate several with spaces or commas): "))
+    if not author_ids:
+        print("Invalid Author ID(s). Please enter one or more numbers.")
+        return
+    authors = session.query(Author.id, Author.name).filter(Author.id.in_(author_ids)).order_by(Author.id).all()
+    if not authors:
+        print(f"No author found with ID(s) {', '.join(map(str, author_ids))}.")
         return
 
-    confirm = input(f"Are you sure you want to delete '{author_to_delete.name}' (ID: {author_to_delete.id}) and ALL their books? (yes/no): ").lower().strip()
-    if confirm == 'yes':
-        try:
-            session.delete(author_to_delete)
-            session.commit()
-            print(f"Author '{author_to_delete.name}' and all their books deleted successfully.")
-        except Exception as e:
-            session.rollback()
-            print(f"Error deleting author: {e}")
-    else:
+    if not confirm_delete(authors, 'author', " and ALL their books"):
         print("Author deletion cancelled.")
+        return
+    try:
+        results = delete_authors(session, author_ids)
+    except Exception as e:
+        session.rollback()
+        print(f"Error deleting author: {e}")
+        return
+    for author_id, name, error in results:
+        if error:
+            print(f"Author ID {author_id}: not deleted. {error}")
+        else:
+            print(f"Author '{name}' and all their books deleted successfully.")
  
  # Delete Book Function
 def delete_book():
-    """Deletes a book."""
+    """Deletes one or more books with their loan history; books on loan are kept."""
     print("\n--- Delete Book ---")
     list_all_books()
-    book_id_str = input("Enter Book ID to delete: ").strip()
-    try:
-        book_id = int(book_id_str)
-        book_to_delete = session.query(Book).get(book_id)
-        if not book_to_delete:
-            print(f"Book with ID {book_id} not found.")
-            return
-    except ValueError:
-        print("Invalid Book ID. Please enter a number.")
+    book_ids = parse_ids(input("Enter Book ID(s) to delete (separate several with spaces or commas): "))
+    if not book_ids:
+        print("Invalid Book ID(s). Please enter one or more numbers.")
+        return
+    books = session.query(Book.id, Book.title, Book.current_loan_id).filter(Book.id.in_(book_ids)).order_by(Book.id).all()
+    if not books:
+        print(f"No book found with ID(s) {', '.join(map(str, book_ids))}.")
         return
 
-    # Check for outstanding loans before deleting book
-    outstanding_loans_for_book = session.query(Loan).filter(
-        Loan.book_id == book_to_delete.id,
-        Loan.return_date == None
-    ).first()
-
-    if outstanding_loans_for_book:
-        print(f"Cannot delete book '{book_to_delete.title}' (ID: {book_to_delete.id}) because it has an outstanding loan (Loan ID: {outstanding_loans_for_book.id}). Please return the book first.")
+    found = {book.id for book in books}
+    for book_id in dict.fromkeys(book_ids):
+        if book_id not in found:
+            print(f"Book with ID {book_id} not found.")
+    # Check for outstanding loans before deleting books
+    for book in books:
+        if book.current_loan_id is not None:
+            print(f"Cannot delete book '{book.title}' (ID: {book.id}) because it has an outstanding loan (Loan ID: {book.current_loan_id}). Please return the book first.")
+    books = [(book.id, book.title) for book in books if book.current_loan_id is None]
+    if not books:
         return
 
-    confirm = input(f"Are you sure you want to delete '{book_to_delete.title}' (ID: {book_to_delete.id})? (yes/no): ").lower().strip()
-    if confirm == 'yes':
-        try:
-            session.delete(book_to_delete)
-            session.commit()
-            print(f"Book '{book_to_delete.title}' deleted successfully.")
-        except Exception as e:
-            session.rollback()
-            print(f"Error deleting book: {e}")
-    else:
+    if not confirm_delete(books, 'book', ""):
         print("Book deletion cancelled.")
+        return
+    try:
+        results = delete_books(session, [book_id for book_id, title in books])
+    except Exception as e:
+        session.rollback()
+        print(f"Error deleting book: {e}")
+        return
+    for book_id, title, error in results:
+        if error:
+            print(f"Book ID {book_id}: not deleted. {error}")
+        else:
+            print(f"Book '{title}' deleted successfully.")
 
 
 # Delete Borrower Function
 def delete_borrower():
-    """Deletes a borrower and cascades to their loans."""
+    """Deletes one or more borrowers and their loans; the books they still have go back on the shelf."""
     print("\n--- Delete Borrower ---")
     list_all_borrowers()
-    borrower_id_str = input("Enter Borrower ID to delete: ").strip()
-    try:
-        borrower_id = int(borrower_id_str)
-        borrower_to_delete = session.query(Borrower).get(borrower_id)
-        if not borrower_to_delete:
-            print(f"Borrower with ID {borrower_id} not found.")
-            return
-    except ValueError:
-        print("Invalid Borrower ID. Please enter a number.")
+    borrower_ids = parse_ids(input("Enter Borrower ID(s) to delete (separate several with spaces or commas): "))
+    if not borrower_ids:
+        print("Invalid Borrower ID(s). Please enter one or more numbers.")
+        return
+    borrowers = session.query(Borrower.id, Borrower.name).filter(Borrower.id.in_(borrower_ids)).order_by(Borrower.id).all()
+    if not borrowers:
+        print(f"No borrower found with ID(s) {', '.join(map(str, borrower_ids))}.")
         return
 
-    confirm = input(f"Are you sure you want to delete '{borrower_to_delete.name}' (ID: {borrower_to_delete.id}) and ALL their loan records? (yes/no): ").lower().strip()
-    if confirm == 'yes':
-        try:
-            session.delete(borrower_to_delete)
-            session.commit()
-            print(f"Borrower '{borrower_to_delete.name}' and all their loan records deleted successfully.")
-        except Exception as e:
-            session.rollback()
-            print(f"Error deleting borrower: {e}")
-    else:
+    if not confirm_delete(borrowers, 'borrower', " and ALL their loan records"):
         print("Borrower deletion cancelled.")
+        return
+    try:
+        results = delete_borrowers(session, borrower_ids)
+    except Exception as e:
+        session.rollback()
+        print(f"Error deleting borrower: {e}")
+        return
+    for borrower_id, name, error in results:
+        if error:
+            print(f"Borrower ID {borrower_id}: not deleted. {error}")
+        else:
+            print(f"Borrower '{name}' and all their loan records deleted successfully.")
 
 # Find Data Functions
 
 def find_book_by_title():
-    """Finds books by title (case-insensitive, partial match)."""
+    """Finds books by title or author name (case-insensitive, matches word beginnings), best match first."""
     print("\n--- Find Book by Title ---")
-    search_term = input("Enter part of the book title to search for: ").strip()
+    search_term = input("Enter words from the book title (or author name) to search for: ").strip()
     if not search_term:
         print("Search term cannot be empty.")
         return
 
-    # Using ilike for case-insensitive partial match
-    books = session.query(Book).filter(Book.title.ilike(f'%{search_term}%')).all()
+    # Ranked full-text search, limited to the best SEARCH_LIMIT matches
+    books = search_books(session, search_term)
     if books:
         print(f"\n--- Books matching '{search_term}' ---")
         for book in books:
-            author_name = book.author.name if book.author else "N/A"
-            genre_name = book.genre.name if book.genre else "N/A"
+            author_name = book.author_name if book.author_name else "N/A"
+            genre_name = book.genre_name if book.genre_name else "N/A"
             print(f"ID: {book.id}, Title: '{book.title}', Author: '{author_name}', Genre: '{genre_name}'")
+        if len(books) == SEARCH_LIMIT:
+            print(f"(Showing the best {SEARCH_LIMIT} matches - add more words to narrow the search.)")
     else:
         print(f"\nNo books found matching '{search_term}'.")
+        # Maybe it was mistyped: suggest the closest titles
+        suggestions = fuzzy_search(session, search_term, kinds=('book',), limit=5)
+        if suggestions:
+            print("Did you mean:")
+            for kind, book_id, title, score in suggestions:
+                print(f"  ID: {book_id}, Title: '{title}'")
 
 # Find Borrower by Phone Number Function
 def find_borrower_by_phone():
-    """Finds a borrower by phone number."""
+    """Finds a borrower by phone number, however it's written, with their loans and books."""
     print("\n--- Find Borrower by Phone Number ---")
     phone_number = input("Enter borrower's phone number: ").strip()
     if not phone_number:
         print("Phone number cannot be empty.")
         return
 
-    borrower = session.query(Borrower).filter_by(phone_number=phone_number).first()
+    # one indexed probe on the phone key; the loans and their books come back in the same query
+    borrower = (
+        session.query(Borrower)
+        .options(joinedload(Borrower.loans).joinedload(Loan.book))
+        .filter(Borrower.phone_key == phone_key(phone_number))
+        .one_or_none()
+    )
     if borrower:
         print(f"\n--- Borrower Found ---")
         print(f"ID: {borrower.id}, Name: '{borrower.name}', Phone: '{borrower.phone_number}'")
@@ -325,10 +404,34 @@ def find_borrower_by_phone():
     else:
         print(f"\nNo borrower found with phone number '{phone_number}'.")
 
+# Fuzzy Search Function
+def fuzzy_find():
+    """Finds the closest book titles, author names and borrower names, even with typos."""
+    print("\n--- Fuzzy Search (Titles, Authors, Borrowers) ---")
+    search_text = input("Enter a title or name (typos are OK): ").strip()
+    if not search_text:
+        print("Search text cannot be empty.")
+        return
+
+    matches = fuzzy_search(session, search_text)
+    if matches:
+        print(f"\n--- Closest matches for '{search_text}' ---")
+        for kind, entity_id, text, score in matches:
+            print(f"{kind.title()} ID: {entity_id}, '{text}' (similarity {score:.2f})")
+    else:
+        print(f"\nNothing close to '{search_text}' was found.")
+
 # Loan Management Functions
 
+def parse_ids(text):
+    """The ids in text, separated by spaces or commas, or None if any isn't a number."""
+    try:
+        return [int(part) for part in text.replace(',', ' ').split()]
+    except ValueError:
+        return None
+
 def borrow_book():
-    """Records a new loan (borrowing a book)."""
+    """Records new loans (borrowing one or more books)."""
     print("\n--- Borrow a Book ---")
 
     # Step 1: Select Borrower
@@ -344,89 +447,96 @@ def borrow_book():
         print("Invalid Borrower ID. Please enter a number.")
         return
 
-    # Step 2: Select Book
+    # Step 2: Select the books (a patron can take several at once)
     list_all_books() # This now shows book status (Available/On Loan)
-    book_id_str = input("Enter Book ID to borrow: ").strip()
-    try:
-        book_id = int(book_id_str)
-        book = session.query(Book).get(book_id)
-        if not book:
-            print(f"Book with ID {book_id} not found.")
-            return
-    except ValueError:
-        print("Invalid Book ID. Please enter a number.")
+    book_ids = parse_ids(input("Enter Book ID(s) to borrow (separate several with spaces or commas): "))
+    if not book_ids:
+        print("Invalid Book ID(s). Please enter one or more numbers.")
         return
 
-    # Step 3: Check if the book is already on loan
-    # Look for an outstanding loan for this book
-    outstanding_loan = session.query(Loan).filter(
-        Loan.book_id == book.id,
-        Loan.return_date == None
-    ).first()
-
-    if outstanding_loan:
-        print(f"Book '{book.title}' is currently on loan (Loan ID: {outstanding_loan.id}) and cannot be borrowed.")
-        return
-
-    # Step 4: Create the loan record
-    loan_date = datetime.date.today().isoformat() # Current date as string
-
+    # Step 3: Lend every available one in one transaction; the set is checked in one query
+    loan_date = datetime.date.today()
     try:
-        new_loan = Loan(
-            borrower=borrower,
-            book=book,
-            loan_date=loan_date,
-            return_date=None # It's a new loan, so no return date yet
-        )
-        session.add(new_loan)
-        session.commit()
-        print(f"Book '{book.title}' successfully borrowed by '{borrower.name}'. Loan ID: {new_loan.id}.")
+        results = check_out_many(session, borrower.id, book_ids, loan_date)
     except Exception as e:
         session.rollback()
-        print(f"Error borrowing book: {e}")
+        print(f"Error borrowing books: {e}")
+        return
+    for book_id, loan_id, error in results:
+        if error:
+            print(f"Book ID {book_id}: not borrowed. {error}")
+        else:
+            print(f"Book ID {book_id}: borrowed by '{borrower.name}'. Loan ID: {loan_id}.")
 
 # Return Book Function
 def return_book():
-    """Records the return of a book."""
+    """Records the return of one or more books."""
     print("\n--- Return a Book ---")
 
-    # Step 1: List all outstanding loans
-    outstanding_loans = session.query(Loan).filter(Loan.return_date == None).all()
-    if not outstanding_loans:
+    # Step 1: List all outstanding loans (book and borrower are joined in, one streamed query)
+    print("\n--- Outstanding Loans ---")
+    outstanding = 0
+    for loan in outstanding_loans_query(session).yield_per(STREAM_BATCH_SIZE):
+        outstanding += 1
+        print(f"Loan ID: {loan.id}, Book: '{loan.book_title or 'N/A'}', Borrower: '{loan.borrower_name or 'N/A'}', Loan Date: {loan.loan_date}, Due: {loan.due_date}")
+    if not outstanding:
         print("\nNo outstanding loans to return.")
         return
 
-    print("\n--- Outstanding Loans ---")
-    for loan in outstanding_loans:
-        borrower_name = loan.borrower.name if loan.borrower else "N/A"
-        book_title = loan.book.title if loan.book else "N/A"
-        print(f"Loan ID: {loan.id}, Book: '{book_title}', Borrower: '{borrower_name}', Loan Date: {loan.loan_date}")
+    # Step 2: Select the loans to return (several books can come back at once)
+    loan_ids = parse_ids(input("Enter Loan ID(s) to mark as returned (separate several with spaces or commas): "))
+    if not loan_ids:
+        print("Invalid Loan ID(s). Please enter one or more numbers.")
+        return
 
-    # Step 2: Select loan to return
-    loan_id_str = input("Enter Loan ID to mark as returned: ").strip()
+    # Step 3: Close the loans and put the books back on the shelf, in one transaction
+    return_date = datetime.date.today()
     try:
-        loan_id = int(loan_id_str)
-        loan_to_return = session.query(Loan).get(loan_id)
-        if not loan_to_return:
-            print(f"Loan with ID {loan_id} not found.")
-            return
+        results = check_in_many(session, loan_ids, return_date)
+    except Exception as e:
+        session.rollback()
+        print(f"Error returning books: {e}")
+        return
+    for loan_id, book_id, error in results:
+        if error:
+            print(f"Loan ID {loan_id}: not returned. {error}")
+        else:
+            print(f"Loan ID {loan_id}: book ID {book_id} returned on {return_date}.")
+
+
+# Overdue Loans Function
+def list_overdue_loans():
+    """Lists the loans that are past their due date, most overdue first."""
+    print("\n--- Overdue Loans ---")
+    today = datetime.date.today()
+    overdue = 0
+    for loan in overdue_loans(session, today):
+        overdue += 1
+        print(f"Loan ID: {loan.id}, Book: '{loan.book_title}', Borrower: '{loan.borrower_name}' ({loan.phone_number}), "
+              f"Due: {loan.due_date} ({days_overdue(loan, today)} day(s) overdue)")
+    if not overdue:
+        print("No loans are overdue.")
+
+
+# Circulation Reports Function
+def show_report(report):
+    """Prints a circulation report over a number of months chosen by the user."""
+    months_str = input(f"Months to cover (Enter for {REPORT_MONTHS}, 0 for all time): ").strip()
+    try:
+        months = int(months_str) if months_str else REPORT_MONTHS
     except ValueError:
-        print("Invalid Loan ID. Please enter a number.")
+        print("Invalid number of months. Please enter a number.")
         return
+    print_report(session, report, window_start(months))
 
-    if loan_to_return.return_date:
-        print(f"Loan ID {loan_to_return.id} (Book: '{loan_to_return.book.title}') has already been returned on {loan_to_return.return_date}.")
-        return
 
-    # Step 3: Update the loan record with return date
-    return_date = datetime.date.today().isoformat() # Current date as string
-    try:
-        loan_to_return.return_date = return_date
-        session.commit()
-        print(f"Book '{loan_to_return.book.title}' successfully returned by '{loan_to_return.borrower.name}'. Marked as returned on {return_date}.")
-    except Exception as e:
-        session.rollback()
-        print(f"Error returning book: {e}")
+# Cache Statistics Function
+def show_cache_stats():
+    """Shows how often the genre and author lookups were answered from the reference cache."""
+    stats = reference_cache.stats()
+    print("\n--- Reference Cache ---")
+    print(f"Hits: {stats['hits']}, Misses: {stats['misses']} (hit rate {stats['hit_rate']:.0%})")
+    print(f"Entries: {stats['entries']}, Evictions: {stats['evictions']}, Invalidations: {stats['invalidations']}")
 
 
 # CLI Menu and Main Loop
@@ -451,11 +561,19 @@ def display_menu():
     print("--- Find Data ---")
     print("12. Find Book by Title")
     print("13. Find Borrower by Phone Number")
+    print("14. Fuzzy Search (Titles, Authors, Borrowers)")
     print("--- Loan Management ---")
-    print("14. Borrow a Book")
-    print("15. Return a Book")
+    print("15. Borrow a Book")
+    print("16. Return a Book")
+    print("17. Overdue Loans")
+    print("--- Circulation Reports ---")
+    print("18. Most Borrowed Books")
+    print("19. Busiest Borrowers")
+    print("20. Loans per Genre per Month")
+    print("21. Average Loan Duration")
     print("--- Other ---")
-    print("16. Exit") 
+    print("22. Cache Statistics")
+    print("23. Exit")
     print("---------------------------")
 
 
@@ -465,45 +583,67 @@ def main():
         display_menu()
         choice = input("Enter your choice: ").strip() # .strip() removes whitespace
 
-        if choice == '1':
-            list_all_authors()
-        elif choice == '2':
-            list_all_genres()
-        elif choice == '3':
-            list_all_books()
-        elif choice == '4':
-            list_all_borrowers()
-        elif choice == '5':
-            list_all_loans()
-        elif choice == '6':
-            add_author()
-        elif choice == '7':
-            add_book()
-        elif choice == '8':
-            add_borrower()
-        elif choice == '9':
-            delete_author()
-        elif choice == '10':
-            delete_book()
-        elif choice == '11':
-            delete_borrower()
-        elif choice == '12':
-            find_book_by_title()
-        elif choice == '13':
-            find_borrower_by_phone()
-        elif choice == '14':
-            borrow_book()
-        elif choice == '15':
-            return_book()
-        elif choice == '16':
-            print("Exiting LibMate Manager. Goodbye!")
-            break
-        else:
-            print("Invalid choice. Please try again.")
+        start_operation(f"menu option {choice}") # with LIBMATE_PROFILE=1, its SQL is summarised when it's done
+        try:
+            if choice == '1':
+                list_all_authors()
+            elif choice == '2':
+                list_all_genres()
+            elif choice == '3':
+                list_all_books()
+            elif choice == '4':
+                list_all_borrowers()
+            elif choice == '5':
+                list_all_loans()
+            elif choice == '6':
+                add_author()
+            elif choice == '7':
+                add_book()
+            elif choice == '8':
+                add_borrower()
+            elif choice == '9':
+                delete_author()
+            elif choice == '10':
+                delete_book()
+            elif choice == '11':
+                delete_borrower()
+            elif choice == '12':
+                find_book_by_title()
+            elif choice == '13':
+                find_borrower_by_phone()
+            elif choice == '14':
+                fuzzy_find()
+            elif choice == '15':
+                borrow_book()
+            elif choice == '16':
+                return_book()
+            elif choice == '17':
+                list_overdue_loans()
+            elif choice == '18':
+                show_report('most-borrowed')
+            elif choice == '19':
+                show_report('busiest-borrowers')
+            elif choice == '20':
+                show_report('genres-by-month')
+            elif choice == '21':
+                show_report('loan-duration')
+            elif choice == '22':
+                show_cache_stats()
+            elif choice == '23':
+                print("Exiting LibMate Manager. Goodbye!")
+                break
+            else:
+                print("Invalid choice. Please try again.")
+        finally:
+            # every menu operation is its own unit of work: closing the session drops whatever
+            # it loaded (and any unfinished transaction), so the identity map can't grow from one
+            # operation to the next and the next operation reads fresh rows from other desks
+            session.remove()
+            finish_operation()
 
         input("\nPress Enter to continue...") # Pause for user to read output
 
-    session.close() # Close the session when the application exits
+    session.remove() # Close the session when the application exits
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,193 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import datetime
+
+from sqlalchemy import func, literal_column
+
+from lib.db.models import Author, Genre, Book, Borrower, Loan, BookLoanStat, BorrowerLoanStat, GenreMonthStat, loan_history, session
+from lib.db.stats import month_key
+
+REPORT_LIMIT = 10    # rows in the "most borrowed" and "busiest borrowers" reports
+REPORT_MONTHS = 12   # default window the reports cover; 0 means all time
+
+# stats table holding the all-time loan count per loans column
+STATS = {'book_id': BookLoanStat, 'borrower_id': BorrowerLoanStat}
+
+
+def window_start(months, today=None):
+    """First day of the month months - 1 months before today's, or None for all time.
+
+    Windows start on a month boundary, so they cover whole rows of genre_month_stats.
+    """
+    if not months:
+        return None
+    today = today or datetime.date.today()
+    month_index = today.year * 12 + today.month - 1 - (months - 1)
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def in_window(query, loans, since):
+    return query.filter(loans.c.loan_date >= since) if since else query
+
+
+def top_counts(session, column, since, limit):
+    """Subquery of the limit values of a loans column with the most loans: (column, loans) rows.
+
+    All-time totals are the top entries of the stats table's loan_count index. Within a
+    window the loans themselves are counted, archived ones included (loan_history),
+    grouping on column + 0 so SQLite can't pick the column's own index (and read every
+    loan through it) over a range scan of each table's covering loan-date index.
+    """
+    if not since:
+        stat = STATS[column.key]
+        key = getattr(stat, column.key)
+        return (
+            session.query(key, stat.loan_count.label('loans'))
+            .filter(stat.loan_count > 0)
+            .order_by(stat.loan_count.desc(), key)
+            .limit(limit)
+            .subquery()
+        )
+    loans = loan_history('id', 'loan_date', column.key)
+    key = (loans.c[column.key] + 0).label(column.key)
+    return (
+        in_window(session.query(key, func.count(loans.c.id).label('loans')), loans, since)
+        .group_by(key)
+        .order_by(literal_column('loans').desc(), key)
+        .limit(limit)
+        .subquery()
+    )
+
+
+def most_borrowed_books(session, since=None, limit=REPORT_LIMIT):
+    """(book_id, title, author_name, loans) for the limit most borrowed books, most loans first.
+
+    Only the top rows are joined to their book and author.
+    """
+    counts = top_counts(session, Loan.book_id, since, limit)
+    return (
+        session.query(counts.c.book_id, Book.title, Author.name.label('author_name'), counts.c.loans)
+        .select_from(counts)
+        .outerjoin(Book, Book.id == counts.c.book_id)
+        .outerjoin(Author, Book.author_id == Author.id)
+        .order_by(counts.c.loans.desc(), counts.c.book_id)
+        .all()
+    )
+
+
+def busiest_borrowers(session, since=None, limit=REPORT_LIMIT):
+    """(borrower_id, name, phone_number, loans) for the limit borrowers with the most loans."""
+    counts = top_counts(session, Loan.borrower_id, since, limit)
+    return (
+        session.query(counts.c.borrower_id, Borrower.name, Borrower.phone_number, counts.c.loans)
+        .select_from(counts)
+        .outerjoin(Borrower, Borrower.id == counts.c.borrower_id)
+        .order_by(counts.c.loans.desc(), counts.c.borrower_id)
+        .all()
+    )
+
+
+def genre_months(session, since=None):
+    """genre_month_stats rows for the months from since on (all months if None)."""
+    query = session.query(GenreMonthStat)
+    return query.filter(GenreMonthStat.month >= month_key(since)) if since else query
+
+
+def loans_per_genre_per_month(session, since=None):
+    """(month, genre_name, loans, share) rows by month and then by loans, where share is
+    the genre's fraction of that month's loans (a window over the month's rows)."""
+    month_total = func.sum(GenreMonthStat.loan_count).over(partition_by=GenreMonthStat.month)
+    return (
+        genre_months(session, since)
+        .with_entities(
+            GenreMonthStat.month,
+            Genre.name.label('genre_name'),
+            GenreMonthStat.loan_count.label('loans'),
+            (GenreMonthStat.loan_count * 1.0 / month_total).label('share'),
+        )
+        .outerjoin(Genre, Genre.id == GenreMonthStat.genre_id)
+        .filter(GenreMonthStat.loan_count > 0)
+        .order_by(GenreMonthStat.month, GenreMonthStat.loan_count.desc(), Genre.name)
+        .all()
+    )
+
+
+def average_loan_duration(session, since=None):
+    """(genre_name, returned_loans, average_days) per genre for the returned loans, longest first.
+
+    Outstanding loans don't have a duration yet and are left out.
+    """
+    returned = func.sum(GenreMonthStat.returned_count)
+    average_days = func.sum(GenreMonthStat.total_loan_days) * 1.0 / returned
+    return (
+        genre_months(session, since)
+        .with_entities(
+            Genre.name.label('genre_name'),
+            returned.label('returned_loans'),
+            average_days.label('average_days'),
+        )
+        .outerjoin(Genre, Genre.id == GenreMonthStat.genre_id)
+        .group_by(GenreMonthStat.genre_id, Genre.name)
+        .having(returned > 0)
+        .order_by(average_days.desc())
+        .all()
+    )
+
+
+def overall_average(durations):
+    """Average loan duration over all genres, from average_loan_duration's rows."""
+    returned = sum(row.returned_loans for row in durations)
+    if not returned:
+        return None
+    return sum(row.returned_loans * float(row.average_days) for row in durations) / returned
+
+
+REPORTS = ('most-borrowed', 'busiest-borrowers', 'genres-by-month', 'loan-duration')
+
+
+def print_report(session, report, since=None, limit=REPORT_LIMIT):
+    """Prints one of REPORTS for the loans made since the given date (all loans if None)."""
+    period = f"since {since}" if since else "all time"
+    if report == 'most-borrowed':
+        print(f"\n--- Most Borrowed Books ({period}) ---")
+        rows = most_borrowed_books(session, since, limit)
+        for rank, (book_id, title, author_name, loans) in enumerate(rows, 1):
+            print(f"{rank}. '{title or 'N/A'}' by {author_name or 'N/A'} (Book ID: {book_id}): {loans} loan(s)")
+    elif report == 'busiest-borrowers':
+        print(f"\n--- Busiest Borrowers ({period}) ---")
+        rows = busiest_borrowers(session, since, limit)
+        for rank, (borrower_id, name, phone_number, loans) in enumerate(rows, 1):
+            print(f"{rank}. {name or 'N/A'} ({phone_number or 'N/A'}, Borrower ID: {borrower_id}): {loans} loan(s)")
+    elif report == 'genres-by-month':
+        print(f"\n--- Loans per Genre per Month ({period}) ---")
+        rows = loans_per_genre_per_month(session, since)
+        current_month = None
+        for month, genre_name, loans, share in rows:
+            if month != current_month:
+                current_month = month
+                print(f"{month}:")
+            print(f"  {genre_name or 'No genre'}: {loans} loan(s) ({share:.0%})")
+    else:
+        print(f"\n--- Average Loan Duration ({period}) ---")
+        rows = average_loan_duration(session, since)
+        for genre_name, returned_loans, average_days in rows:
+            print(f"{genre_name or 'No genre'}: {float(average_days):.1f} day(s) over {returned_loans} returned loan(s)")
+        if rows:
+            print(f"All genres: {overall_average(rows):.1f} day(s)")
+    if not rows:
+        print("No loans in this period.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Circulation reports, read from the loan statistics tables.")
+    parser.add_argument('report', choices=REPORTS + ('all',), nargs='?', default='all', help="report to print (default: all)")
+    parser.add_argument('--months', type=int, default=REPORT_MONTHS, help=f"months of loans to cover, 0 for all time (default {REPORT_MONTHS})")
+    parser.add_argument('--limit', type=int, default=REPORT_LIMIT, help="rows in the most-borrowed and busiest-borrowers reports")
+    args = parser.parse_args()
+
+    since = window_start(args.months)
+    for report in (REPORTS if args.report == 'all' else (args.report,)):
+        print_report(session, report, since, args.limit)
+    session.close()
@@ -0,0 +1,96 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import datetime
+
+from sqlalchemy import select, insert, delete, func
+
+from lib.db.models import Loan, ArchivedLoan, session
+from lib.db.circulation import run_write
+
+ARCHIVE_AFTER_DAYS = 365     # loans returned longer ago than this are archived
+ARCHIVE_BATCH_SIZE = 5000    # loans moved per transaction
+
+loans_table = Loan.__table__
+archive_table = ArchivedLoan.__table__
+
+# Returned loans are history: the desk never looks at them again, but every one stays in
+# the loans table that lending, returning and the loan listing query, and the indexes they
+# use keep growing with it. Archiving moves loans returned before a cutoff into
+# loans_archive, a batch at a time, each batch in a transaction of its own so the desks
+# only ever wait for one batch. Archived loans keep their ids, the loan statistics go on
+# counting them (the rows are moved with Core statements, which don't fire the ORM events),
+# and reports and exports see both tables through the all_loans view.
+
+
+def archive_cutoff(days, today=None):
+    """The date loans have to have been returned before to be archived."""
+    return (today or datetime.date.today()) - datetime.timedelta(days=days)
+
+
+def archive_batch(session, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Moves up to batch_size loans returned before cutoff into loans_archive, in the
+    session's transaction without committing. Returns how many were moved.
+
+    The loans are found in ix_loans_return_date_loan_date, whose first entries are always
+    the next ones due, since the ones before them have been moved.
+    """
+    connection = session.connection()
+    loan_ids = connection.execute(
+        select(Loan.id).where(Loan.return_date < cutoff).limit(batch_size)
+    ).scalars().all()
+    if loan_ids:
+        columns = [column.name for column in archive_table.columns]
+        connection.execute(insert(archive_table).from_select(
+            columns, select(*[loans_table.c[column] for column in columns]).where(loans_table.c.id.in_(loan_ids))
+        ))
+        connection.execute(delete(loans_table).where(loans_table.c.id.in_(loan_ids)))
+    return len(loan_ids)
+
+
+def archive_loans(session, cutoff, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """Archives every loan returned before cutoff, batch_size loans per transaction.
+    Calls progress(total moved so far) after each batch. Returns the number archived."""
+    archived = 0
+    while True:
+        moved = run_write(session, lambda: archive_batch(session, cutoff, batch_size))
+        archived += moved
+        if progress and moved:
+            progress(archived)
+        if moved < batch_size:
+            return archived
+
+
+def archive_counts(session):
+    """(loans in the loans table, archived loans)."""
+    return (
+        session.query(func.count(Loan.id)).scalar(),
+        session.query(func.count(ArchivedLoan.id)).scalar(),
+    )
+
+
+def archivable_count(session, cutoff):
+    """How many loans were returned before cutoff, i.e. would be archived."""
+    return session.query(func.count(Loan.id)).filter(Loan.return_date < cutoff).scalar()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move returned loans into the loans_archive table, a batch at a time.")
+    which = parser.add_mutually_exclusive_group()
+    which.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help=f"archive loans returned more than this many days ago (default {ARCHIVE_AFTER_DAYS})")
+    which.add_argument('--before', type=datetime.date.fromisoformat, help="archive loans returned before this date (YYYY-MM-DD)")
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help=f"loans moved per transaction (default {ARCHIVE_BATCH_SIZE})")
+    parser.add_argument('--dry-run', action='store_true', help="only count the loans that would be archived")
+    args = parser.parse_args()
+
+    cutoff = args.before or archive_cutoff(args.days)
+    if args.dry_run:
+        print(f"{archivable_count(session, cutoff)} loan(s) returned before {cutoff} would be archived.")
+    else:
+        archived = archive_loans(session, cutoff, args.batch_size,
+                                 progress=lambda total: print(f"  {total} loan(s) archived...", end='\r'))
+        print(f"Archived {archived} loan(s) returned before {cutoff}.")
+    active, archived = archive_counts(session)
+    print(f"Loans table: {active} loan(s); archive: {archived} loan(s).")
+    session.close()
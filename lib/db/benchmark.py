@@ -0,0 +1,375 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import contextlib
+import datetime
+import hashlib
+import json
+import math
+import multiprocessing
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from lib.db.soak import SEARCH_WORDS
+
+# Row counts per scale. Each scale is seeded (or copied from --cache-dir) and benchmarked in
+# a process of its own, so every scale gets a fresh engine and its own peak RSS.
+SCALES = {
+    'small': {'authors': 100, 'books': 1_000, 'borrowers': 500, 'loans': 10_000},
+    'medium': {'authors': 10_000, 'books': 100_000, 'borrowers': 20_000, 'loans': 1_000_000},
+    'large': {'authors': 100_000, 'books': 1_000_000, 'borrowers': 200_000, 'loans': 10_000_000},
+}
+BOOKS_PER_DELETED_AUTHOR = 5
+
+
+# Benchmarked operations: (name, prepare). prepare(bench) runs untimed before each call and
+# returns the answers to the function's prompts, {prompt prefix: answer or [answers in turn]};
+# prompts it doesn't mention (page through a listing, "Months to cover") get Enter.
+
+def nothing(bench):
+    return {}
+
+
+def next_page(bench):
+    return {'(': ['n', '']} # the first two pages of a listing
+
+
+def new_author(bench):
+    return {"Enter author's name": f"Benchmark Author {bench.next_number()}"}
+
+
+def new_book(bench):
+    return {
+        'Enter book title': f"Benchmark Book {bench.next_number()}",
+        'Enter published year': '2024',
+        'Enter Author ID': str(bench.random_id('authors')),
+        'Enter Genre ID': str(bench.random.randint(1, 9)),
+    }
+
+
+def new_borrower(bench):
+    number = bench.next_number()
+    return {"Enter borrower's name": f"Benchmark Borrower {number}", "Enter borrower's phone number": f"555-{number}"}
+
+
+def author_to_delete(bench):
+    from lib.db.models import Author, Book, session
+    author = Author(name=f"Benchmark Author {bench.next_number()}")
+    author.books = [Book(title=f"Benchmark Book {n}", published_year=2024, genre_id=1) for n in range(BOOKS_PER_DELETED_AUTHOR)]
+    session.add(author)
+    session.commit()
+    return {'Enter Author ID(s) to delete': str(author.id), 'Are you sure': 'yes'}
+
+
+def book_to_delete(bench):
+    from lib.db.models import Book, session
+    book = Book(title=f"Benchmark Book {bench.next_number()}", published_year=2024, author_id=1, genre_id=1)
+    session.add(book)
+    session.commit()
+    return {'Enter Book ID(s) to delete': str(book.id), 'Are you sure': 'yes'}
+
+
+def borrower_to_delete(bench):
+    """A new borrower with a short history: three loans, two of them returned."""
+    from lib.db.models import Borrower, session
+    from lib.db.circulation import check_out_many, check_in_many
+    number = bench.next_number()
+    borrower = Borrower(name=f"Benchmark Borrower {number}", phone_number=f"555-{number}")
+    session.add(borrower)
+    session.commit()
+    loans = check_out_many(session, borrower.id, bench.available_books(3))
+    check_in_many(session, [loan_id for book_id, loan_id, error in loans if loan_id][:2])
+    return {'Enter Borrower ID(s) to delete': str(borrower.id), 'Are you sure': 'yes'}
+
+
+def title_words(bench):
+    return {'Enter words from the book title': bench.random.choice(SEARCH_WORDS)}
+
+
+def borrower_phone(bench):
+    from lib.db.models import Borrower, session
+    return {"Enter borrower's phone number": session.get(Borrower, bench.random_id('borrowers')).phone_number}
+
+
+def misspelt_words(bench):
+    return {'Enter a title or name': bench.random.choice(SEARCH_WORDS)[:-1] + 'x'}
+
+
+def books_to_borrow(bench):
+    return {'Enter Borrower ID': str(bench.random_id('borrowers')),
+            'Enter Book ID(s)': ' '.join(str(book_id) for book_id in bench.available_books(3))}
+
+
+def loans_to_return(bench):
+    from lib.db.models import session
+    from lib.db.circulation import check_out_many
+    loans = check_out_many(session, bench.random_id('borrowers'), bench.available_books(3))
+    return {'Enter Loan ID(s)': ' '.join(str(loan_id) for book_id, loan_id, error in loans if loan_id)}
+
+
+OPERATIONS = [
+    ('list_all_authors', next_page),
+    ('list_all_genres', nothing),
+    ('list_all_books', next_page),
+    ('list_all_borrowers', next_page),
+    ('list_all_loans', next_page),
+    ('add_author', new_author),
+    ('add_book', new_book),
+    ('add_borrower', new_borrower),
+    ('delete_author', author_to_delete),
+    ('delete_book', book_to_delete),
+    ('delete_borrower', borrower_to_delete),
+    ('find_book_by_title', title_words),
+    ('find_borrower_by_phone', borrower_phone),
+    ('fuzzy_find', misspelt_words),
+    ('borrow_book', books_to_borrow),
+    ('return_book', loans_to_return),
+    ('list_overdue_loans', nothing),
+    ('show_report:most-borrowed', nothing),
+    ('show_report:busiest-borrowers', nothing),
+    ('show_report:genres-by-month', nothing),
+    ('show_report:loan-duration', nothing),
+    ('show_cache_stats', nothing),
+]
+
+
+class Answers:
+    """Stands in for input(): answers each prompt by the first prefix it starts with, Enter otherwise."""
+
+    def __init__(self, answers):
+        self.answers = {prefix: list(answer) if isinstance(answer, list) else answer for prefix, answer in answers.items()}
+
+    def __call__(self, prompt=''):
+        for prefix, answer in self.answers.items():
+            if prompt.startswith(prefix):
+                if isinstance(answer, list):
+                    return answer.pop(0) if answer else ''
+                return answer
+        return ''
+
+
+class Bench:
+    """State shared by the prepare functions: the scale's row counts and a seeded random generator."""
+
+    def __init__(self, counts, seed):
+        self.counts = counts
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.started = int(time.time()) # keeps the names of reruns against a --cache-dir copy apart
+        self.number = 0
+
+    def start(self, operation):
+        """Reseeds the generator for an operation, so it gets the same inputs whichever operations run before it."""
+        self.random = random.Random(f"{self.seed}:{operation}")
+
+    def next_number(self):
+        """A number for unique names, phone numbers and titles."""
+        self.number += 1
+        return f"{self.started}-{self.number}"
+
+    def random_id(self, table):
+        return self.random.randint(1, self.counts[table])
+
+    def available_books(self, count):
+        """count random books that are on the shelf."""
+        from lib.db.models import Book, session
+        candidates = [self.random_id('books') for _ in range(count * 10)]
+        query = session.query(Book.id).filter(Book.id.in_(candidates), Book.current_loan_id.is_(None)).limit(count)
+        return [book.id for book in query]
+
+
+def percentile(samples, fraction):
+    """The nearest-rank percentile of samples (fraction 0.5 for the median)."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def use_database(path):
+    """Points this process's database settings at path; call before the engine is first used."""
+    os.environ['LIBMATE_DATABASE_URL'] = f"sqlite:///{path}"
+
+
+def seed_scale(counts, path, seed):
+    """Seeds a database at path with counts rows; returns the seconds it took. Runs in a process of its own."""
+    use_database(path)
+    from lib.db.models import engine
+    from lib.db.seed import seed_database
+    started = time.perf_counter()
+    seed_database(counts, seed)
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)") # everything in the .db file, ready to copy
+    engine.dispose()
+    return time.perf_counter() - started
+
+
+def run_scale(counts, path, operations, iterations, warmup, seed):
+    """Benchmarks operations against the database at path. Runs in a process of its own.
+
+    Each operation is called warmup times untimed, then iterations times timed (session
+    cleanup included, as in the menu loop), then once more under tracemalloc for its peak
+    memory, which is kept out of the timings. Returns {'operations': {name: measurements}, 'peak_rss_mib': ...}.
+    """
+    use_database(path)
+    from sqlalchemy import event
+    from lib import cli
+    from lib.db.models import engine, session
+
+    queries = [0]
+    event.listen(engine, 'before_cursor_execute', lambda *args: queries.__setitem__(0, queries[0] + 1))
+    bench = Bench(counts, seed)
+    results = {}
+    with open(os.devnull, 'w') as devnull:
+        for name in operations:
+            function_name, _, argument = name.partition(':')
+            function = getattr(cli, function_name)
+            call = (lambda: function(argument)) if argument else function
+            prepare = dict(OPERATIONS)[name]
+            bench.start(name)
+            timings, query_counts = [], []
+            for run in range(warmup + iterations + 1):
+                with contextlib.redirect_stdout(devnull):
+                    answers = prepare(bench)
+                    session.remove()
+                    cli.input = Answers(answers)
+                    measure_memory = run == warmup + iterations
+                    if measure_memory:
+                        tracemalloc.start()
+                    queries[0] = 0
+                    started = time.perf_counter()
+                    try:
+                        call()
+                    finally:
+                        session.remove()
+                    elapsed = time.perf_counter() - started
+                if measure_memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                elif run >= warmup:
+                    timings.append(elapsed * 1000)
+                    query_counts.append(queries[0])
+            results[name] = {
+                'p50_ms': round(percentile(timings, 0.5), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+                'max_ms': round(max(timings), 3),
+                'queries': percentile(query_counts, 0.5),
+                'peak_memory_kib': round(peak / 1024),
+            }
+            print(f"  {name}: p50 {results[name]['p50_ms']:.1f} ms, p95 {results[name]['p95_ms']:.1f} ms, "
+                  f"{results[name]['queries']} queries, peak {results[name]['peak_memory_kib']:,} KiB")
+    engine.dispose()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'operations': results, 'peak_rss_mib': round(peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)}
+
+
+def schema_fingerprint():
+    """A short hash of the tables, columns, indexes and foreign keys, so a cached database from an older schema isn't reused."""
+    from lib.db.models import Base
+    layout = [(table.name, [(column.name, str(column.type)) for column in table.columns], sorted(index.name for index in table.indexes),
+               sorted((key.parent.name, key.target_fullname, key.ondelete) for key in table.foreign_keys))
+              for table in Base.metadata.sorted_tables]
+    return hashlib.sha1(repr(layout).encode()).hexdigest()[:10]
+
+
+def in_new_process(function, *args):
+    """Calls function(*args) in a freshly spawned interpreter and returns its result."""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def benchmark(scales, operations, iterations, warmup, seed, cache_dir=None):
+    """Seeds (or reuses) a database per scale and benchmarks the operations on it; returns the results."""
+    import sqlalchemy
+    import sqlite3
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'iterations': iterations,
+        'seed': seed,
+        'scales': {},
+    }
+    fingerprint = schema_fingerprint()
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            counts = SCALES[scale]
+            print(f"\n[{scale}] {', '.join(f'{number:,} {table}' for table, number in counts.items())}")
+            path = os.path.join(tmp, f"{scale}.db")
+            seed_seconds = None
+            if cache_dir:
+                cached = os.path.join(cache_dir, f"libmate-{scale}-seed{seed}-{fingerprint}.db")
+                if not os.path.exists(cached):
+                    seed_seconds = in_new_process(seed_scale, counts, cached, seed)
+                shutil.copyfile(cached, path) # the benchmark writes to a copy, so the cached database stays as seeded
+            else:
+                seed_seconds = in_new_process(seed_scale, counts, path, seed)
+            scale_results = in_new_process(run_scale, counts, path, operations, iterations, warmup, seed)
+            results['scales'][scale] = dict(counts=counts, seed_seconds=seed_seconds and round(seed_seconds, 1), **scale_results)
+            print(f"  peak RSS {scale_results['peak_rss_mib']} MiB")
+    return results
+
+
+def compare_results(results, baseline, tolerance, slack_ms):
+    """Returns a line for every regression against the baseline.
+
+    An operation regresses when its p95 latency or peak memory grows by more than
+    tolerance (a fraction; the latency also gets slack_ms of leeway for noise on fast
+    operations), or when it runs more queries than it did.
+    """
+    regressions = []
+    for scale, scale_results in results['scales'].items():
+        before = baseline.get('scales', {}).get(scale)
+        if not before:
+            continue
+        for name, now in scale_results['operations'].items():
+            then = before['operations'].get(name)
+            if not then:
+                continue
+            if now['p95_ms'] > then['p95_ms'] * (1 + tolerance) + slack_ms:
+                regressions.append(f"[{scale}] {name}: p95 {then['p95_ms']:.1f} -> {now['p95_ms']:.1f} ms")
+            if now['queries'] > then['queries']:
+                regressions.append(f"[{scale}] {name}: {then['queries']} -> {now['queries']} queries")
+            if now['peak_memory_kib'] > then['peak_memory_kib'] * (1 + tolerance) + 64:
+                regressions.append(f"[{scale}] {name}: peak memory {then['peak_memory_kib']:,} -> {now['peak_memory_kib']:,} KiB")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the CLI's operations against seeded databases at several scales.")
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small'], help="scales to run (default small)")
+    parser.add_argument('--operations', nargs='+', choices=[name for name, prepare in OPERATIONS], metavar='OPERATION',
+                        default=[name for name, prepare in OPERATIONS], help="operations to time (default all)")
+    parser.add_argument('--iterations', type=int, default=20, help="timed calls per operation")
+    parser.add_argument('--warmup', type=int, default=2, help="untimed calls per operation before timing")
+    parser.add_argument('--seed', type=int, default=42, help="random seed for the data and the operations")
+    parser.add_argument('--cache-dir', help="keep seeded databases here and reuse them (seeding the large scale takes a while)")
+    parser.add_argument('--output', default='benchmark-results.json', help="results file (default benchmark-results.json)")
+    parser.add_argument('--baseline', help="results file to compare against; any regression exits with status 1")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed growth in p95 latency and peak memory (default 0.25 = 25%%)")
+    parser.add_argument('--slack-ms', type=float, default=1.0, help="extra p95 leeway in ms, for noise on fast operations")
+    args = parser.parse_args()
+    if args.iterations < 1:
+        parser.error("--iterations must be at least 1")
+    if args.cache_dir:
+        os.makedirs(args.cache_dir, exist_ok=True)
+
+    results = benchmark(args.scales, args.operations, args.iterations, args.warmup, args.seed, args.cache_dir)
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(results, output, indent=2)
+    print(f"\nResults written to {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file), args.tolerance, args.slack_ms)
+        if regressions:
+            print(f"\nREGRESSIONS against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}.")
@@ -0,0 +1,24 @@
+from lib.db.models import Author, Genre, Book
+
+
+def catalogue_query(session):
+    """Builds the catalogue listing query.
+
+    Every row is (id, title, published_year, author_name, genre_name, open_loan_id)
+    and comes back from a single statement: author and genre are joined in and the
+    open loan is read from the maintained Book.current_loan_id, so listing N books
+    costs one round trip instead of 3N+1.
+    """
+    return (
+        session.query(
+            Book.id,
+            Book.title,
+            Book.published_year,
+            Author.name.label('author_name'),
+            Genre.name.label('genre_name'),
+            Book.current_loan_id.label('open_loan_id'),
+        )
+        .outerjoin(Author, Book.author_id == Author.id)
+        .outerjoin(Genre, Book.genre_id == Genre.id)
+        .order_by(Book.id)
+    )
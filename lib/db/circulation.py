@@ -0,0 +1,358 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import datetime
+import random
+import time
+
+from sqlalchemy import select, insert, update, bindparam, func
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from lib.db.models import Book, Borrower, Loan, session
+from lib.db.stats import record_loan, record_return, record_loans, record_returns
+from lib.db.refcache import genre_row
+
+
+# how often, and how patiently, a write is retried when another desk holds the lock
+BUSY_RETRIES = 5
+BUSY_BACKOFF_SECONDS = 0.05
+DEFAULT_LOAN_PERIOD_DAYS = 21 # for genres without a loan period of their own
+
+
+class CirculationError(Exception):
+    """Raised when a book can't be lent or returned."""
+
+
+def derived_open_loan_id():
+    """Correlated subquery giving a book's outstanding loan id as recorded in the loans table.
+
+    This is the source of truth that Book.current_loan_id is maintained from; it probes
+    the partial ix_loans_open_book_id index once per book.
+    """
+    return (
+        select(func.max(Loan.id))
+        .where(Loan.book_id == Book.id, Loan.return_date == None) # outstanding loans only
+        .correlate(Book)
+        .scalar_subquery()
+    )
+
+
+def loan_period_days(session, genre_id):
+    """How many days a book of the given genre may be kept."""
+    genre = genre_row(session, genre_id)
+    return (genre and genre.loan_period_days) or DEFAULT_LOAN_PERIOD_DAYS
+
+
+def is_database_busy(error):
+    """True when SQLite gave up waiting for another writer's lock."""
+    return 'database is locked' in str(error.orig) or 'database is busy' in str(error.orig)
+
+
+def run_write(session, work, attempts=BUSY_RETRIES):
+    """Runs work() in a write transaction and commits it, retrying when the database stays busy.
+
+    The transaction starts with BEGIN IMMEDIATE (see create_libmate_engine), so a busy error
+    can only happen before anything was written and the whole unit of work is safe to rerun.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            result = work()
+            session.commit()
+            return result
+        except OperationalError as e:
+            session.rollback()
+            if attempt == attempts or not is_database_busy(e):
+                raise
+            time.sleep(BUSY_BACKOFF_SECONDS * attempt * random.uniform(0.5, 1.5)) # jittered backoff
+        except Exception:
+            session.rollback()
+            raise
+
+
+def prepare_loan(session, borrower_id, book_id, loan_date=None):
+    """Checks a book can be lent and works out its due date, outside any write transaction.
+
+    Returns lend(), which makes the loan in the session's transaction without committing:
+    inserts the loan, marks the book as on loan and counts the loan in the statistics tables.
+    """
+    book = session.get(Book, book_id)
+    if not book:
+        raise CirculationError(f"Book with ID {book_id} not found.")
+    if book.current_loan_id is not None: # fast path, the database has the final say below
+        raise CirculationError(f"Book '{book.title}' is currently on loan (Loan ID: {book.current_loan_id}).")
+    title, genre_id = book.title, book.genre_id
+    loan_date = loan_date or datetime.date.today()
+    due_date = loan_date + datetime.timedelta(days=loan_period_days(session, book.genre_id))
+
+    def lend():
+        new_loan = Loan(
+            borrower_id=borrower_id,
+            book_id=book_id,
+            loan_date=loan_date,
+            due_date=due_date,
+            return_date=None
+        )
+        session.add(new_loan)
+        try:
+            session.flush() # BEGIN IMMEDIATE + INSERT, assigns new_loan.id
+        except IntegrityError:
+            raise CirculationError(f"Book '{title}' is currently on loan.")
+        claimed = session.query(Book).filter(
+            Book.id == book_id,
+            Book.current_loan_id == None
+        ).update({Book.current_loan_id: new_loan.id}, synchronize_session='fetch')
+        if not claimed:
+            raise CirculationError(f"Book '{title}' is currently on loan.")
+        record_loan(session.connection(), book_id, borrower_id, genre_id, loan_date)
+        return new_loan
+    return lend
+
+
+def check_out(session, borrower_id, book_id, loan_date=None):
+    """Lends a book: inserts the loan, due back after its genre's loan period, marks the
+    book as on loan and counts the loan in the statistics tables in one transaction.
+
+    The check and the insert are enforced by the database rather than a prior SELECT:
+    the unique partial index ix_loans_open_book_id rejects a second open loan and the
+    book is only claimed if its current_loan_id is still NULL, so two desks racing for
+    the same copy can't both succeed.
+    """
+    return run_write(session, prepare_loan(session, borrower_id, book_id, loan_date))
+
+
+def prepare_return(session, loan, return_date=None):
+    """Checks a loan can be returned, outside any write transaction.
+
+    Returns give_back(), which closes the loan in the session's transaction without
+    committing: stamps the return date, frees the book and counts the return.
+    """
+    if loan.return_date:
+        raise CirculationError(f"Loan ID {loan.id} has already been returned on {loan.return_date}.")
+    loan_id, book_id, loan_date = loan.id, loan.book_id, loan.loan_date
+    genre_id = session.query(Book.genre_id).filter(Book.id == book_id).scalar()
+    return_date = return_date or datetime.date.today()
+
+    def give_back():
+        closed = session.query(Loan).filter(
+            Loan.id == loan_id,
+            Loan.return_date == None
+        ).update({Loan.return_date: return_date}, synchronize_session='fetch')
+        if not closed:
+            raise CirculationError(f"Loan ID {loan_id} has already been returned.")
+        session.query(Book).filter(
+            Book.id == book_id,
+            Book.current_loan_id == loan_id
+        ).update({Book.current_loan_id: None}, synchronize_session='fetch')
+        record_return(session.connection(), book_id, genre_id, loan_date, return_date)
+        return loan
+    return give_back
+
+
+def check_in(session, loan, return_date=None):
+    """Returns a loaned book: stamps the return date, frees the book and counts the return
+    in the statistics tables in one transaction.
+
+    The loan is only closed if it is still open, so a second desk returning the same
+    loan gets an error instead of overwriting the first return date.
+    """
+    return run_write(session, prepare_return(session, loan, return_date))
+
+
+# Several books at once: one query checks the whole set and one transaction writes it
+
+def books_query(session, book_ids):
+    """(id, title, genre_id, current_loan_id) of the given books: one primary key probe each."""
+    return session.query(Book.id, Book.title, Book.genre_id, Book.current_loan_id).filter(Book.id.in_(book_ids))
+
+
+def loans_query(session, loan_ids):
+    """(id, book_id, loan_date, return_date, genre_id) of the given loans."""
+    return (
+        session.query(Loan.id, Loan.book_id, Loan.loan_date, Loan.return_date, Book.genre_id)
+        .outerjoin(Book, Book.id == Loan.book_id)
+        .filter(Loan.id.in_(loan_ids))
+    )
+
+
+def prepare_loans(session, borrower_id, book_ids, loan_date=None):
+    """Checks which of a set of books can be lent to a borrower, with one query for the lot.
+
+    Returns (errors, lend_all): errors maps each book that can't be lent to the reason,
+    and lend_all() lends the rest in the session's transaction without committing (one
+    executemany inserts the loans, another claims the books) and returns {book_id: loan_id}.
+    If another desk lends one of the books in between, lend_all() raises IntegrityError
+    or CirculationError and the set has to be checked again.
+    """
+    if session.get(Borrower, borrower_id) is None:
+        return {book_id: f"Borrower with ID {borrower_id} not found." for book_id in book_ids}, lambda: {}
+    books = {book.id: book for book in books_query(session, book_ids)}
+    loan_date = loan_date or datetime.date.today()
+    errors, lendable = {}, []
+    for book_id in dict.fromkeys(book_ids): # each book once
+        book = books.get(book_id)
+        if book is None:
+            errors[book_id] = f"Book with ID {book_id} not found."
+        elif book.current_loan_id is not None:
+            errors[book_id] = f"Book '{book.title}' is currently on loan (Loan ID: {book.current_loan_id})."
+        else:
+            lendable.append(book)
+
+    def lend_all():
+        if not lendable:
+            return {}
+        new_loans = [{
+            'borrower_id': borrower_id,
+            'book_id': book.id,
+            'loan_date': loan_date,
+            'due_date': loan_date + datetime.timedelta(days=loan_period_days(session, book.genre_id)),
+            'return_date': None,
+        } for book in lendable]
+        connection = session.connection()
+        loan_ids = dict(connection.execute(insert(Loan.__table__).returning(Loan.book_id, Loan.id), new_loans).all())
+        claimed = connection.execute(
+            update(Book.__table__)
+            .where(Book.id == bindparam('claimed_book_id'), Book.current_loan_id == None)
+            .values(current_loan_id=bindparam('claimed_loan_id')),
+            [{'claimed_book_id': book_id, 'claimed_loan_id': loan_id} for book_id, loan_id in loan_ids.items()]
+        ).rowcount
+        if claimed != len(loan_ids):
+            raise CirculationError("A book was lent by another desk.")
+        record_loans(connection, [(book.id, borrower_id, book.genre_id, loan_date) for book in lendable])
+        return loan_ids
+    return errors, lend_all
+
+
+def prepare_returns(session, loan_ids, return_date=None):
+    """Checks which of a set of loans can be returned, with one query for the lot.
+
+    Returns (errors, give_back_all) like prepare_loans; give_back_all() closes the open
+    loans and frees their books with one UPDATE each, and returns {loan_id: book_id}.
+    """
+    loans = {loan.id: loan for loan in loans_query(session, loan_ids)}
+    return_date = return_date or datetime.date.today()
+    errors, returnable = {}, []
+    for loan_id in dict.fromkeys(loan_ids):
+        loan = loans.get(loan_id)
+        if loan is None:
+            errors[loan_id] = f"Loan with ID {loan_id} not found."
+        elif loan.return_date:
+            errors[loan_id] = f"Loan ID {loan_id} has already been returned on {loan.return_date}."
+        else:
+            returnable.append(loan)
+
+    def give_back_all():
+        if not returnable:
+            return {}
+        open_ids = [loan.id for loan in returnable]
+        connection = session.connection()
+        closed = connection.execute(
+            update(Loan.__table__).where(Loan.id.in_(open_ids), Loan.return_date == None).values(return_date=return_date)
+        ).rowcount
+        if closed != len(open_ids):
+            raise CirculationError("A loan was returned by another desk.")
+        connection.execute(
+            update(Book.__table__)
+            .where(Book.id.in_([loan.book_id for loan in returnable]), Book.current_loan_id.in_(open_ids))
+            .values(current_loan_id=None)
+        )
+        record_returns(connection, [(loan.book_id, loan.genre_id, loan.loan_date, return_date) for loan in returnable])
+        return {loan.id: loan.book_id for loan in returnable}
+    return errors, give_back_all
+
+
+def run_set(session, ids, prepare):
+    """Runs the write from prepare() (prepare_loans/prepare_returns) in its own transaction and
+    returns (id, other id, error) per id, in order. A write that loses a race with another
+    desk is checked and tried again, once."""
+    for attempt in (1, 2):
+        errors, write = prepare()
+        try:
+            done = run_write(session, write)
+            break
+        except (IntegrityError, CirculationError):
+            if attempt == 2:
+                raise
+    return set_results(ids, done, errors)
+
+
+def set_results(ids, done, errors):
+    """(id, done[id], errors[id]) per id, in order; an id listed again gets an error of its own."""
+    results, seen = [], set()
+    for item_id in ids:
+        if item_id in seen:
+            results.append((item_id, None, "Listed more than once."))
+        else:
+            seen.add(item_id)
+            results.append((item_id, done.get(item_id), errors.get(item_id)))
+    return results
+
+
+def check_out_many(session, borrower_id, book_ids, loan_date=None):
+    """Lends several books to one borrower in one transaction (one commit).
+
+    Returns (book_id, loan_id, error) per requested book, in order: the new loan's id for
+    a book that was lent, or why it wasn't.
+    """
+    return run_set(session, book_ids, lambda: prepare_loans(session, borrower_id, book_ids, loan_date))
+
+
+def check_in_many(session, loan_ids, return_date=None):
+    """Returns several loans in one transaction (one commit).
+
+    Returns (loan_id, book_id, error) per requested loan, in order.
+    """
+    return run_set(session, loan_ids, lambda: prepare_returns(session, loan_ids, return_date))
+
+
+def release_borrower_loans(session, borrower_ids):
+    """Frees every book currently lent to a set of borrowers, ahead of deleting their loans.
+
+    The books are found through their open loans (by primary key), so it doesn't scan
+    books.current_loan_id. Doesn't commit; the caller commits together with the delete.
+    """
+    open_loans = select(Loan.id, Loan.book_id).where(Loan.borrower_id.in_(borrower_ids), Loan.return_date == None).subquery()
+    return session.connection().execute(
+        update(Book.__table__)
+        .where(Book.id.in_(select(open_loans.c.book_id)), Book.current_loan_id.in_(select(open_loans.c.id)))
+        .values(current_loan_id=None)
+    ).rowcount
+
+
+def verify_availability(session):
+    """Returns (book_id, stored_loan_id, expected_loan_id) for every book whose
+    current_loan_id disagrees with the loans table."""
+    expected = derived_open_loan_id()
+    return session.query(
+        Book.id, Book.current_loan_id, expected.label('expected_loan_id')
+    ).filter(Book.current_loan_id.is_distinct_from(expected)).order_by(Book.id).all()
+
+
+def repair_availability(session):
+    """Rebuilds Book.current_loan_id from the loans history in one UPDATE. Returns the rows fixed."""
+    expected = derived_open_loan_id()
+    fixed = run_write(session, lambda: session.query(Book).filter(
+        Book.current_loan_id.is_distinct_from(expected)
+    ).update({Book.current_loan_id: expected}, synchronize_session=False))
+    session.expire_all() # loaded books may hold the old value
+    return fixed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Verify (and optionally repair) the book availability state.")
+    parser.add_argument('--repair', action='store_true', help="rebuild current_loan_id from the loans table")
+    args = parser.parse_args()
+
+    mismatches = verify_availability(session)
+    for book_id, stored, expected in mismatches:
+        print(f"Book ID: {book_id}, Stored Loan ID: {stored}, Expected Loan ID: {expected}")
+
+    if not mismatches:
+        print("Book availability is consistent with the loans table.")
+    elif args.repair:
+        print(f"Repaired {repair_availability(session)} book(s).")
+    else:
+        print(f"{len(mismatches)} book(s) out of step. Run again with --repair to fix them.")
+        session.close()
+        sys.exit(1)
+    session.close()
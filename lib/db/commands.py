@@ -0,0 +1,91 @@
+import argparse
+import datetime
+import sys
+
+# Only the command line is parsed here; the database modules are imported once a command
+# actually runs, so --help or a mistyped option answers without loading SQLAlchemy.
+
+BATCH_GROUP_SIZE = 200 # batch operations per transaction
+
+
+def iso_date(text):
+    return datetime.date.fromisoformat(text)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cli.py',
+        description="LibMate-Manager. With no command, runs the interactive menu; commands print one JSON line per operation."
+    )
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    command = commands.add_parser('borrow', help="lend a book")
+    command.add_argument('--borrower', type=int, required=True, help="borrower ID")
+    command.add_argument('--book', type=int, nargs='+', required=True, help="book ID(s); several are lent in one transaction")
+    command.add_argument('--date', type=iso_date, help="loan date, YYYY-MM-DD (default today)")
+
+    command = commands.add_parser('return', help="return a book, by loan or by book")
+    which = command.add_mutually_exclusive_group(required=True)
+    which.add_argument('--loan', type=int, nargs='+', help="loan ID(s)")
+    which.add_argument('--book', type=int, nargs='+', help="book ID(s) (returns their outstanding loans)")
+    command.add_argument('--date', type=iso_date, help="return date, YYYY-MM-DD (default today)")
+
+    command = commands.add_parser('add-author', help="add an author")
+    command.add_argument('--name', required=True)
+
+    command = commands.add_parser('add-borrower', help="add a borrower")
+    command.add_argument('--name', required=True)
+    command.add_argument('--phone', required=True, help="phone number (must be unique)")
+
+    command = commands.add_parser('add-book', help="add a book")
+    command.add_argument('--title', required=True)
+    command.add_argument('--year', type=int, required=True, help="published year")
+    command.add_argument('--author', type=int, required=True, help="author ID")
+    command.add_argument('--genre', type=int, required=True, help="genre ID")
+
+    command = commands.add_parser('delete-author', help="delete authors with their books (an author with a book on loan is kept)")
+    command.add_argument('--author', type=int, nargs='+', required=True, help="author ID(s); several are deleted in one transaction")
+
+    command = commands.add_parser('delete-book', help="delete books with their loan history (a book on loan is kept)")
+    command.add_argument('--book', type=int, nargs='+', required=True, help="book ID(s)")
+
+    command = commands.add_parser('delete-borrower', help="delete borrowers with their loans (the books they have go back on the shelf)")
+    command.add_argument('--borrower', type=int, nargs='+', required=True, help="borrower ID(s)")
+
+    command = commands.add_parser('batch', help="run a JSON-lines file of operations, e.g. {\"op\": \"borrow\", \"borrower\": 12, \"book\": 99}")
+    command.add_argument('file', help="batch file, or - for standard input")
+    command.add_argument('--group-size', type=int, default=BATCH_GROUP_SIZE, help=f"operations per transaction (default {BATCH_GROUP_SIZE})")
+    return parser
+
+
+def run_command_line(argv):
+    """Runs the command in argv; returns the exit status (1 if any operation failed).
+    Returns None when no command was given, for the interactive menu to run instead."""
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        return None
+    from lib.db.models import session
+    from lib.db import operations
+    from lib.db.profiling import start_operation, finish_operation
+    start_operation(args.command) # with LIBMATE_PROFILE=1, its SQL is summarised on standard error
+    try:
+        return run_command(session, operations, args)
+    finally:
+        finish_operation()
+
+
+def run_command(session, operations, args):
+    """Runs a parsed command; returns the exit status."""
+    if args.command == 'batch':
+        if args.file == '-':
+            return 1 if operations.run_batch(session, sys.stdin, args.group_size) else 0
+        with open(args.file, encoding='utf-8') as batch_file:
+            return 1 if operations.run_batch(session, batch_file, args.group_size) else 0
+
+    record = {field: value for field, value in vars(args).items() if field != 'command' and value is not None}
+    for field, value in record.items():
+        if isinstance(value, list) and len(value) == 1:
+            record[field] = value[0] # one book or loan is reported as before, without items
+    record['op'] = args.command
+    [result] = operations.run_operations(session, [(None, record)])
+    return operations.write_result(result, sys.stdout)
@@ -0,0 +1,59 @@
+import os
+import configparser
+
+# Database settings and their defaults. Each one can be set in the [database] section of
+# the config file (libmate.ini in the working directory, or the file named by LIBMATE_CONFIG)
+# and overridden by an environment variable, e.g. LIBMATE_DATABASE_URL or LIBMATE_BUSY_TIMEOUT.
+DEFAULT_SETTINGS = {
+    'database_url': 'sqlite:///libmate.db',
+    # SQLite connection pragmas, applied every time a connection is opened
+    'journal_mode': 'WAL',           # readers don't block the writer and vice versa
+    'synchronous': 'NORMAL',         # safe with WAL, one fsync per checkpoint instead of per commit
+    'busy_timeout': '10000',         # milliseconds to wait for another writer's lock
+    'cache_size': '-65536',          # negative means KiB, so 64 MiB of page cache per connection
+    'mmap_size': '268435456',        # 256 MiB memory-mapped I/O
+    'foreign_keys': 'ON',
+    # connection pool (file databases and server dialects such as PostgreSQL)
+    'pool_size': '5',
+    'max_overflow': '10',
+    'pool_timeout': '30',
+    'echo': 'false',
+    # in-process cache of the genres and authors (lib/db/refcache.py)
+    'reference_cache_size': '256',   # most entries kept; the least recently used go first
+    'reference_cache_ttl': '300',    # seconds an entry is trusted, bounding staleness from other processes' writes
+    # SQL profiling (lib/db/profiling.py): per-operation statement summaries on standard error
+    'profile': 'false',
+    'slow_query_ms': '100',          # statements at least this slow are printed with their query plan
+    'n_plus_one_threshold': '10',    # a SELECT repeated more often than this in one operation is flagged
+}
+
+CONFIG_FILE = 'libmate.ini'
+CONFIG_SECTION = 'database'
+
+
+def config_file_path():
+    """Returns the config file to read, from LIBMATE_CONFIG or the default libmate.ini."""
+    return os.environ.get('LIBMATE_CONFIG', CONFIG_FILE)
+
+
+def load_settings(path=None):
+    """Builds the database settings: defaults, then the config file, then LIBMATE_* environment variables."""
+    settings = dict(DEFAULT_SETTINGS)
+
+    parser = configparser.ConfigParser()
+    parser.read(path or config_file_path()) # a missing file is simply skipped
+    if parser.has_section(CONFIG_SECTION):
+        for key, value in parser.items(CONFIG_SECTION):
+            if key in settings:
+                settings[key] = value
+
+    for key in settings:
+        env_value = os.environ.get(f"LIBMATE_{key.upper()}")
+        if env_value is not None:
+            settings[key] = env_value
+    return settings
+
+
+def setting_as_bool(value):
+    """Reads 'true'/'yes'/'on'/'1' (any case) as True."""
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
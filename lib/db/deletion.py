@@ -0,0 +1,137 @@
+from sqlalchemy import select, delete, func
+
+from lib.db.models import Author, Book, Borrower, Loan, ArchivedLoan
+from lib.db.circulation import CirculationError, run_set, books_query, release_borrower_loans
+from lib.db.fuzzy import remove_terms
+from lib.db.stats import uncount_loans
+from lib.db.refcache import reference_cache
+
+# Set-based deletes. The ORM cascades (Author.books, Borrower.loans) load every child row
+# and delete it with a statement of its own; these delete a whole set of authors, books or
+# borrowers, children included, with a few DELETE ... WHERE ... IN statements. Bulk deletes
+# don't fire the ORM events, so they keep the loan statistics, the fuzzy index, book
+# availability and the reference cache up to date themselves (the full-text search index
+# follows the books table through its triggers).
+#
+# Like lending and returning several books, each set is checked with one query, the rows
+# that can go are deleted in one transaction, and the rest are reported with the reason.
+
+
+def delete_books_where(session, condition):
+    """Deletes the books matching condition with all their loans (archived ones too), in the
+    session's transaction without committing. Returns the number of books deleted.
+
+    Raises CirculationError if one of them is on loan by now (another desk lent it after
+    the set was checked); the transaction is then rolled back and the set checked again.
+    """
+    connection = session.connection()
+    book_ids = select(Book.id).where(condition)
+    uncount_loans(session, 'book_id', book_ids) # the first write, so the checks below run under the write lock
+    if connection.execute(select(func.count(Book.id)).where(condition, Book.current_loan_id != None)).scalar():
+        raise CirculationError("A book was lent by another desk.")
+    remove_terms(connection, 'book', connection.execute(book_ids).scalars().all())
+    connection.execute(delete(Loan.__table__).where(Loan.book_id.in_(book_ids)))
+    connection.execute(delete(ArchivedLoan.__table__).where(ArchivedLoan.book_id.in_(book_ids)))
+    return connection.execute(delete(Book.__table__).where(condition)).rowcount
+
+
+def prepare_book_deletes(session, book_ids):
+    """Checks which of a set of books can be deleted (those not on loan), with one query for the lot.
+
+    Returns (errors, delete_all) like circulation.prepare_loans: delete_all() deletes the
+    rest with their loan history and returns {book_id: title}.
+    """
+    books = {book.id: book for book in books_query(session, book_ids)}
+    errors, deletable = {}, {}
+    for book_id in dict.fromkeys(book_ids):
+        book = books.get(book_id)
+        if book is None:
+            errors[book_id] = f"Book with ID {book_id} not found."
+        elif book.current_loan_id is not None:
+            errors[book_id] = f"Book '{book.title}' has an outstanding loan (Loan ID: {book.current_loan_id}). Please return the book first."
+        else:
+            deletable[book_id] = book.title
+
+    def delete_all():
+        if deletable:
+            delete_books_where(session, Book.id.in_(list(deletable)))
+        return deletable
+    return errors, delete_all
+
+
+def prepare_author_deletes(session, author_ids):
+    """Checks which of a set of authors can be deleted: one query finds the authors and
+    one checks all of their books for outstanding loans. An author with a book on loan is kept.
+
+    Returns (errors, delete_all); delete_all() deletes the rest with their books and the
+    books' loan history, and returns {author_id: name}.
+    """
+    authors = dict(session.query(Author.id, Author.name).filter(Author.id.in_(author_ids)))
+    on_loan = dict(
+        session.query(Book.author_id, func.count(Book.id))
+        .filter(Book.author_id.in_(author_ids), Book.current_loan_id != None)
+        .group_by(Book.author_id)
+    )
+    errors, deletable = {}, {}
+    for author_id in dict.fromkeys(author_ids):
+        if author_id not in authors:
+            errors[author_id] = f"Author with ID {author_id} not found."
+        elif author_id in on_loan:
+            errors[author_id] = f"Author '{authors[author_id]}' has {on_loan[author_id]} book(s) on loan. Please return them first."
+        else:
+            deletable[author_id] = authors[author_id]
+
+    def delete_all():
+        if not deletable:
+            return {}
+        delete_books_where(session, Book.author_id.in_(list(deletable)))
+        connection = session.connection()
+        remove_terms(connection, 'author', deletable)
+        connection.execute(delete(Author.__table__).where(Author.id.in_(list(deletable))))
+        reference_cache.invalidate('authors')
+        return deletable
+    return errors, delete_all
+
+
+def prepare_borrower_deletes(session, borrower_ids):
+    """Checks which of a set of borrowers exist, with one query.
+
+    Returns (errors, delete_all); delete_all() puts the books they still have back on the
+    shelf, deletes their loans (archived ones too) and them, and returns {borrower_id: name}.
+    """
+    borrowers = dict(session.query(Borrower.id, Borrower.name).filter(Borrower.id.in_(borrower_ids)))
+    errors = {borrower_id: f"Borrower with ID {borrower_id} not found." for borrower_id in borrower_ids if borrower_id not in borrowers}
+
+    def delete_all():
+        if not borrowers:
+            return {}
+        connection = session.connection()
+        borrower_ids = list(borrowers)
+        uncount_loans(session, 'borrower_id', borrower_ids) # the first write, taking the write lock
+        release_borrower_loans(session, borrower_ids)
+        remove_terms(connection, 'borrower', borrower_ids)
+        connection.execute(delete(Loan.__table__).where(Loan.borrower_id.in_(borrower_ids)))
+        connection.execute(delete(ArchivedLoan.__table__).where(ArchivedLoan.borrower_id.in_(borrower_ids)))
+        connection.execute(delete(Borrower.__table__).where(Borrower.id.in_(borrower_ids)))
+        return borrowers
+    return errors, delete_all
+
+
+def delete_books(session, book_ids):
+    """Deletes a set of books and their loan history in one transaction; a book on loan is kept.
+
+    Returns (book_id, title, error) per requested book, in order.
+    """
+    return run_set(session, book_ids, lambda: prepare_book_deletes(session, book_ids))
+
+
+def delete_authors(session, author_ids):
+    """Deletes a set of authors with their books in one transaction; an author with a book
+    on loan is kept. Returns (author_id, name, error) per requested author, in order."""
+    return run_set(session, author_ids, lambda: prepare_author_deletes(session, author_ids))
+
+
+def delete_borrowers(session, borrower_ids):
+    """Deletes a set of borrowers with their loans in one transaction, putting the books they
+    still have back on the shelf. Returns (borrower_id, name, error) per requested borrower."""
+    return run_set(session, borrower_ids, lambda: prepare_borrower_deletes(session, borrower_ids))
@@ -0,0 +1,109 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import joinedload
+
+from lib.db.models import Author, Book, Borrower, Loan, session, phone_key
+from lib.db.catalogue import catalogue_query
+from lib.db.circulation import derived_open_loan_id, books_query, loans_query
+from lib.db.listing import loan_rows_query
+from lib.db.search import search_query
+from lib.db.overdue import outstanding_loans_query, overdue_query
+from lib.db.analytics import top_counts, window_start
+from lib.db.archive import archive_cutoff
+from lib.db.stats import expected_stats, loans_where_in
+
+
+def query_plan(session, query):
+    """Runs EXPLAIN QUERY PLAN for a query and returns the plan detail lines."""
+    statement = query.statement if hasattr(query, 'statement') else query
+    sql = str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [row[-1] for row in rows] # last column is the human readable detail
+
+
+def cli_queries(session):
+    """The index-backed queries issued by lib/cli.py, with the index each one should use.
+
+    find_book_by_title is checked against the FTS5 book_search index (SQLite only).
+    """
+    # what delete_author/delete_book and delete_borrower take back out of the loan statistics
+    books_loans = expected_stats(session, loans_where_in('book_id', select(Book.id).where(Book.author_id == 1)))[2][2]
+    borrowers_loans = expected_stats(session, loans_where_in('borrower_id', [1, 2, 3]))[1][2]
+    borrower_with_loans = (
+        session.query(Borrower)
+        .options(joinedload(Borrower.loans).joinedload(Loan.book))
+        .filter(Borrower.phone_key == phone_key('(555) 010-0000'))
+    )
+    return [
+        ("list_all_books: catalogue listing",
+         catalogue_query(session), ('INTEGER PRIMARY KEY',)),
+        ("list_all_loans: keyset page",
+         loan_rows_query(session).filter(Loan.id > 100).order_by(Loan.id).limit(25), ('INTEGER PRIMARY KEY',)),
+        ("borrow_book: availability of the chosen books",
+         books_query(session, [1, 2, 3]), ('INTEGER PRIMARY KEY',)),
+        ("return_book: the chosen loans",
+         loans_query(session, [1, 2, 3]), ('INTEGER PRIMARY KEY',)),
+        ("availability verify/repair: open loan per book",
+         session.query(Book.id, derived_open_loan_id()), ('ix_loans_open_book_id',)),
+        ("return_book: outstanding loans",
+         outstanding_loans_query(session), ('ix_loans_return_date_due_date',)),
+        ("list_overdue_loans: overdue sweep",
+         overdue_query(session), ('ix_loans_return_date_due_date (return_date=? AND due_date<?)',)),
+        ("circulation reports: most borrowed books, last 12 months",
+         session.query(top_counts(session, Loan.book_id, window_start(12), 10)), ('COVERING INDEX ix_loans_loan_date_covering',)),
+        ("circulation reports: most borrowed books, last 12 months (archived loans)",
+         session.query(top_counts(session, Loan.book_id, window_start(12), 10)), ('COVERING INDEX ix_loans_archive_loan_date_covering',)),
+        ("circulation reports: most borrowed books, all time",
+         session.query(top_counts(session, Loan.book_id, None, 10)), ('ix_book_loan_stats_loan_count',)),
+        ("find_book_by_title: full-text search",
+         search_query(session, 'kenya'), ('VIRTUAL TABLE INDEX',)),
+        ("find_borrower_by_phone: phone lookup",
+         borrower_with_loans, ('ix_borrowers_phone_key (phone_key=?)',)),
+        ("find_borrower_by_phone: borrower's loans and their books",
+         borrower_with_loans, ('ix_loans_borrower_id',)),
+        ("add_author: duplicate name check",
+         session.query(Author).filter_by(name='Jane Doe'), ('sqlite_autoindex_authors_1',)),
+        ("archive: next batch of returned loans",
+         session.query(Loan.id).filter(Loan.return_date < archive_cutoff(365)).limit(5000), ('ix_loans_return_date_loan_date', 'ix_loans_return_date_due_date')),
+        ("delete_author: author's books",
+         session.query(Book).filter(Book.author_id == 1), ('ix_books_author_id',)),
+        ("delete_author/delete_book: uncounting the books' loans",
+         books_loans, ('ix_loans_book_id',)),
+        ("delete_author/delete_book: uncounting the books' loans (archived loans)",
+         books_loans, ('ix_loans_archive_book_id',)),
+        ("delete_borrower: uncounting the borrowers' loans",
+         borrowers_loans, ('ix_loans_borrower_id',)),
+        ("delete_borrower: uncounting the borrowers' loans (archived loans)",
+         borrowers_loans, ('ix_loans_archive_borrower_id',)),
+    ]
+
+
+def check_query_plans(session):
+    """Returns (name, passed, plan) for every CLI query in cli_queries()."""
+    results = []
+    for name, query, expected_indexes in cli_queries(session):
+        plan = query_plan(session, query)
+        passed = any(index in line for line in plan for index in expected_indexes)
+        results.append((name, passed, plan))
+    return results
+
+
+if __name__ == '__main__':
+    print("--- Checking CLI query plans ---")
+    failures = 0
+    for name, passed, plan in check_query_plans(session):
+        print(f"\n[{'OK' if passed else 'NO INDEX'}] {name}")
+        for line in plan:
+            print(f"    {line}")
+        if not passed:
+            failures += 1
+
+    session.close()
+    if failures:
+        print(f"\n{failures} query(s) are not using their expected index. Did you run 'alembic upgrade head'?")
+        sys.exit(1)
+    print("\nAll CLI queries use their indexes.")
@@ -0,0 +1,161 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import bz2
+import csv
+import datetime
+import gzip
+import json
+import lzma
+import multiprocessing
+from functools import partial
+
+from sqlalchemy import select
+
+from lib.db.models import Author, Genre, Book, Borrower, all_loans, engine, create_libmate_engine
+
+EXPORT_BATCH_SIZE = 10000 # rows fetched and written per chunk
+FORMATS = ('csv', 'jsonl', 'parquet')
+COMPRESSORS = {'gzip': partial(gzip.open, compresslevel=6), 'bz2': bz2.open, 'xz': lzma.open} # gzip's default level 9 is slow for little gain
+EXTENSIONS = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+
+
+def books_export():
+    """Every book with its author and genre names."""
+    return (
+        select(
+            Book.id, Book.title, Book.published_year,
+            Book.author_id, Author.name.label('author_name'),
+            Book.genre_id, Genre.name.label('genre_name'),
+            Book.current_loan_id,
+        )
+        .outerjoin(Author, Book.author_id == Author.id)
+        .outerjoin(Genre, Book.genre_id == Genre.id)
+        .order_by(Book.id)
+    )
+
+
+def loans_export():
+    """Every loan, archived ones included; SQLite merges the two tables' rows in id order."""
+    loans = all_loans.c
+    return select(loans.id, loans.book_id, loans.borrower_id, loans.loan_date, loans.due_date, loans.return_date).order_by(loans.id)
+
+
+def borrowers_export():
+    return select(Borrower.id, Borrower.name, Borrower.phone_number).order_by(Borrower.id)
+
+
+EXPORTS = {'books': books_export, 'loans': loans_export, 'borrowers': borrowers_export}
+
+
+def export_path(directory, table, file_format, compression=None):
+    """Where a table's export goes, e.g. exports/loans.csv.gz."""
+    extension = '.' + file_format
+    if compression and file_format != 'parquet': # parquet compresses inside the file
+        extension += EXTENSIONS[compression]
+    return os.path.join(directory, table + extension)
+
+
+def open_text(path, compression):
+    if compression:
+        return COMPRESSORS[compression](path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_csv(path, compression, columns, chunks):
+    with open_text(path, compression) as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in chunks:
+            writer.writerows(chunk)
+
+
+def json_value(value):
+    return value.isoformat() if isinstance(value, datetime.date) else value
+
+
+def write_jsonl(path, compression, columns, chunks):
+    with open_text(path, compression) as f:
+        for chunk in chunks:
+            f.writelines(
+                json.dumps({column: json_value(value) for column, value in zip(columns, row)}) + '\n'
+                for row in chunk
+            )
+
+
+def write_parquet(path, compression, columns, chunks, column_types):
+    """Writes one Parquet row group per chunk. Needs pyarrow (pip install pyarrow)."""
+    import pyarrow
+    import pyarrow.parquet
+
+    arrow_types = {int: pyarrow.int64(), str: pyarrow.string(), datetime.date: pyarrow.date32()}
+    schema = pyarrow.schema([(column, arrow_types[column_types[column]]) for column in columns])
+    with pyarrow.parquet.ParquetWriter(path, schema, compression=compression or 'snappy') as writer:
+        for chunk in chunks:
+            writer.write_table(pyarrow.Table.from_pydict(dict(zip(columns, zip(*chunk))), schema=schema))
+
+
+def export_table(db_url, table, file_format, directory, compression=None, batch_size=EXPORT_BATCH_SIZE):
+    """Streams one table to a file, batch_size rows at a time. Returns (table, rows written, path).
+
+    Runs on its own read-only engine, so exports of several tables can run in parallel
+    processes alongside the desks; each reads its own consistent snapshot of its table.
+    """
+    export_engine = create_libmate_engine(db_url, read_only=True)
+    query = EXPORTS[table]()
+    columns = [column.name for column in query.selected_columns]
+    column_types = {column.name: column.type.python_type for column in query.selected_columns}
+    path = export_path(directory, table, file_format, compression)
+    written = 0
+    try:
+        with export_engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+
+            def chunks():
+                nonlocal written
+                for partition in result.partitions():
+                    written += len(partition)
+                    yield [tuple(row) for row in partition]
+
+            if file_format == 'csv':
+                write_csv(path, compression, columns, chunks())
+            elif file_format == 'jsonl':
+                write_jsonl(path, compression, columns, chunks())
+            else:
+                write_parquet(path, compression, columns, chunks(), column_types)
+    finally:
+        export_engine.dispose()
+    return table, written, path
+
+
+def export_tables(tables, file_format, directory, compression=None, workers=None, batch_size=EXPORT_BATCH_SIZE):
+    """Exports each of tables to its own file in directory, up to workers tables at a time
+    in separate processes. Returns a list of (table, rows written, path)."""
+    os.makedirs(directory, exist_ok=True)
+    db_url = engine.url.render_as_string(hide_password=False)
+    jobs = [(db_url, table, file_format, directory, compression, batch_size) for table in tables]
+    workers = min(workers or len(jobs), len(jobs))
+    if workers == 1:
+        return [export_table(*job) for job in jobs]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.starmap(export_table, jobs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export books, loans and borrowers to CSV, JSON-lines or Parquet files.")
+    parser.add_argument('tables', nargs='*', help=f"tables to export: {', '.join(sorted(EXPORTS))} (default: all)")
+    parser.add_argument('--format', choices=FORMATS, default='csv', help="file format (parquet needs pyarrow)")
+    parser.add_argument('--compress', choices=sorted(COMPRESSORS), help="compress the files (parquet: gzip only)")
+    parser.add_argument('--output', default='exports', help="directory to write the files to")
+    parser.add_argument('--workers', type=int, help="tables exported at once (default: one process per table)")
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE, help="rows per chunk")
+    args = parser.parse_args()
+
+    unknown = [table for table in args.tables if table not in EXPORTS]
+    if unknown:
+        parser.error(f"can't export {', '.join(unknown)}")
+    if args.format == 'parquet' and args.compress not in (None, 'gzip'):
+        parser.error("parquet files can only be compressed with gzip")
+    for table, written, path in export_tables(args.tables or sorted(EXPORTS), args.format, args.output, args.compress, args.workers, args.batch_size):
+        print(f"Exported {written} {table} to {path}")
@@ -0,0 +1,336 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import re
+from collections import Counter
+
+from sqlalchemy import event, inspect, select, insert, update, delete, func, bindparam
+
+from lib.db.models import Author, Book, Borrower, FuzzyTerm, FuzzyTrigram, FuzzyTrigramStat, session
+
+# what the fuzzy index covers: kind -> (model, name attribute)
+KINDS = {
+    'book': (Book, 'title'),
+    'author': (Author, 'name'),
+    'borrower': (Borrower, 'name'),
+}
+
+FUZZY_LIMIT = 10              # matches returned by default
+SIMILARITY_THRESHOLD = 0.5    # minimum share of the query's trigrams (0..1) a match must have
+SEED_TRIGRAMS = 8             # rarest query trigrams used to collect candidates
+MAX_SEED_POSTINGS = 40000     # most postings read per kind and search
+CANDIDATE_LIMIT = 150         # candidates scored exactly per kind
+REBUILD_BATCH_SIZE = 5000
+IN_LIST_SIZE = 10000          # most values bound in one IN (...) list
+
+terms_table = FuzzyTerm.__table__
+trigrams_table = FuzzyTrigram.__table__
+stats_table = FuzzyTrigramStat.__table__
+
+
+def trigrams(text):
+    """The set of trigrams in text: each word is lower-cased and padded with two leading
+    spaces and one trailing space, so word beginnings weigh more than word endings."""
+    grams = set()
+    for word in re.findall(r"\w+", text.casefold()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(query_grams, grams):
+    """How much of the query a name contains: the share of the query's trigrams it has.
+
+    A typo only costs the trigrams of the misspelled word, however many other words the
+    title has; scored over both whole strings, 'synergi' never came near 'Visionary
+    stable synergy'.
+    """
+    if not query_grams:
+        return 0.0
+    return len(query_grams & grams) / len(query_grams)
+
+
+def jaccard(grams_a, grams_b):
+    """Jaccard similarity of two trigram sets: shared trigrams over all trigrams."""
+    if not grams_a or not grams_b:
+        return 0.0
+    shared = len(grams_a & grams_b)
+    return shared / (len(grams_a) + len(grams_b) - shared)
+
+
+def match_rank(query_grams, match):
+    """Sort key for a (kind, entity_id, text, score) match: its score, then, of names that
+    contain the query equally well, the one closest to it as a whole (the shortest)."""
+    return match[3], jaccard(query_grams, trigrams(match[2]))
+
+
+# Index maintenance
+
+def change_trigram_counts(connection, kind, deltas):
+    """Adds each delta in deltas (trigram -> delta) to that trigram's term count."""
+    if not deltas:
+        return
+    grams = list(deltas)
+    existing = set()
+    for start in range(0, len(grams), IN_LIST_SIZE): # stay well under SQLite's bound-parameter limit
+        existing.update(connection.execute(
+            select(stats_table.c.trigram)
+            .where(stats_table.c.kind == kind, stats_table.c.trigram.in_(grams[start:start + IN_LIST_SIZE]))
+        ).scalars())
+    if existing:
+        connection.execute(
+            update(stats_table)
+            .where(stats_table.c.kind == kind, stats_table.c.trigram == bindparam('gram'))
+            .values(term_count=stats_table.c.term_count + bindparam('delta')),
+            [{'gram': gram, 'delta': deltas[gram]} for gram in existing]
+        )
+    missing = [gram for gram in deltas if gram not in existing and deltas[gram] > 0]
+    if missing:
+        connection.execute(insert(stats_table), [
+            {'kind': kind, 'trigram': gram, 'term_count': deltas[gram]} for gram in missing
+        ])
+
+
+def add_terms(connection, kind, entries):
+    """Indexes a batch of (entity_id, text) names and their trigram postings.
+
+    The whole batch costs a handful of statements, so bulk loads can keep the index up
+    to date as they go.
+    """
+    entries = list(entries)
+    if not entries:
+        return
+    entity_grams = {entity_id: trigrams(text) for entity_id, text in entries}
+    connection.execute(insert(terms_table), [
+        {'kind': kind, 'entity_id': entity_id, 'text': text, 'trigram_count': len(entity_grams[entity_id])}
+        for entity_id, text in entries
+    ])
+    term_ids = connection.execute(
+        select(terms_table.c.entity_id, terms_table.c.id)
+        .where(terms_table.c.kind == kind, terms_table.c.entity_id.in_(entity_grams))
+    ).all()
+    postings, deltas = [], Counter()
+    for entity_id, term_id in term_ids:
+        postings.extend({'kind': kind, 'trigram': gram, 'term_id': term_id} for gram in entity_grams[entity_id])
+        deltas.update(entity_grams[entity_id])
+    if postings:
+        connection.execute(insert(trigrams_table), postings)
+    change_trigram_counts(connection, kind, deltas)
+
+
+def add_term(connection, kind, entity_id, text):
+    """Indexes one name and its trigram postings."""
+    add_terms(connection, kind, [(entity_id, text)])
+
+
+def remove_terms(connection, kind, entity_ids):
+    """Drops a set of names and their trigram postings from the index, if they are there.
+
+    The whole set costs a handful of statements, so bulk deletes can keep the index up
+    to date too.
+    """
+    entity_ids = list(entity_ids)
+    terms = []
+    for start in range(0, len(entity_ids), IN_LIST_SIZE):
+        terms += connection.execute(
+            select(terms_table.c.id, terms_table.c.text)
+            .where(terms_table.c.kind == kind, terms_table.c.entity_id.in_(entity_ids[start:start + IN_LIST_SIZE]))
+        ).all()
+    if not terms:
+        return
+    postings, deltas = [], Counter()
+    for term in terms:
+        grams = trigrams(term.text)
+        postings.extend({'gram': gram, 'posting_term_id': term.id} for gram in grams)
+        deltas.update(grams)
+    if postings:
+        # delete by full primary key so each posting is a direct lookup
+        connection.execute(
+            delete(trigrams_table).where(
+                trigrams_table.c.kind == kind,
+                trigrams_table.c.trigram == bindparam('gram'),
+                trigrams_table.c.term_id == bindparam('posting_term_id')
+            ),
+            postings
+        )
+    term_ids = [term.id for term in terms]
+    for start in range(0, len(term_ids), IN_LIST_SIZE):
+        connection.execute(delete(terms_table).where(terms_table.c.id.in_(term_ids[start:start + IN_LIST_SIZE])))
+    change_trigram_counts(connection, kind, {gram: -count for gram, count in deltas.items()})
+
+
+def remove_term(connection, kind, entity_id):
+    """Drops one name and its trigram postings from the index, if it is there."""
+    remove_terms(connection, kind, [entity_id])
+
+
+def register_index_events(kind, model, attribute):
+    """Keeps the fuzzy index in step with ORM inserts, renames and deletes of one model.
+
+    lib/db/models.py imports this module, so the events are registered wherever the models
+    are used. They're registered once per model, even when this file also runs as a script.
+    """
+    if model.__table__.info.get('fuzzy_index_events'):
+        return
+    model.__table__.info['fuzzy_index_events'] = True
+
+    @event.listens_for(model, 'after_insert')
+    def index_new_row(mapper, connection, target):
+        add_term(connection, kind, target.id, getattr(target, attribute))
+
+    @event.listens_for(model, 'after_update')
+    def reindex_renamed_row(mapper, connection, target):
+        if inspect(target).attrs[attribute].history.has_changes():
+            remove_term(connection, kind, target.id)
+            add_term(connection, kind, target.id, getattr(target, attribute))
+
+    @event.listens_for(model, 'after_delete')
+    def unindex_deleted_row(mapper, connection, target):
+        remove_term(connection, kind, target.id)
+
+
+for index_kind, (index_model, index_attribute) in KINDS.items():
+    register_index_events(index_kind, index_model, index_attribute)
+
+
+def rebuild_fuzzy_index(session, batch_size=REBUILD_BATCH_SIZE):
+    """Rebuilds the whole fuzzy index from the books, authors and borrowers tables.
+
+    Rows are read with yield_per and their postings staged batch_size terms at a time in
+    a temporary table, then copied into fuzzy_trigrams in key order: appending to the
+    clustered index is far cheaper than inserting postings in random trigram order.
+    Returns the number of terms indexed.
+    """
+    connection = session.connection()
+    connection.execute(delete(trigrams_table))
+    connection.execute(delete(stats_table))
+    connection.execute(delete(terms_table))
+    connection.exec_driver_sql("DROP TABLE IF EXISTS temp.fuzzy_postings_load")
+    connection.exec_driver_sql("CREATE TEMP TABLE fuzzy_postings_load (kind TEXT, trigram TEXT, term_id INTEGER)")
+
+    term_id = 0
+    for kind, (model, attribute) in KINDS.items():
+        rows = session.execute(
+            select(model.id, getattr(model, attribute)).order_by(model.id).execution_options(yield_per=batch_size)
+        )
+        for batch in rows.partitions():
+            terms, postings = [], []
+            for entity_id, text in batch:
+                term_id += 1
+                grams = trigrams(text)
+                terms.append({'id': term_id, 'kind': kind, 'entity_id': entity_id, 'text': text, 'trigram_count': len(grams)})
+                postings.extend((kind, gram, term_id) for gram in grams)
+            connection.execute(insert(terms_table), terms)
+            if postings:
+                connection.exec_driver_sql("INSERT INTO fuzzy_postings_load VALUES (?, ?, ?)", postings)
+
+    connection.exec_driver_sql(
+        "INSERT INTO fuzzy_trigrams (kind, trigram, term_id) "
+        "SELECT kind, trigram, term_id FROM fuzzy_postings_load ORDER BY kind, trigram, term_id"
+    )
+    connection.execute(insert(stats_table).from_select(
+        ['kind', 'trigram', 'term_count'],
+        select(trigrams_table.c.kind, trigrams_table.c.trigram, func.count())
+        .group_by(trigrams_table.c.kind, trigrams_table.c.trigram)
+    ))
+    connection.exec_driver_sql("DROP TABLE temp.fuzzy_postings_load")
+    session.commit()
+    return term_id
+
+
+index_checked = False # set once this process has made sure the index isn't missing
+
+
+def ensure_fuzzy_index(session):
+    """Builds the fuzzy index if it's empty while there are titles and names to index, as
+    it is in a database just migrated to the fuzzy tables. Checked once per process;
+    afterwards the ORM events keep the index up to date."""
+    global index_checked
+    if index_checked:
+        return
+    connection = session.connection()
+    if connection.execute(select(terms_table.c.id).limit(1)).first() is None and any(
+        connection.execute(select(model.id).limit(1)).first() for model, attribute in KINDS.values()
+    ):
+        print("Building the fuzzy index (first search since it was created)...")
+        rebuild_fuzzy_index(session)
+    index_checked = True
+
+
+# Searching
+
+def search_kind(connection, kind, query_grams, limit, threshold):
+    """Top matches of one kind as (kind, entity_id, text, score) tuples, best first.
+
+    Candidates come from the posting lists of the rarest query trigrams only, so a search
+    reads a bounded number of postings instead of every row; the candidates are then
+    scored exactly against the whole query.
+    """
+    counts = dict(connection.execute(
+        select(stats_table.c.trigram, stats_table.c.term_count)
+        .where(stats_table.c.kind == kind, stats_table.c.trigram.in_(query_grams), stats_table.c.term_count > 0)
+    ).all())
+    if not counts:
+        return []
+
+    seeds, postings = [], 0
+    for gram in sorted(counts, key=counts.get):
+        if len(seeds) == SEED_TRIGRAMS or (seeds and postings + counts[gram] > MAX_SEED_POSTINGS):
+            break
+        seeds.append(gram)
+        postings += counts[gram]
+
+    # even a query made only of very common trigrams reads at most MAX_SEED_POSTINGS postings
+    seed_postings = (
+        select(trigrams_table.c.term_id)
+        .where(trigrams_table.c.kind == kind, trigrams_table.c.trigram.in_(seeds))
+        .limit(MAX_SEED_POSTINGS)
+        .subquery()
+    )
+    candidate_ids = (
+        select(seed_postings.c.term_id)
+        .group_by(seed_postings.c.term_id)
+        .order_by(func.count().desc())
+        .limit(CANDIDATE_LIMIT)
+    )
+    candidates = connection.execute(
+        select(terms_table.c.entity_id, terms_table.c.text).where(terms_table.c.id.in_(candidate_ids))
+    ).all()
+
+    matches = []
+    for entity_id, text in candidates:
+        score = similarity(query_grams, trigrams(text))
+        if score >= threshold:
+            matches.append((kind, entity_id, text, score))
+    matches.sort(key=lambda match: match_rank(query_grams, match), reverse=True)
+    return matches[:limit]
+
+
+def fuzzy_search(session, text, kinds=tuple(KINDS), limit=FUZZY_LIMIT, threshold=SIMILARITY_THRESHOLD):
+    """Returns up to limit (kind, entity_id, text, score) matches for text across the given kinds, best first."""
+    query_grams = trigrams(text)
+    if not query_grams:
+        return []
+    ensure_fuzzy_index(session)
+    connection = session.connection()
+    matches = []
+    for kind in kinds:
+        matches.extend(search_kind(connection, kind, query_grams, limit, threshold))
+    matches.sort(key=lambda match: match_rank(query_grams, match), reverse=True)
+    return matches[:limit]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search or rebuild the fuzzy title/name index.")
+    parser.add_argument('--rebuild', action='store_true', help="re-index every book, author and borrower")
+    parser.add_argument('text', nargs='?', help="find the closest titles and names to this text")
+    parser.add_argument('--limit', type=int, default=FUZZY_LIMIT, help="most matches to show")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"Indexed {rebuild_fuzzy_index(session)} title(s) and name(s).")
+    if args.text:
+        for kind, entity_id, text, score in fuzzy_search(session, args.text, limit=args.limit):
+            print(f"{kind.title()} ID: {entity_id}, '{text}' (similarity {score:.2f})")
+    session.close()
@@ -0,0 +1,268 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import csv
+import json
+from itertools import islice
+
+from sqlalchemy import select
+
+from lib.db.models import Author, Genre, Book, Borrower, session, upsert, phone_key
+from lib.db.circulation import run_write
+from lib.db.fuzzy import add_terms
+from lib.db.refcache import reference_cache
+
+IMPORT_BATCH_SIZE = 5000   # records per transaction
+LOOKUP_CACHE_SIZE = 100000 # author/genre name -> id entries kept between batches
+
+# what each kind of record needs: kind -> (required fields, optional fields)
+FIELDS = {
+    'authors': (('name',), ()),
+    'genres': (('name',), ()),
+    'books': (('title', 'author', 'genre'), ('published_year',)),
+    'borrowers': (('name', 'phone_number'), ()),
+}
+# the field that must be unique within each kind (borrowers' phone numbers are compared by their digits)
+UNIQUE_FIELDS = {'authors': 'name', 'genres': 'name', 'borrowers': 'phone_key'}
+
+
+class ImportReport:
+    """Counts what an import did and prints each rejected record as it goes."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        print(f"Rejected line {line}: {reason}")
+
+    def __str__(self):
+        return f"{self.inserted} inserted, {self.updated} updated, {self.rejected} rejected"
+
+
+def read_records(path, file_format=None):
+    """Yields (line number, record dict) from a CSV file with a header row or a JSON-lines file.
+
+    The file is read one record at a time, so its size doesn't matter. A JSON line that
+    doesn't parse is yielded as (line number, None) for the caller to reject.
+    """
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+
+
+def clean_record(kind, record):
+    """Returns (values, None) with the record's fields stripped, or (None, reason) when it can't be imported."""
+    if record is None:
+        return None, "not a valid record"
+    required, optional = FIELDS[kind]
+    values = {}
+    for field in required + optional:
+        value = record.get(field)
+        value = str(value).strip() if value is not None else ''
+        if not value and field in required:
+            return None, f"missing {field}"
+        values[field] = value or None
+    if values.get('published_year') is not None:
+        try:
+            values['published_year'] = int(values['published_year'])
+        except ValueError:
+            return None, f"published_year '{values['published_year']}' is not a number"
+    if kind == 'borrowers':
+        values['phone_key'] = phone_key(values['phone_number'])
+        if not values['phone_key']:
+            return None, f"phone_number '{values['phone_number']}' has no digits"
+    return values, None
+
+
+class NameLookup:
+    """Resolves author or genre names to ids, creating the missing ones.
+
+    Resolved names are cached, up to LOOKUP_CACHE_SIZE of them, so the books of a big
+    file cost one query per batch for the names not seen recently rather than one per book.
+    """
+
+    def __init__(self, model, kind):
+        self.model = model
+        self.kind = kind
+        self.ids = {}
+
+    def resolve(self, connection, names):
+        """Returns {name: id} for every name in names."""
+        missing = {name for name in names if name not in self.ids}
+        if missing:
+            if len(self.ids) + len(missing) > LOOKUP_CACHE_SIZE:
+                self.ids.clear()
+            table = self.model.__table__
+            created = connection.execute(
+                upsert(connection)(table).on_conflict_do_nothing(index_elements=['name']).returning(table.c.id, table.c.name),
+                [{'name': name} for name in missing]
+            ).all()
+            if self.kind:
+                add_terms(connection, self.kind, created)
+            if created:
+                reference_cache.invalidate(table.name)
+            self.ids.update(connection.execute(
+                select(table.c.name, table.c.id).where(table.c.name.in_(missing))
+            ).all())
+        return {name: self.ids[name] for name in names}
+
+
+def check_batch(kind, batch, report):
+    """Returns the (line, values) records of a batch that can be imported, rejecting the rest:
+    records with missing or bad fields, and repeats of a unique field within the batch
+    (repeats of rows already in the database are caught when the batch is written)."""
+    valid, seen = [], set()
+    key = UNIQUE_FIELDS.get(kind)
+    for line, record in batch:
+        values, reason = clean_record(kind, record)
+        if reason:
+            report.reject(line, reason)
+        elif key and values[key] in seen:
+            field = 'phone_number' if key == 'phone_key' else key # reported as it was written
+            report.reject(line, f"duplicate {field} '{values[field]}'")
+        else:
+            if key:
+                seen.add(values[key])
+            valid.append((line, values))
+    return valid
+
+
+def import_names(connection, model, kind, records, report):
+    """Inserts authors or genres; a name that already exists is rejected."""
+    table = model.__table__
+    if not records:
+        return
+    inserted = connection.execute(
+        upsert(connection)(table).on_conflict_do_nothing(index_elements=['name']).returning(table.c.id, table.c.name),
+        [values for line, values in records]
+    ).all()
+    if kind:
+        add_terms(connection, kind, inserted)
+    if inserted:
+        reference_cache.invalidate(table.name)
+    report.inserted += len(inserted)
+    inserted_names = {name for _, name in inserted}
+    for line, values in records:
+        if values['name'] not in inserted_names:
+            report.reject(line, f"duplicate {model.__tablename__[:-1]} name '{values['name']}'")
+
+
+def import_borrowers(session, records, report, update=False):
+    """Inserts borrowers keyed by phone number, however it's written (the phone key). An
+    existing phone number is rejected, or with update=True has its borrower's name updated instead."""
+    table = Borrower.__table__
+    if not records:
+        return
+    connection = session.connection()
+    keys = [values['phone_key'] for line, values in records]
+    existing = set(connection.execute(select(table.c.phone_key).where(table.c.phone_key.in_(keys))).scalars())
+
+    new = {}  # phone key -> (line, values) of the first record of the batch with that key
+    lost = [] # (line, values) of the records that can't be inserted
+    for line, values in records:
+        if values['phone_key'] in new:
+            lost.append((line, values)) # an earlier record of the batch has the number
+        elif values['phone_key'] not in existing:
+            new[values['phone_key']] = (line, values)
+    if new:
+        inserted = connection.execute(
+            upsert(connection)(table).on_conflict_do_nothing().returning(table.c.id, table.c.name, table.c.phone_key),
+            [values for line, values in new.values()]
+        ).all()
+        add_terms(connection, 'borrower', [(borrower_id, name) for borrower_id, name, key in inserted])
+        report.inserted += len(inserted)
+        # the rest clashed on phone_number exactly as written, or with a borrower added since the lookup
+        inserted_keys = {key for borrower_id, name, key in inserted}
+        lost += [(line, values) for key, (line, values) in new.items() if key not in inserted_keys]
+    for line, values in sorted(lost, key=lambda record: record[0]):
+        report.reject(line, f"duplicate phone_number '{values['phone_number']}'")
+
+    if not update:
+        for line, values in records:
+            if values['phone_key'] in existing:
+                report.reject(line, f"duplicate phone_number '{values['phone_number']}'")
+        return
+    # renamed through the ORM, so the fuzzy index follows the new names
+    borrowers = session.execute(select(Borrower).where(Borrower.phone_key.in_(existing))).scalars()
+    names = {values['phone_key']: values['name'] for line, values in records}
+    for borrower in borrowers:
+        if borrower.name != names[borrower.phone_key]:
+            borrower.name = names[borrower.phone_key]
+            report.updated += 1
+    session.flush()
+
+
+def import_books(connection, records, report, authors, genres):
+    """Inserts books, resolving author and genre names (and creating the missing ones)."""
+    if not records:
+        return
+    author_ids = authors.resolve(connection, {values['author'] for line, values in records})
+    genre_ids = genres.resolve(connection, {values['genre'] for line, values in records})
+    table = Book.__table__
+    inserted = connection.execute(table.insert().returning(table.c.id, table.c.title), [{
+        'title': values['title'],
+        'published_year': values['published_year'],
+        'author_id': author_ids[values['author']],
+        'genre_id': genre_ids[values['genre']],
+    } for line, values in records]).all()
+    add_terms(connection, 'book', inserted)
+    report.inserted += len(inserted)
+
+
+def import_file(session, kind, path, file_format=None, update=False, batch_size=IMPORT_BATCH_SIZE):
+    """Streams the records in path into the kind table, batch_size records per transaction.
+
+    Records that can't be imported (missing fields, duplicates) are reported and
+    skipped; the rest of the file still goes in. Returns an ImportReport.
+    """
+    report = ImportReport()
+    authors, genres = NameLookup(Author, 'author'), NameLookup(Genre, None)
+    records = read_records(path, file_format)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        valid = check_batch(kind, batch, report)
+
+        def write_batch():
+            connection = session.connection()
+            if kind == 'authors':
+                import_names(connection, Author, 'author', valid, report)
+            elif kind == 'genres':
+                import_names(connection, Genre, None, valid, report)
+            elif kind == 'borrowers':
+                import_borrowers(session, valid, report, update)
+            else:
+                import_books(connection, valid, report, authors, genres)
+        run_write(session, write_batch)
+        session.expunge_all() # nothing from this batch is needed for the next one
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import authors, genres, books or borrowers from a CSV or JSON-lines file.")
+    parser.add_argument('kind', choices=sorted(FIELDS), help="what the file holds")
+    parser.add_argument('path', help="CSV file with a header row, or a file with one JSON object per line")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="file format (default: from the file extension)")
+    parser.add_argument('--update', action='store_true', help="update the name of borrowers whose phone number already exists")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="records per transaction")
+    args = parser.parse_args()
+
+    print(f"Import finished: {import_file(session, args.kind, args.path, args.format, args.update, args.batch_size)}.")
+    session.close()
@@ -0,0 +1,81 @@
+from lib.db.models import Author, Book, Borrower, Loan
+
+PAGE_SIZE = 25           # rows per page in the interactive listings
+STREAM_BATCH_SIZE = 1000 # rows fetched per round trip when streaming a whole listing
+
+
+class Page:
+    """One page of listing rows plus whether there is anything before or after it."""
+
+    def __init__(self, rows, has_previous, has_next):
+        self.rows = rows
+        self.has_previous = has_previous
+        self.has_next = has_next
+
+    @property
+    def first_id(self):
+        return self.rows[0].id if self.rows else None
+
+    @property
+    def last_id(self):
+        return self.rows[-1].id if self.rows else None
+
+
+def fetch_page(query, id_column, after_id=None, before_id=None, page_size=PAGE_SIZE):
+    """Fetches one keyset page of a listing query, ordered by id_column.
+
+    Pass after_id for the page that follows a page, before_id for the one that precedes
+    it, or neither for the first page. Each page is a single indexed range scan on the
+    id, so paging deep into a big table costs the same as the first page.
+    """
+    query = query.order_by(None) # the listing's own ordering is replaced by the keyset one
+    if before_id is not None:
+        rows = query.filter(id_column < before_id).order_by(id_column.desc()).limit(page_size + 1).all()
+        has_previous = len(rows) > page_size
+        return Page(list(reversed(rows[:page_size])), has_previous, True)
+
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    rows = query.order_by(id_column).limit(page_size + 1).all()
+    return Page(rows[:page_size], after_id is not None, len(rows) > page_size)
+
+
+def stream_rows(query, id_column, after_id=None, batch_size=STREAM_BATCH_SIZE):
+    """Yields every row of a listing query (after after_id, if given) in id order.
+
+    Rows are fetched batch_size at a time with yield_per, so memory stays flat no matter
+    how big the table is.
+    """
+    query = query.order_by(None)
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    yield from query.order_by(id_column).yield_per(batch_size)
+
+
+def author_rows_query(session):
+    """(id, name) rows for the author listing."""
+    return session.query(Author.id, Author.name)
+
+
+def borrower_rows_query(session):
+    """(id, name, phone_number) rows for the borrower listing."""
+    return session.query(Borrower.id, Borrower.name, Borrower.phone_number)
+
+
+def loan_rows_query(session):
+    """(id, borrower_name, book_title, loan_date, return_date) rows for the loan listing.
+
+    Borrower and book are joined in, so a page of loans is one query rather than one
+    query per loan for each lazy-loaded relationship.
+    """
+    return (
+        session.query(
+            Loan.id,
+            Borrower.name.label('borrower_name'),
+            Book.title.label('book_title'),
+            Loan.loan_date,
+            Loan.return_date,
+        )
+        .outerjoin(Borrower, Loan.borrower_id == Borrower.id)
+        .outerjoin(Book, Loan.book_id == Book.id)
+    )
@@ -1,11 +1,128 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+import importlib
+import re
+
+from sqlalchemy import create_engine, event, select, union_all, DDL, MetaData, Table, Column, Integer, String, Date, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session as OrmSession, sessionmaker, scoped_session, declarative_base, relationship, validates
+
+from lib.db.config import load_settings, setting_as_bool
 
 Base = declarative_base()
 
-engine = create_engine('sqlite:///libmate.db')
-Session = sessionmaker(bind=engine)
-session = Session()
+SQLITE_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'foreign_keys')
+
+
+def sqlite_pragma_listener(settings, read_only=False):
+    """Returns a 'connect' event listener that applies the configured pragmas to each new SQLite connection."""
+    pragmas = [(name, settings[name]) for name in SQLITE_PRAGMAS]
+    if read_only:
+        pragmas.append(('query_only', 'ON')) # any write fails with "attempt to write a readonly database"
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return apply_pragmas
+
+
+def create_libmate_engine(url=None, settings=None, read_only=False):
+    """Creates the engine from the database settings (see lib/db/config.py).
+
+    SQLite engines get the configured pragmas (WAL, synchronous, busy_timeout, cache/mmap
+    sizes, foreign keys) on every connection. Their write transactions start with BEGIN
+    IMMEDIATE: pysqlite opens a transaction lazily at the first INSERT/UPDATE/DELETE, so
+    reads stay outside it, and that BEGIN takes the write lock straight away so a competing
+    desk waits (up to busy_timeout) instead of failing mid-way.
+
+    Any other SQLAlchemy URL (e.g. postgresql://...) gets a plain pooled engine.
+    With read_only=True the engine's connections refuse writes (for exports and reports).
+    With profiling on (LIBMATE_PROFILE=1) every statement is timed; see lib/db/profiling.py.
+    """
+    settings = settings or load_settings()
+    url = make_url(url or settings['database_url'])
+    is_sqlite = url.get_backend_name() == 'sqlite'
+    in_memory = is_sqlite and url.database in (None, '', ':memory:')
+
+    engine_args = {'echo': setting_as_bool(settings['echo'])}
+    if is_sqlite:
+        engine_args['connect_args'] = {
+            'isolation_level': 'IMMEDIATE',
+            'timeout': int(settings['busy_timeout']) / 1000,
+            'check_same_thread': False, # pooled connections move between threads, one at a time
+        }
+    else:
+        engine_args['pool_pre_ping'] = True # drop connections the server has closed
+        if read_only:
+            engine_args['execution_options'] = {'postgresql_readonly': True}
+    if not in_memory:
+        engine_args.update(
+            pool_size=int(settings['pool_size']),
+            max_overflow=int(settings['max_overflow']),
+            pool_timeout=int(settings['pool_timeout']),
+        )
+
+    engine = create_engine(url, **engine_args)
+    if is_sqlite:
+        event.listen(engine, 'connect', sqlite_pragma_listener(settings, read_only))
+    if setting_as_bool(settings['profile']):
+        from lib.db.profiling import install_profiler # only imported (and its listeners only attached) when profiling
+        install_profiler(engine, settings)
+    return engine
+
+
+# The engine is created on first use rather than at import, so commands that never touch
+# the database (--help, a mistyped option) don't pay for it.
+_engine = None
+
+
+def get_engine():
+    """The application's engine, created from the database settings the first time it's needed."""
+    global _engine
+    if _engine is None:
+        _engine = create_libmate_engine()
+    return _engine
+
+
+def __getattr__(name):
+    # `from lib.db.models import engine` still works; it creates the engine at that point
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LibMateSession(OrmSession):
+    """A session that binds itself to the application's engine when it first needs a connection."""
+
+    def get_bind(self, *args, **kwargs):
+        if self.bind is None:
+            self.bind = get_engine()
+        return super().get_bind(*args, **kwargs)
+
+
+Session = sessionmaker(class_=LibMateSession)
+# thread-local session registry: each thread gets its own session, session.remove() ends it
+session = scoped_session(Session)
+
+
+def partial_index_options(where):
+    """Index options making an index partial (WHERE where) on SQLite and PostgreSQL.
+
+    SQLAlchemy imports a dialect's package to check the options named after it, and
+    postgresql's costs every start ~50 ms, so its option is only given when the configured
+    database isn't SQLite.
+    """
+    options = {'sqlite_where': where}
+    if make_url(load_settings()['database_url']).get_backend_name() != 'sqlite':
+        options['postgresql_where'] = where
+    return options
+
+
+def upsert(connection):
+    """The dialect's INSERT that supports ON CONFLICT (sqlite or postgresql). The dialect
+    module is imported on first use; importing both up front costs every run ~50 ms."""
+    return importlib.import_module(f"sqlalchemy.dialects.{connection.dialect.name}").insert
+
 
 class Author(Base):
     __tablename__ = 'authors' #define the table name
@@ -13,6 +130,7 @@ class Author(Base):
     name = Column(String, unique=True, nullable=False)#author name must be unique and cannot be null
     books = relationship('Book', back_populates='author', cascade="all, delete-orphan") # define a relationship with the Book model
     # cascade="all, delete-orphan" ensures that when an author is deleted, all their books are also deleted
+    # (one row at a time; lib/db/deletion.py deletes authors and their books with set-based statements)
     def __repr__(self):
         return f"<Author(id={self.id}, name='{self.name}')>"
     
@@ -20,6 +138,7 @@ class Genre(Base):
     __tablename__ = 'genres'
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False) #genre name must be unique and cannot be null
+    loan_period_days = Column(Integer, nullable=True) # days a book of this genre may be kept; NULL means the library default
     books = relationship('Book', back_populates='genre') # define a relationship with the Book model
     def __repr__(self):
         return f"<Genre(id={self.id}, name='{self.name}')>"
@@ -27,39 +146,228 @@ class Genre(Base):
 class Book(Base):
     __tablename__ = 'books' 
     id = Column(Integer, primary_key=True)
-    title = Column(String, nullable=False) # book title cannot be null
+    title = Column(String, nullable=False, index=True) # book title cannot be null
     published_year = Column(Integer)
 
     # foreign keys to the authors and genres tables
-    author_id = Column(Integer, ForeignKey('authors.id'), nullable=False) #foreign key to the authors table
-    genre_id = Column(Integer, ForeignKey('genres.id'), nullable=False) 
+    author_id = Column(Integer, ForeignKey('authors.id'), nullable=False, index=True) #foreign key to the authors table
+    genre_id = Column(Integer, ForeignKey('genres.id'), nullable=False, index=True)
+    # the outstanding loan for this book (NULL when it's on the shelf), kept in step by lib/db/circulation.py
+    current_loan_id = Column(Integer, ForeignKey('loans.id', use_alter=True, name='fk_books_current_loan_id', ondelete='SET NULL'), nullable=True)
 
     # define the relationships
     author = relationship('Author', back_populates='books') 
     genre = relationship('Genre', back_populates='books') 
-    loans = relationship('Loan', back_populates='book') 
+    loans = relationship('Loan', back_populates='book', foreign_keys='Loan.book_id')
+
+    __table_args__ = (
+        # the ON DELETE SET NULL check: without it every loan deleted (or archived) scans the books.
+        # Partial, so it only holds the books that are out
+        Index('ix_books_current_loan_id', 'current_loan_id', **partial_index_options(current_loan_id.isnot(None))),
+    )
+
+    @property
+    def is_available(self):
+        """A book is available when it has no outstanding loan."""
+        return self.current_loan_id is None
+
     def __repr__(self):
         return f"<Book(id={self.id}, title='{self.title}', " \
                f"author_id={self.author_id}, genre_id={self.genre_id})>"
     
+def phone_key(phone_number):
+    """A phone number reduced to its digits, so it matches however it's typed: '(555) 123-4567',
+    '555.123.4567' and '+1-555-123-4567' all give '5551234567'. A North American 1 or 001
+    country code is dropped and an extension's digits follow the number's. Empty when the
+    number has no digits at all."""
+    number, _, extension = phone_number.lower().partition('x') # 555-123-4567x89, 555-123-4567 ext. 89
+    digits = re.sub(r'\D', '', number)
+    if len(digits) == 13 and digits.startswith('001'):
+        digits = digits[3:]
+    elif len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return digits + re.sub(r'\D', '', extension)
+
 class Borrower(Base):
     __tablename__ = 'borrowers'
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     phone_number = Column(String, unique=True, nullable=False)# phone number must be unique
+    # phone_key(phone_number), kept in step whenever phone_number is set. Look borrowers up by
+    # this: its unique index also stops one number being entered twice, written differently.
+    # NULL only for numbers with no digits, or ones the backfill found an older borrower had
+    phone_key = Column(String, unique=True, index=True, nullable=True)
     loans = relationship('Loan', back_populates='borrower', cascade="all, delete-orphan")
+
+    @validates('phone_number')
+    def set_phone_key(self, key, phone_number):
+        self.phone_key = phone_key(phone_number) or None
+        return phone_number
     def __repr__(self):
         return f"<Borrower(id={self.id}, name='{self.name}', phone_number='{self.phone_number}')>"
         
 class Loan(Base):
     __tablename__ = 'loans'
     id = Column(Integer, primary_key=True)
-    loan_date = Column(String, nullable=False)
-    return_date= Column(String, nullable=True)
-    borrower_id = Column(Integer, ForeignKey('borrowers.id'), nullable=False)
-    book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
+    loan_date = Column(Date, nullable=False)
+    return_date= Column(Date, nullable=True)
+    due_date = Column(Date, nullable=False) # loan_date plus the book genre's loan period
+    borrower_id = Column(Integer, ForeignKey('borrowers.id'), nullable=False, index=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False, index=True)
     borrower = relationship('Borrower', back_populates='loans')
-    book = relationship('Book', back_populates='loans')
+    book = relationship('Book', back_populates='loans', foreign_keys=[book_id])
+
+    __table_args__ = (
+        # loan-date ranges, covering the columns the circulation reports aggregate so they never read the table
+        Index('ix_loans_loan_date_covering', 'loan_date', 'book_id', 'borrower_id', 'return_date'),
+        # outstanding (or returned) loans in a loan-date range are a single index range scan
+        Index('ix_loans_return_date_loan_date', 'return_date', 'loan_date'),
+        # partial unique index over outstanding loans only: a book can have at most one open loan
+        Index('ix_loans_open_book_id', 'book_id', unique=True, **partial_index_options(return_date.is_(None))),
+        # (return_date IS NULL, due_date): the overdue sweep reads only the overdue loans, already in due-date order
+        Index('ix_loans_return_date_due_date', 'return_date', 'due_date'),
+        # ids are never handed out again, even once the newest loans have been archived
+        {'sqlite_autoincrement': True},
+    )
     def __repr__(self):
         return f"<Loan(id={self.id}, loan_date='{self.loan_date}', " \
-               f"borrower_id={self.borrower_id}, book_id={self.book_id})>"
\ No newline at end of file
+               f"borrower_id={self.borrower_id}, book_id={self.book_id})>"
+
+class ArchivedLoan(Base):
+    """A returned loan moved out of the loans table by lib/db/archive.py. It keeps its id,
+    and the loan statistics keep counting it."""
+    __tablename__ = 'loans_archive'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    loan_date = Column(Date, nullable=False)
+    return_date = Column(Date, nullable=False) # only returned loans are archived
+    due_date = Column(Date, nullable=False)
+    borrower_id = Column(Integer, ForeignKey('borrowers.id'), nullable=False, index=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False, index=True)
+
+    __table_args__ = (
+        # the same covering index as the loans table's, for the circulation reports' date windows
+        Index('ix_loans_archive_loan_date_covering', 'loan_date', 'book_id', 'borrower_id', 'return_date'),
+    )
+    def __repr__(self):
+        return f"<ArchivedLoan(id={self.id}, loan_date='{self.loan_date}', " \
+               f"borrower_id={self.borrower_id}, book_id={self.book_id})>"
+
+# Every loan, outstanding, returned and archived: a view over loans UNION ALL loans_archive
+# for reports and exports that cover the whole history. The desk's queries use the loans
+# table, which archiving keeps small. The view is created with the tables (and by an
+# Alembic migration for existing databases); all_loans is its table definition for queries,
+# in a MetaData of its own so create_all and autogenerate leave it alone.
+ALL_LOANS_COLUMNS = 'id, loan_date, return_date, due_date, borrower_id, book_id'
+ALL_LOANS_DDL = f"CREATE VIEW all_loans AS SELECT {ALL_LOANS_COLUMNS} FROM loans UNION ALL SELECT {ALL_LOANS_COLUMNS} FROM loans_archive"
+ALL_LOANS_DROP_DDL = "DROP VIEW IF EXISTS all_loans"
+event.listen(Base.metadata, 'after_create', DDL(ALL_LOANS_DDL))
+event.listen(Base.metadata, 'before_drop', DDL(ALL_LOANS_DROP_DDL))
+
+all_loans = Table('all_loans', MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('loan_date', Date),
+    Column('return_date', Date),
+    Column('due_date', Date),
+    Column('borrower_id', Integer),
+    Column('book_id', Integer),
+)
+
+
+def loan_history(*columns):
+    """loans UNION ALL loans_archive with just the named columns, as a subquery standing in
+    for all_loans. SQLite reads every column a view's UNION ALL arms select, so a query
+    through the view can't be answered from a covering index; one through this can."""
+    return union_all(
+        select(*[Loan.__table__.c[column] for column in columns]),
+        select(*[ArchivedLoan.__table__.c[column] for column in columns]),
+    ).subquery('all_loans')
+
+
+class BookLoanStat(Base):
+    """Running loan totals for one book, kept up to date by lib/db/stats.py."""
+    __tablename__ = 'book_loan_stats'
+    book_id = Column(Integer, primary_key=True, autoincrement=False)
+    loan_count = Column(Integer, nullable=False, default=0, index=True) # indexed for the most-borrowed report
+    returned_count = Column(Integer, nullable=False, default=0)
+    total_loan_days = Column(Integer, nullable=False, default=0) # summed over the returned loans
+
+class BorrowerLoanStat(Base):
+    """Running loan total for one borrower, kept up to date by lib/db/stats.py."""
+    __tablename__ = 'borrower_loan_stats'
+    borrower_id = Column(Integer, primary_key=True, autoincrement=False)
+    loan_count = Column(Integer, nullable=False, default=0, index=True) # indexed for the busiest-borrowers report
+
+class GenreMonthStat(Base):
+    """Loan totals per genre and loan month, kept up to date by lib/db/stats.py."""
+    __tablename__ = 'genre_month_stats'
+    genre_id = Column(Integer, primary_key=True, autoincrement=False)
+    month = Column(String, primary_key=True) # loan date as 'YYYY-MM'
+    loan_count = Column(Integer, nullable=False, default=0)
+    returned_count = Column(Integer, nullable=False, default=0)
+    total_loan_days = Column(Integer, nullable=False, default=0) # summed over the returned loans
+
+
+class FuzzyTerm(Base):
+    """One searchable name (a book title, author name or borrower name) in the fuzzy-match index."""
+    __tablename__ = 'fuzzy_terms'
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False) # 'book', 'author' or 'borrower'
+    entity_id = Column(Integer, nullable=False) # id in the books/authors/borrowers table
+    text = Column(String, nullable=False)
+    trigram_count = Column(Integer, nullable=False)
+    __table_args__ = (UniqueConstraint('kind', 'entity_id', name='uq_fuzzy_terms_kind_entity'),)
+    def __repr__(self):
+        return f"<FuzzyTerm(id={self.id}, kind='{self.kind}', entity_id={self.entity_id}, text='{self.text}')>"
+
+class FuzzyTrigram(Base):
+    """Trigram posting list entry: the term contains the trigram. Clustered by (kind, trigram)."""
+    __tablename__ = 'fuzzy_trigrams'
+    kind = Column(String, primary_key=True)
+    trigram = Column(String, primary_key=True)
+    # fuzzy_terms.id. No foreign key: lib/db/fuzzy.py deletes a term's postings itself, and
+    # with term_id last in the key, every term deleted meant scanning all the postings for the check
+    term_id = Column(Integer, primary_key=True)
+    __table_args__ = {'sqlite_with_rowid': False}
+
+class FuzzyTrigramStat(Base):
+    """How many terms of a kind contain a trigram, so searches can start from the rarest ones."""
+    __tablename__ = 'fuzzy_trigram_stats'
+    kind = Column(String, primary_key=True)
+    trigram = Column(String, primary_key=True)
+    term_count = Column(Integer, nullable=False)
+    __table_args__ = {'sqlite_with_rowid': False}
+
+# Full-text search index over book titles and author names (SQLite FTS5). The rowid is the
+# book id, and triggers keep it in step with books and authors; lib/db/search.py queries
+# and rebuilds it. The same objects are created by an Alembic migration for existing databases.
+BOOK_SEARCH_TRIGGER_DDL = [
+    "CREATE TRIGGER book_search_ai AFTER INSERT ON books BEGIN "
+    "INSERT INTO book_search(rowid, title, author_name) "
+    "VALUES (new.id, new.title, (SELECT name FROM authors WHERE id = new.author_id)); END",
+    "CREATE TRIGGER book_search_ad AFTER DELETE ON books BEGIN "
+    "DELETE FROM book_search WHERE rowid = old.id; END",
+    "CREATE TRIGGER book_search_au AFTER UPDATE OF title, author_id ON books BEGIN "
+    "UPDATE book_search SET title = new.title, author_name = (SELECT name FROM authors WHERE id = new.author_id) "
+    "WHERE rowid = new.id; END",
+    "CREATE TRIGGER book_search_author_au AFTER UPDATE OF name ON authors BEGIN "
+    "UPDATE book_search SET author_name = new.name "
+    "WHERE rowid IN (SELECT id FROM books WHERE author_id = new.id); END",
+]
+BOOK_SEARCH_TRIGGER_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS book_search_author_au",
+    "DROP TRIGGER IF EXISTS book_search_au",
+    "DROP TRIGGER IF EXISTS book_search_ad",
+    "DROP TRIGGER IF EXISTS book_search_ai",
+]
+BOOK_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE book_search USING fts5(title, author_name, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+] + BOOK_SEARCH_TRIGGER_DDL
+BOOK_SEARCH_DROP_DDL = BOOK_SEARCH_TRIGGER_DROP_DDL + ["DROP TABLE IF EXISTS book_search"]
+for statement in BOOK_SEARCH_DDL:
+    event.listen(Base.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in BOOK_SEARCH_DROP_DDL:
+    event.listen(Base.metadata, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+
+# The ORM events that keep the fuzzy title/name index up to date live in lib/db/fuzzy.py;
+# importing it here registers them in every process that can write the models.
+import lib.db.fuzzy
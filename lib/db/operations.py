@@ -0,0 +1,259 @@
+import datetime
+import json
+import sys
+from itertools import islice
+
+from lib.db.models import Author, Book, Borrower, Loan, phone_key
+from lib.db.circulation import CirculationError, run_write, prepare_loan, prepare_return, prepare_loans, prepare_returns, set_results
+from lib.db.deletion import prepare_author_deletes, prepare_book_deletes, prepare_borrower_deletes
+from lib.db.refcache import author_row, genre_row
+from lib.db.commands import BATCH_GROUP_SIZE
+
+# what each operation takes: name -> (required fields, optional fields); ids are integers, dates ISO strings.
+# borrow, return and the deletes also take a list of ids, handled as one set.
+FIELDS = {
+    'borrow': (('borrower', 'book'), ('date',)),
+    'return': ((), ('loan', 'book', 'date')),
+    'add-author': (('name',), ()),
+    'add-borrower': (('name', 'phone'), ()),
+    'add-book': (('title', 'year', 'author', 'genre'), ()),
+    'delete-author': (('author',), ()),
+    'delete-book': (('book',), ()),
+    'delete-borrower': (('borrower',), ()),
+}
+INTEGER_FIELDS = ('borrower', 'book', 'loan', 'year', 'author', 'genre')
+
+
+class CommandError(Exception):
+    """Raised when an operation is malformed or names rows that don't exist."""
+
+
+def parse_operation(record):
+    """Checks a {'op': name, field: value, ...} record (or its JSON text); returns (name, arguments)."""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError as e: # json.JSONDecodeError is a ValueError
+            raise CommandError(f"invalid JSON: {e}")
+    if not isinstance(record, dict) or record.get('op') not in FIELDS:
+        raise CommandError(f"unknown operation; expected one of {', '.join(FIELDS)}")
+    name = record['op']
+    required, optional = FIELDS[name]
+    arguments = {field: value for field, value in record.items() if field != 'op' and value is not None}
+    missing = [field for field in required if field not in arguments]
+    if missing:
+        raise CommandError(f"missing {', '.join(missing)}")
+    unknown = [field for field in arguments if field not in required + optional]
+    if unknown:
+        raise CommandError(f"unknown field {', '.join(unknown)}")
+    try:
+        for field in INTEGER_FIELDS:
+            if isinstance(arguments.get(field), list):
+                arguments[field] = [int(value) for value in arguments[field]]
+            elif field in arguments:
+                arguments[field] = int(arguments[field])
+        if 'date' in arguments:
+            arguments['date'] = datetime.date.fromisoformat(str(arguments['date']))
+    except ValueError as e:
+        raise CommandError(str(e))
+    if name == 'return' and ('loan' in arguments) == ('book' in arguments):
+        raise CommandError("give either loan or book")
+    return name, arguments
+
+
+# Operations. Each checks its arguments with reads and returns the write that carries
+# it out, so a batch can run many writes in one transaction. A write returns the fields
+# reported for the operation (with 'ok': False if only some items of a set went ahead).
+
+def borrow(session, borrower, book, date=None):
+    if isinstance(book, list):
+        errors, lend_all = prepare_loans(session, borrower, book, date)
+        return lambda: set_result(set_results(book, lend_all(), errors), 'book_id', 'loan_id')
+    if not session.get(Borrower, borrower):
+        raise CommandError(f"Borrower with ID {borrower} not found.")
+    lend = prepare_loan(session, borrower, book, date)
+
+    def write():
+        loan = lend()
+        return {'loan_id': loan.id, 'book_id': book, 'borrower_id': borrower, 'due_date': loan.due_date.isoformat()}
+    return write
+
+
+def return_loan(session, loan=None, book=None, date=None):
+    if isinstance(loan, list) or isinstance(book, list):
+        return return_many(session, loan, book, date)
+    if book is not None:
+        loan = session.query(Book.current_loan_id).filter(Book.id == book).scalar()
+        if loan is None:
+            raise CommandError(f"Book with ID {book} isn't on loan.")
+    loan_to_return = session.get(Loan, loan)
+    if not loan_to_return:
+        raise CommandError(f"Loan with ID {loan} not found.")
+    give_back = prepare_return(session, loan_to_return, date)
+
+    def write():
+        returned = give_back()
+        return {'loan_id': returned.id, 'book_id': returned.book_id, 'return_date': returned.return_date.isoformat()}
+    return write
+
+
+def return_many(session, loan_ids, book_ids, date):
+    """Returns a set of loans, or the outstanding loans of a set of books."""
+    if book_ids is None:
+        errors, give_back_all = prepare_returns(session, loan_ids, date)
+        return lambda: set_result(set_results(loan_ids, give_back_all(), errors), 'loan_id', 'book_id')
+    open_loans = dict(session.query(Book.id, Book.current_loan_id).filter(Book.id.in_(book_ids), Book.current_loan_id != None))
+    errors, give_back_all = prepare_returns(session, list(open_loans.values()), date)
+    errors = {book_id: errors.get(open_loans[book_id]) if book_id in open_loans else f"Book with ID {book_id} isn't on loan."
+              for book_id in book_ids}
+
+    def write():
+        returned = {book_id: loan_id for loan_id, book_id in give_back_all().items()}
+        return set_result(set_results(book_ids, returned, errors), 'book_id', 'loan_id')
+    return write
+
+
+def set_result(results, id_field, done_field):
+    """The reported fields of a set operation: ok only if every item went ahead, and an item per id."""
+    items = [{id_field: item_id, done_field: done} if not error else {id_field: item_id, 'error': error}
+             for item_id, done, error in results]
+    return {'ok': all('error' not in item for item in items), 'items': items}
+
+
+def add_author(session, name):
+    if session.query(Author.id).filter(Author.name == name).first():
+        raise CommandError(f"Author '{name}' already exists.")
+    return lambda: {'author_id': add_row(session, Author(name=name))}
+
+
+def add_borrower(session, name, phone):
+    if not phone_key(phone):
+        raise CommandError("Phone number must contain digits.")
+    if session.query(Borrower.id).filter(Borrower.phone_key == phone_key(phone)).first():
+        raise CommandError(f"Borrower with phone number '{phone}' already exists.")
+    return lambda: {'borrower_id': add_row(session, Borrower(name=name, phone_number=phone))}
+
+
+def add_book(session, title, year, author, genre):
+    if not author_row(session, author):
+        raise CommandError(f"Author with ID {author} not found.")
+    if not genre_row(session, genre):
+        raise CommandError(f"Genre with ID {genre} not found.")
+    return lambda: {'book_id': add_row(session, Book(title=title, published_year=year, author_id=author, genre_id=genre))}
+
+
+def add_row(session, row):
+    session.add(row)
+    session.flush()
+    return row.id
+
+
+def delete_author(session, author):
+    return delete_set(session, author, prepare_author_deletes, 'author_id', 'name')
+
+
+def delete_book(session, book):
+    return delete_set(session, book, prepare_book_deletes, 'book_id', 'title')
+
+
+def delete_borrower(session, borrower):
+    return delete_set(session, borrower, prepare_borrower_deletes, 'borrower_id', 'name')
+
+
+def delete_set(session, ids, prepare, id_field, done_field):
+    """Deletes one id (an error if it can't go) or a list of them (reported per item), with prepare from lib/db/deletion.py."""
+    if isinstance(ids, list):
+        errors, delete_all = prepare(session, ids)
+        return lambda: set_result(set_results(ids, delete_all(), errors), id_field, done_field)
+    errors, delete_all = prepare(session, [ids])
+    if errors:
+        raise CommandError(errors[ids])
+    return lambda: {id_field: ids, done_field: delete_all()[ids]}
+
+
+OPERATIONS = {
+    'borrow': borrow,
+    'return': return_loan,
+    'add-author': add_author,
+    'add-borrower': add_borrower,
+    'add-book': add_book,
+    'delete-author': delete_author,
+    'delete-book': delete_book,
+    'delete-borrower': delete_borrower,
+}
+
+
+# Running operations
+
+def run_group(session, group):
+    """Runs (line, record) operations in one write transaction; returns a result per operation.
+
+    An operation that is malformed or whose checks fail is reported and skipped without
+    touching the transaction. If a write fails (say another desk lent the book in between),
+    the whole group is rolled back and raises.
+    """
+    def work():
+        results = []
+        for line, record in group:
+            try:
+                name, arguments = parse_operation(record)
+                write = OPERATIONS[name](session, **arguments)
+            except (CommandError, CirculationError) as e:
+                results.append(failure(line, record, e))
+                continue
+            results.append({'line': line, 'op': name, 'ok': True, **write()})
+        return results
+    return run_write(session, work)
+
+
+def run_operations(session, operations, group_size=BATCH_GROUP_SIZE):
+    """Runs (line, record) operations, group_size to a transaction, yielding their results in order.
+
+    A group that fails is rerun one operation per transaction, so only the operations
+    that really fail are reported as failed. The session is removed after every group,
+    so a big batch runs in constant memory.
+    """
+    operations = iter(operations)
+    while True:
+        group = list(islice(operations, group_size))
+        if not group:
+            return
+        try:
+            results = run_group(session, group)
+        except Exception:
+            results = []
+            for line, record in group:
+                try:
+                    results += run_group(session, [(line, record)])
+                except Exception as e:
+                    results.append(failure(line, record, e))
+        finally:
+            session.remove()
+        yield from results
+
+
+def failure(line, record, error):
+    try:
+        record = json.loads(record) if isinstance(record, str) else record
+    except ValueError:
+        record = None
+    name = record.get('op') if isinstance(record, dict) else None
+    return {'line': line, 'op': name, 'ok': False, 'error': str(error)}
+
+
+def run_batch(session, batch_file, group_size=BATCH_GROUP_SIZE, out=sys.stdout):
+    """Runs a JSON-lines batch file, writing a JSON line per operation to out as each group
+    commits. Returns the number of operations that failed."""
+    operations = ((line, text) for line, text in enumerate(batch_file, 1) if text.strip())
+    failed = 0
+    for result in run_operations(session, operations, group_size):
+        failed += write_result(result, out)
+    return failed
+
+
+def write_result(result, out):
+    """Writes a result as one JSON line (without a line number for a single command); returns 1 if it failed."""
+    if result['line'] is None:
+        del result['line']
+    out.write(json.dumps(result) + '\n')
+    return 0 if result['ok'] else 1
@@ -0,0 +1,100 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import datetime
+
+from sqlalchemy import func
+
+from lib.db.models import Genre, Book, Borrower, Loan, session
+from lib.db.listing import STREAM_BATCH_SIZE
+from lib.db.circulation import DEFAULT_LOAN_PERIOD_DAYS, run_write
+
+
+def outstanding_loans_query(session):
+    """(id, loan_date, due_date, book_title, borrower_name, phone_number) rows for the
+    outstanding loans, earliest due first.
+
+    Book and borrower are joined into the same query rather than lazy-loaded per loan,
+    and the ix_loans_return_date_due_date index hands over the outstanding loans already
+    in due-date order without touching the returned ones.
+    """
+    return (
+        session.query(
+            Loan.id,
+            Loan.loan_date,
+            Loan.due_date,
+            Book.title.label('book_title'),
+            Borrower.name.label('borrower_name'),
+            Borrower.phone_number,
+        )
+        .outerjoin(Book, Loan.book_id == Book.id)
+        .outerjoin(Borrower, Loan.borrower_id == Borrower.id)
+        .filter(Loan.return_date == None)
+        .order_by(Loan.due_date, Loan.id)
+    )
+
+
+def overdue_query(session, as_of=None):
+    """Outstanding loans that were due back before as_of (default today), most overdue first."""
+    return outstanding_loans_query(session).filter(Loan.due_date < (as_of or datetime.date.today()))
+
+
+def overdue_loans(session, as_of=None, batch_size=STREAM_BATCH_SIZE):
+    """Yields the overdue loan rows batch_size at a time."""
+    yield from overdue_query(session, as_of).yield_per(batch_size)
+
+
+def count_overdue(session, as_of=None):
+    """How many loans are overdue; answered from the ix_loans_return_date_due_date index alone."""
+    return session.query(func.count(Loan.id)).filter(
+        Loan.return_date == None,
+        Loan.due_date < (as_of or datetime.date.today())
+    ).scalar()
+
+
+def days_overdue(loan, as_of=None):
+    return ((as_of or datetime.date.today()) - loan.due_date).days
+
+
+def set_loan_period(session, genre_name, days):
+    """Sets how many days books of a genre may be kept (None for the library default).
+
+    Applies to loans made from now on; outstanding loans keep the due date they were given.
+    Returns False if there is no such genre.
+    """
+    genre = session.query(Genre).filter_by(name=genre_name).first()
+    if not genre:
+        return False
+
+    def update_period():
+        genre.loan_period_days = days
+    run_write(session, update_period)
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report overdue loans, or set a genre's loan period.")
+    parser.add_argument('--as-of', type=datetime.date.fromisoformat, help="report loans overdue on this date (YYYY-MM-DD, default today)")
+    parser.add_argument('--count', action='store_true', help="only print how many loans are overdue")
+    parser.add_argument('--set-loan-period', nargs=2, metavar=('GENRE', 'DAYS'),
+                        help=f"set a genre's loan period in days ('default' for the library's {DEFAULT_LOAN_PERIOD_DAYS})")
+    args = parser.parse_args()
+
+    if args.set_loan_period:
+        genre_name, days = args.set_loan_period
+        days = None if days == 'default' else int(days)
+        if set_loan_period(session, genre_name, days):
+            print(f"Loan period for '{genre_name}' set to {days or DEFAULT_LOAN_PERIOD_DAYS} days.")
+        else:
+            print(f"Genre '{genre_name}' not found.")
+    elif args.count:
+        print(f"{count_overdue(session, args.as_of)} loan(s) overdue.")
+    else:
+        overdue = 0
+        for loan in overdue_loans(session, args.as_of):
+            overdue += 1
+            print(f"Loan ID: {loan.id}, Book: '{loan.book_title}', Borrower: '{loan.borrower_name}' ({loan.phone_number}), "
+                  f"Due: {loan.due_date}, {days_overdue(loan, args.as_of)} day(s) overdue")
+        print(f"{overdue} loan(s) overdue.")
+    session.close()
@@ -0,0 +1,144 @@
+import re
+import sys
+import time
+
+from lib.db.config import load_settings, setting_as_bool
+
+# SQL profiling, switched on with LIBMATE_PROFILE=1 (see lib/db/config.py). When it's off no
+# listener is attached to the engine and start_operation/finish_operation return straight
+# away, so the only cost is a function call per CLI operation.
+#
+# Every statement is timed with before/after_cursor_execute and counted against the CLI
+# operation that's running. Statements slower than slow_query_ms are printed with their
+# query plan as they happen; at the end of each operation a summary is printed: statements
+# per shape (the SQL with its values taken out), and any SELECT shape repeated more than
+# n_plus_one_threshold times, the usual sign of an N+1 (one query per row of an earlier one).
+# Everything goes to standard error, so the JSON lines commands print stay clean.
+
+SUMMARY_SHAPES = 5   # slowest statement shapes listed per operation
+SHAPE_WIDTH = 120    # characters of SQL shown per shape
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+PLACEHOLDER_LISTS = re.compile(r'\((?:\?|%\(\w+\)s)(?:, (?:\?|%\(\w+\)s))*\)(?:, \((?:\?|%\(\w+\)s)(?:, (?:\?|%\(\w+\)s))*\))*')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s")
+
+
+def statement_shape(statement):
+    """The statement with its values and IN/VALUES lists collapsed, so repeats of one query compare equal."""
+    shape = ' '.join(statement.split())
+    shape = LITERALS.sub('?', shape)
+    return PLACEHOLDER_LISTS.sub('(?)', shape)
+
+
+class OperationProfile:
+    """The statements one CLI operation ran: count and total seconds per shape."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.shapes = {} # shape -> [count, seconds]
+        self.slow = 0
+
+    def record(self, shape, seconds):
+        totals = self.shapes.setdefault(shape, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+
+class QueryProfiler:
+    def __init__(self, slow_query_ms, n_plus_one_threshold, output=None):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.output = output or sys.stderr
+        self.operation = None
+        self.explaining = False
+
+    # The start time is kept on the statement's execution context rather than the connection,
+    # so a statement that raises (after_cursor_execute never runs) leaves nothing behind.
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._libmate_query_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context._libmate_query_started
+        if self.operation:
+            self.operation.record(statement_shape(statement), seconds)
+        if seconds * 1000 >= self.slow_query_ms and not self.explaining:
+            self.log_slow_query(conn, cursor, statement, parameters, executemany, seconds)
+
+    def log_slow_query(self, conn, cursor, statement, parameters, executemany, seconds):
+        """Prints a slow statement and its query plan."""
+        if self.operation:
+            self.operation.slow += 1
+        where = f" in {self.operation.name}" if self.operation else ""
+        print(f"[profile] slow query{where}: {seconds * 1000:.1f} ms\n    {' '.join(statement.split())}", file=self.output)
+        for line in self.query_plan(conn, cursor, statement, parameters[0] if executemany else parameters):
+            print(f"    | {line}", file=self.output)
+
+    def query_plan(self, conn, cursor, statement, parameters):
+        """The plan lines for statement (EXPLAIN QUERY PLAN on SQLite, EXPLAIN elsewhere; neither runs it).
+
+        It's run on a fresh DBAPI cursor of the same connection, so it sees the same
+        transaction without going through (and being timed by) the engine's events.
+        """
+        if statement.lstrip().split(None, 1)[0].upper() not in EXPLAINABLE:
+            return []
+        explain = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        self.explaining = True
+        plan_cursor = cursor.connection.cursor()
+        try:
+            plan_cursor.execute(explain + statement, parameters)
+            return [str(row[-1]) for row in plan_cursor.fetchall()] # the human readable detail is the last column
+        except Exception as e:
+            return [f"(no plan: {e})"]
+        finally:
+            plan_cursor.close()
+            self.explaining = False
+
+    def start(self, name):
+        self.operation = OperationProfile(name)
+
+    def finish(self):
+        """Prints the summary of the operation that's running and stops counting against it."""
+        operation, self.operation = self.operation, None
+        if operation is None:
+            return
+        elapsed = time.perf_counter() - operation.started
+        statements = sum(count for count, seconds in operation.shapes.values())
+        in_sql = sum(seconds for count, seconds in operation.shapes.values())
+        print(f"[profile] {operation.name}: {statements} statement(s), {len(operation.shapes)} distinct, "
+              f"{in_sql * 1000:.1f} ms in SQL of {elapsed * 1000:.1f} ms"
+              + (f", {operation.slow} slow" if operation.slow else ""), file=self.output)
+        slowest = sorted(operation.shapes.items(), key=lambda item: item[1][1], reverse=True)[:SUMMARY_SHAPES]
+        for shape, (count, seconds) in slowest:
+            print(f"    {count:>5} x {seconds * 1000:8.1f} ms  {shape[:SHAPE_WIDTH]}", file=self.output)
+        for shape, (count, seconds) in operation.shapes.items():
+            if count > self.n_plus_one_threshold and shape.startswith(('SELECT', 'WITH')):
+                print(f"    possible N+1: ran {count} times: {shape[:SHAPE_WIDTH]}", file=self.output)
+
+
+settings = load_settings()
+# one profiler serves every engine; None when profiling is off
+profiler = QueryProfiler(float(settings['slow_query_ms']), int(settings['n_plus_one_threshold'])) if setting_as_bool(settings['profile']) else None
+
+
+def install_profiler(engine, engine_settings):
+    """Times and counts engine's statements for the operation summaries. Called by
+    create_libmate_engine when its settings turn profiling on."""
+    from sqlalchemy import event
+    global profiler
+    if profiler is None:
+        profiler = QueryProfiler(float(engine_settings['slow_query_ms']), int(engine_settings['n_plus_one_threshold']))
+    event.listen(engine, 'before_cursor_execute', profiler.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', profiler.after_cursor_execute)
+
+
+def start_operation(name):
+    """Counts the statements that follow against the CLI operation name (when profiling is on)."""
+    if profiler:
+        profiler.start(name)
+
+
+def finish_operation():
+    """Prints the summary of the operation started last (when profiling is on)."""
+    if profiler:
+        profiler.finish()
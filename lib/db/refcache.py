@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from lib.db.config import load_settings
+from lib.db.models import Author, Genre, Session
+from lib.db.listing import fetch_page, author_rows_query
+
+# the tables cached here; any flushed change to one of them drops its entries
+REFERENCE_MODELS = (Author, Genre)
+
+
+class ReferenceCache:
+    """A least-recently-used cache whose entries also expire ttl seconds after they were loaded.
+
+    Keys are tuples starting with the table name, so one table's entries can be dropped
+    when it changes. Entries from other processes' writes can't be invalidated from here;
+    the TTL bounds how long they stay stale.
+    """
+
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict() # key -> (loaded at, value), least recently used first
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key, load):
+        """Returns the cached value for key, calling load() to fill it on a miss or after expiry.
+
+        A None from load() (no such row) isn't cached: another desk may add the row at any
+        moment, and only this process's own writes invalidate entries.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and self.clock() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = load() # outside the lock, so a slow query doesn't hold up other threads
+        if value is None:
+            return None
+        with self.lock:
+            self.entries[key] = (self.clock(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, table_name=None):
+        """Drops the entries of one table, or every entry."""
+        with self.lock:
+            stale = [key for key in self.entries if table_name is None or key[0] == table_name]
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += 1
+
+    def stats(self):
+        """Hit/miss counters: hits, misses, hit_rate, evictions, invalidations and current entries."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+            }
+
+
+settings = load_settings()
+reference_cache = ReferenceCache(int(settings['reference_cache_size']), float(settings['reference_cache_ttl']))
+
+
+# Invalidation: a flush that touches a reference table drops its entries straight away, and
+# again when the transaction ends, so rows read back before a rollback don't linger.
+
+@event.listens_for(Session, 'after_flush')
+def invalidate_flushed_tables(flushing_session, flush_context):
+    changed = {
+        type(instance).__tablename__
+        for instance in (*flushing_session.new, *flushing_session.dirty, *flushing_session.deleted)
+        if isinstance(instance, REFERENCE_MODELS)
+    }
+    for table_name in changed:
+        reference_cache.invalidate(table_name)
+    flushing_session.info.setdefault('changed_reference_tables', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def invalidate_at_transaction_end(ending_session):
+    for table_name in ending_session.info.pop('changed_reference_tables', ()):
+        reference_cache.invalidate(table_name)
+
+
+# Cached lookups. They return plain row tuples, never ORM objects, so nothing cached is
+# tied to a session.
+
+def genre_rows(session):
+    """(id, name, loan_period_days) for every genre, by id."""
+    return reference_cache.get(('genres', 'all'), lambda: tuple(
+        session.query(Genre.id, Genre.name, Genre.loan_period_days).order_by(Genre.id).all()
+    ))
+
+
+def genre_row(session, genre_id):
+    """The (id, name, loan_period_days) row of one genre, or None."""
+    return next((genre for genre in genre_rows(session) if genre.id == genre_id), None)
+
+
+def author_row(session, author_id):
+    """The (id, name) row of one author, or None."""
+    return reference_cache.get(('authors', 'id', author_id), lambda: (
+        session.query(Author.id, Author.name).filter(Author.id == author_id).first()
+    ))
+
+
+def author_page(session, after_id=None, before_id=None):
+    """A page of the author listing (see listing.fetch_page), cached per position."""
+    return reference_cache.get(('authors', 'page', after_id, before_id), lambda: (
+        fetch_page(author_rows_query(session), Author.id, after_id=after_id, before_id=before_id)
+    ))
+
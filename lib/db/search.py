@@ -0,0 +1,95 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import re
+
+from sqlalchemy import table, column, literal_column
+
+from lib.db.models import Author, Genre, Book, session
+
+SEARCH_LIMIT = 50 # most results a title search returns
+
+# the FTS5 index created in lib/db/models.py (rowid is the book id)
+book_search = table('book_search', column('rowid'), column('title'), column('author_name'), column('rank'))
+
+
+def fts_query(term):
+    """Turns what the user typed into an FTS5 query: every word must match, as a prefix.
+
+    Each word is quoted, so FTS5 operators and punctuation in the input are treated
+    as plain text. Returns None when the input has no searchable words.
+    """
+    words = re.findall(r"\w+", term)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_query(session, term, limit=SEARCH_LIMIT):
+    """Builds the ranked search: (id, title, author_name, genre_name) rows, best match first.
+
+    On SQLite this is an FTS5 MATCH over titles and author names; other databases fall
+    back to a case-insensitive LIKE on the title.
+    """
+    columns = (
+        Book.id,
+        Book.title,
+        Author.name.label('author_name'),
+        Genre.name.label('genre_name'),
+    )
+    if session.get_bind().dialect.name != 'sqlite':
+        return (
+            session.query(*columns)
+            .outerjoin(Author, Book.author_id == Author.id)
+            .outerjoin(Genre, Book.genre_id == Genre.id)
+            .filter(Book.title.ilike(f"%{term}%"))
+            .order_by(Book.title)
+            .limit(limit)
+        )
+
+    return (
+        session.query(*columns)
+        .select_from(book_search)
+        .join(Book, Book.id == book_search.c.rowid)
+        .outerjoin(Author, Book.author_id == Author.id)
+        .outerjoin(Genre, Book.genre_id == Genre.id)
+        .filter(literal_column('book_search').op('MATCH')(fts_query(term)))
+        .order_by(book_search.c.rank) # bm25, lower is better
+        .limit(limit)
+    )
+
+
+def search_books(session, term, limit=SEARCH_LIMIT):
+    """Returns up to limit books whose title or author matches term, best match first."""
+    if fts_query(term) is None:
+        return []
+    return search_query(session, term, limit).all()
+
+
+def rebuild_search_index(session):
+    """Re-indexes every book from the books and authors tables. Returns the number of books indexed."""
+    connection = session.connection()
+    connection.exec_driver_sql("DELETE FROM book_search")
+    indexed = connection.exec_driver_sql(
+        "INSERT INTO book_search(rowid, title, author_name) "
+        "SELECT books.id, books.title, authors.name FROM books LEFT JOIN authors ON authors.id = books.author_id"
+    ).rowcount
+    connection.exec_driver_sql("INSERT INTO book_search(book_search) VALUES ('optimize')") # merge index segments
+    session.commit()
+    return indexed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search or rebuild the book title/author full-text index.")
+    parser.add_argument('--rebuild', action='store_true', help="re-index every book")
+    parser.add_argument('term', nargs='?', help="search for books matching this text")
+    parser.add_argument('--limit', type=int, default=SEARCH_LIMIT, help="most results to show")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"Indexed {rebuild_search_index(session)} book(s).")
+    if args.term:
+        for book in search_books(session, args.term, args.limit):
+            print(f"ID: {book.id}, Title: '{book.title}', Author: '{book.author_name}', Genre: '{book.genre_name}'")
+    session.close()
@@ -2,85 +2,222 @@ import os
 import sys
 sys.path.append(os.getcwd())  # Ensure the current directory is in the path
 from faker import Faker #Faker is a library that generates fake data
+import argparse
 import random
 import datetime
+import time
 
-from lib.db.models import Author, Genre, Book, Borrower, Loan, session, engine, Base
+from sqlalchemy import insert
 
-if __name__ == '__main__':
-    print("Recreating database tables...")
-    # Drop all tables and recreate them
-    Base.metadata.drop_all(engine)  
-    Base.metadata.create_all(engine)  
-    print("Database tables recreated.")
-
-    fake = Faker()  # Create a Faker instance
-       # Generate fake data for authors, genres, books, borrowers, and loans
-    print("creating authors...")
-    authors = []
-    for _ in range(10): # Generate 10 authors
-        author = Author(name=fake.name())
-        session.add(author)
-        authors.append(author)
-    session.commit()  # Commit authors to get their IDs
-
-    print("Creating genres...")
-    genres = []
-    genre_names = ['Fiction', 'Non-Fiction', 'Science Fiction', 'Fantasy', 'Mystery', 'Biography', 'Thriller', 'History', 'poetry']
-    for name in genre_names:
-        genre = Genre(name=name)
-        session.add(genre)
-        genres.append(genre)
-    session.commit()  
-
-    print("Creating books...")
-    books = []
-    for _ in range(50):
-        book = Book(
-            title=fake.catch_phrase(),  # Generate a random book title
-            published_year=random.randint(1900, 2023),
-            author=random.choice(authors),  
-            genre=random.choice(genres)  
-        )
-        session.add(book)
-        books.append(book)
-    session.commit()  
-
-    print("Creating borrowers...")
-    borrowers = []
-    for _ in range(15):
-        borrower = Borrower(
-            name=fake.name(),
-            phone_number=fake.phone_number()
-        )
-        session.add(borrower)
-        borrowers.append(borrower)
-    session.commit()
-
-    print("create loans...")
-    loans = []
-    for _ in range(30):
-        loan_date_obj= fake.date_this_year()
-        loan_date_str = loan_date_obj.isoformat()
-        return_date_str = None
-        if random.random() > 0.3:
-            delta_days = random.randint(1, 60)  # Randomly choose a return date within 30 days
-            return_date_obj = loan_date_obj + datetime.timedelta(days=delta_days)
-            # Convert to string format for storing in the database
-            return_date_str = return_date_obj.isoformat()
-
-        loan = Loan(
-            borrower=random.choice(borrowers),  # Randomly select a borrower
-            book=random.choice(books),
-            loan_date=loan_date_str,
-            return_date=return_date_str  # Use the formatted return date or None if not returned
-        )
-        session.add(loan)
-        loans.append(loan)
-    session.commit()
+from lib.db.models import Author, Genre, Book, Borrower, Loan, session, engine, Base, phone_key, BOOK_SEARCH_TRIGGER_DDL, BOOK_SEARCH_TRIGGER_DROP_DDL
+from lib.db.circulation import repair_availability, DEFAULT_LOAN_PERIOD_DAYS
+from lib.db.search import rebuild_search_index
+from lib.db.fuzzy import rebuild_fuzzy_index
+from lib.db.stats import rebuild_stats
+
+GENRE_NAMES = ['Fiction', 'Non-Fiction', 'Science Fiction', 'Fantasy', 'Mystery', 'Biography', 'Thriller', 'History', 'poetry']
+DEFAULT_SEED = 42         # same seed, same data (loan dates count back from today)
+BATCH_SIZE = 50000        # rows generated and inserted per executemany
+NAME_POOL_SIZE = 2000     # first and last names drawn from Faker up front; full names are combined from these
+TITLE_POOL_SIZE = 100000  # distinct titles drawn from Faker up front; bigger catalogues reuse them
+OPEN_LOAN_CHANCE = 0.3    # share of the loans still outstanding; at most about this share of the books are out
+LOAN_HISTORY_DAYS = 3 * 365
+
+
+def batches(total, batch_size):
+    """Yields (first_id, count) for consecutive id ranges covering 1..total."""
+    for start in range(1, total + 1, batch_size):
+        yield start, min(batch_size, total + 1 - start)
+
+
+class RowFactory:
+    """Generates seed rows as tuples from one seeded Faker and random.Random, so a run is reproducible.
+
+    Faker is slow per call, so it fills pools of names and titles up front and each
+    batch is put together from those pools and bulk draws from the random generator.
+    """
+
+    columns = {
+        'authors': ('id', 'name'),
+        'books': ('id', 'title', 'published_year', 'author_id', 'genre_id'),
+        'borrowers': ('id', 'name', 'phone_number', 'phone_key'),
+        'loans': ('id', 'loan_date', 'return_date', 'due_date', 'borrower_id', 'book_id'),
+    }
+
+    def __init__(self, seed, counts):
+        self.random = random.Random(seed)
+        self.fake = Faker()
+        self.fake.seed_instance(seed)
+        self.counts = counts
+        self.first_names = [self.fake.first_name() for _ in range(NAME_POOL_SIZE)]
+        self.last_names = [self.fake.last_name() for _ in range(NAME_POOL_SIZE)]
+        self.titles = [self.fake.catch_phrase() for _ in range(min(counts['books'], TITLE_POOL_SIZE))]
+        start = datetime.date.today() - datetime.timedelta(days=LOAN_HISTORY_DAYS)
+        self.dates = [(start + datetime.timedelta(days=day)).isoformat() for day in range(LOAN_HISTORY_DAYS + DEFAULT_LOAN_PERIOD_DAYS + 1)]
+        self.author_names = set() # author names are unique
+        self.books_on_loan = set() # a book can only have one outstanding loan
+        # with several loans per book, most of a book's loans are history
+        self.open_chance = OPEN_LOAN_CHANCE * min(1, counts['books'] / counts['loans'])
+
+    def ids(self, table, count):
+        """count random ids of rows in table."""
+        return self.random.choices(range(1, self.counts[table] + 1), k=count)
+
+    def names(self, count):
+        firsts = self.random.choices(self.first_names, k=count)
+        lasts = self.random.choices(self.last_names, k=count)
+        return [f"{first} {last}" for first, last in zip(firsts, lasts)]
+
+    def authors(self, first_id, count):
+        rows = []
+        for author_id, name in zip(range(first_id, first_id + count), self.names(count)):
+            if name in self.author_names:
+                name = f"{name} {author_id}" # the id can't clash with another author's
+            self.author_names.add(name)
+            rows.append((author_id, name))
+        return rows
+
+    def books(self, first_id, count):
+        book_ids = range(first_id, first_id + count)
+        titles = [self.titles[(book_id - 1) % len(self.titles)] for book_id in book_ids]
+        years = self.random.choices(range(1900, 2024), k=count)
+        genre_ids = self.random.choices(range(1, len(GENRE_NAMES) + 1), k=count)
+        return list(zip(book_ids, titles, years, self.ids('authors', count), genre_ids))
+
+    def borrowers(self, first_id, count):
+        borrower_ids = range(first_id, first_id + count)
+        area_codes = self.random.choices(range(200, 1000), k=count)
+        # the id keeps phone numbers unique however many borrowers there are
+        phones = [f"{area}-{borrower_id // 10000:03d}-{borrower_id % 10000:04d}" for area, borrower_id in zip(area_codes, borrower_ids)]
+        return list(zip(borrower_ids, self.names(count), phones, map(phone_key, phones)))
+
+    def loans(self, first_id, count):
+        days = self.random.choices(range(LOAN_HISTORY_DAYS + 1), k=count)
+        lengths = self.random.choices(range(1, 61), k=count)
+        chances = [self.random.random() for _ in range(count)]
+        rows = []
+        for i, (loan_id, book_id, borrower_id) in enumerate(zip(range(first_id, first_id + count), self.ids('books', count), self.ids('borrowers', count))):
+            return_date = None
+            if chances[i] > self.open_chance or book_id in self.books_on_loan:
+                return_date = self.dates[min(days[i] + lengths[i], LOAN_HISTORY_DAYS)] # returned by today
+            else:
+                self.books_on_loan.add(book_id)
+                days[i] = LOAN_HISTORY_DAYS - lengths[i] # books still out were lent in the last couple of months
+            due_date = self.dates[days[i] + DEFAULT_LOAN_PERIOD_DAYS] # the seeded genres use the default loan period
+            rows.append((loan_id, self.dates[days[i]], return_date, due_date, borrower_id, book_id))
+        return rows
 
+
+def bulk_load(connection, table, columns, make_rows, total, batch_size):
+    """Inserts total generated rows into table, batch_size rows per executemany and transaction.
+
+    The Core insert is compiled once; on drivers with positional parameters (SQLite) the
+    row tuples go straight to the DBAPI executemany, skipping the per-row dict handling.
+    """
+    statement = insert(table).compile(dialect=connection.dialect, column_keys=list(columns))
+    positional = statement.positional and list(statement.positiontup) == list(columns)
+    started = time.perf_counter()
+    for first_id, count in batches(total, batch_size):
+        rows = make_rows(first_id, count)
+        with connection.begin():
+            if positional:
+                connection.exec_driver_sql(str(statement), rows)
+            else:
+                connection.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+    elapsed = time.perf_counter() - started
+    print(f"  {total:,} {table.name} in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def seed_database(counts, seed=DEFAULT_SEED, batch_size=BATCH_SIZE, fuzzy_index=True):
+    """Recreates the tables and fills them with counts rows of generated data.
+
+    Rows go in through Core executemany with explicit ids, bypassing the ORM unit of
+    work. Secondary indexes and the full-text search triggers are dropped during the load
+    and rebuilt in one pass afterwards; the ORM events that maintain the fuzzy index don't fire for
+    Core inserts, so that index is rebuilt at the end too (unless fuzzy_index is False), as
+    are the loan statistics.
+    """
+    factory = RowFactory(seed, counts)
+    sqlite = engine.dialect.name == 'sqlite'
+    # filling a table and then indexing it is much cheaper than keeping its indexes up to date row by row
+    indexes = [index for table in Base.metadata.sorted_tables for index in table.indexes]
+    with engine.connect() as connection:
+        if sqlite:
+            # without this, dropping a big loans table checks every row against books.current_loan_id;
+            # and every generated row's references are in range, so there is nothing for the checks to catch
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+
+        print("Recreating database tables...")
+        with connection.begin():
+            Base.metadata.drop_all(connection)
+            Base.metadata.create_all(connection)
+        print("Database tables recreated.")
+
+        if sqlite:
+            with connection.begin():
+                for statement in BOOK_SEARCH_TRIGGER_DROP_DDL:
+                    connection.exec_driver_sql(statement)
+        with connection.begin():
+            for index in indexes:
+                index.drop(connection)
+
+        print("Creating genres...")
+        with connection.begin():
+            connection.execute(insert(Genre.__table__), [
+                {'id': genre_id, 'name': name} for genre_id, name in enumerate(GENRE_NAMES, start=1)
+            ])
+        print("Creating authors, books, borrowers and loans...")
+        for model in (Author, Book, Borrower, Loan):
+            table = model.__table__
+            bulk_load(connection, table, factory.columns[table.name], getattr(factory, table.name), counts[table.name], batch_size)
+
+        print("Indexing...")
+        with connection.begin():
+            for index in indexes:
+                index.create(connection)
+        if sqlite:
+            with connection.begin():
+                for statement in BOOK_SEARCH_TRIGGER_DDL:
+                    connection.exec_driver_sql(statement)
+            connection.exec_driver_sql("PRAGMA foreign_keys=ON") # the connection goes back to the pool
+            connection.commit()
+
+    print("Updating book availability...")
+    repair_availability(session)  # Mark the books with outstanding loans as on loan
+    print("Computing loan statistics...")
+    rebuild_stats(session)
+    if sqlite:
+        print("Building the search index...")
+        rebuild_search_index(session)
+    if fuzzy_index:
+        print("Building the fuzzy index...")
+        rebuild_fuzzy_index(session)
+    else:
+        print("Skipped the fuzzy index; the first fuzzy search builds it, or run 'python lib/db/fuzzy.py --rebuild'.")
     session.close()  # Close the session
-    print("Database seeded with data successfully!")  # Confirmation message
- 
 
-        
\ No newline at end of file
+
+def count(text):
+    """argparse type for row counts; accepts underscores, as in 1_000_000."""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return value
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recreate the database and fill it with generated data.")
+    parser.add_argument('--authors', type=count, default=10, help="number of authors (default 10)")
+    parser.add_argument('--books', type=count, default=50, help="number of books (default 50)")
+    parser.add_argument('--borrowers', type=count, default=15, help="number of borrowers (default 15)")
+    parser.add_argument('--loans', type=count, default=30, help="number of loans (default 30)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="random seed; the same seed gives the same data")
+    parser.add_argument('--batch-size', type=count, default=BATCH_SIZE, help="rows per insert batch")
+    parser.add_argument('--skip-fuzzy-index', action='store_true', help="don't build the fuzzy index (slow for big catalogues)")
+    args = parser.parse_args()
+
+    counts = {'authors': args.authors, 'books': args.books, 'borrowers': args.borrowers, 'loans': args.loans}
+    started = time.perf_counter()
+    seed_database(counts, args.seed, args.batch_size, fuzzy_index=not args.skip_fuzzy_index)
+    print(f"Database seeded with data successfully in {time.perf_counter() - started:.1f}s!")  # Confirmation message
@@ -0,0 +1,132 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import contextlib
+import gc
+import random
+import resource
+import tempfile
+
+# (menu choice, weight): a desk's day is mostly look-ups, borrowing and returning
+OPERATIONS = [
+    ('1', 2), ('2', 1), ('3', 4), ('4', 2), ('5', 2),     # listings
+    ('12', 3), ('13', 3), ('14', 2),                      # finding books and borrowers
+    ('15', 6), ('16', 6), ('17', 1),                      # borrowing, returning, overdue loans
+    ('18', 1), ('19', 1), ('20', 1), ('21', 1), ('22', 1), # reports and cache statistics
+    ('6', 1), ('9', 1),                                   # adding an author and deleting one again
+]
+SEARCH_WORDS = ['solution', 'matrices', 'website', 'interface', 'synergy', 'model', 'portal']
+DEFAULT_COUNTS = {'authors': 200, 'books': 2000, 'borrowers': 500, 'loans': 5000}
+
+
+def rss_bytes():
+    """The process's current resident set size (its peak where /proc isn't available)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024 # bytes on macOS, KiB elsewhere
+
+
+class Desk:
+    """Answers the CLI's prompts the way a busy desk would, from a seeded random generator.
+
+    Answers depend only on the prompt, so they stay in step with the menu however many
+    pages a listing has. Ids that have to exist (an open loan, the author just added) are
+    read from the database.
+    """
+
+    def __init__(self, engine, counts, seed):
+        self.engine = engine
+        self.counts = counts
+        self.random = random.Random(seed)
+        self.choices = [choice for choice, weight in OPERATIONS for _ in range(weight)]
+        self.pending = []
+        self.added = 0
+
+    def queue(self, operations):
+        """Queues operations random menu choices, followed by Exit."""
+        self.pending = [self.random.choice(self.choices) for _ in range(operations)] + ['23']
+
+    def scalar(self, sql):
+        with self.engine.connect() as connection:
+            return connection.exec_driver_sql(sql).scalar()
+
+    def __call__(self, prompt=''):
+        if prompt.startswith('Enter your choice'):
+            return self.pending.pop(0)
+        if prompt.startswith('Enter Borrower ID'):
+            return str(self.random.randint(1, self.counts['borrowers']))
+        if prompt.startswith('Enter Book ID(s) to borrow'):
+            return ' '.join(str(self.random.randint(1, self.counts['books'])) for _ in range(self.random.randint(1, 5)))
+        if prompt.startswith('Enter Loan ID(s)'):
+            open_loans = self.scalar("SELECT group_concat(id, ' ') FROM (SELECT id FROM loans WHERE return_date IS NULL LIMIT 3)")
+            return open_loans or '0'
+        if prompt.startswith("Enter author's name"):
+            self.added += 1
+            return f"Soak Author {self.added}"
+        if prompt.startswith('Enter Author ID(s) to delete'):
+            return str(self.scalar("SELECT MAX(id) FROM authors"))
+        if prompt.startswith('Are you sure'):
+            # only the authors this run added go; everything else is kept
+            return 'yes' if self.scalar("SELECT MAX(id) FROM authors") > self.counts['authors'] else 'no'
+        if prompt.startswith('Enter words from the book title'):
+            return self.random.choice(SEARCH_WORDS)
+        if prompt.startswith("Enter borrower's phone number"):
+            return self.scalar(f"SELECT phone_number FROM borrowers WHERE id = {self.random.randint(1, self.counts['borrowers'])}")
+        if prompt.startswith('Enter a title or name'):
+            return self.random.choice(SEARCH_WORDS)[:-1] + 'x' # a typo
+        if prompt.startswith('('):
+            return self.random.choice(['n', 'n', 'p', '']) # page through a listing
+        return '' # Enter: default months, "Press Enter to continue", done paging
+
+
+def run_soak(cli, desk, rounds, operations):
+    """Runs rounds of operations menu operations through cli.main(); returns the RSS after each round."""
+    samples = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        cli.input = desk # the CLI's prompts now read from the desk instead of stdin
+        for _ in range(rounds):
+            desk.queue(operations)
+            cli.main()
+            gc.collect()
+            samples.append(rss_bytes())
+    return samples
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run thousands of CLI menu operations and check memory stays flat.")
+    parser.add_argument('--rounds', type=int, default=10, help="rounds of operations; RSS is sampled after each")
+    parser.add_argument('--operations', type=int, default=500, help="menu operations per round")
+    parser.add_argument('--warmup', type=int, default=2, help="rounds run before the baseline RSS is taken")
+    parser.add_argument('--max-growth-mb', type=float, default=5.0, help="RSS growth after warmup that counts as a leak")
+    parser.add_argument('--seed', type=int, default=42, help="random seed for the data and the operations")
+    args = parser.parse_args()
+    if args.rounds <= args.warmup:
+        parser.error("--rounds must be more than --warmup")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # the engine reads the database URL from the settings, so point it at a scratch database first
+        os.environ['LIBMATE_DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'soak.db')}"
+        from lib import cli
+        from lib.db.models import engine
+        from lib.db.seed import seed_database
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            seed_database(DEFAULT_COUNTS, args.seed)
+        desk = Desk(engine, DEFAULT_COUNTS, args.seed)
+        print(f"Running {args.rounds} round(s) of {args.operations} menu operations...")
+        samples = run_soak(cli, desk, args.rounds, args.operations)
+        engine.dispose()
+
+    mb = 1024 * 1024
+    for round_number, rss in enumerate(samples, 1):
+        print(f"Round {round_number}: RSS {rss / mb:.1f} MiB{' (warmup)' if round_number <= args.warmup else ''}")
+    baseline = samples[max(args.warmup - 1, 0)]
+    growth = (max(samples[args.warmup:]) - baseline) / mb
+    if growth > args.max_growth_mb:
+        print(f"\nRSS grew {growth:.1f} MiB after warmup (allowed {args.max_growth_mb} MiB): memory isn't flat.")
+        sys.exit(1)
+    print(f"\nRSS stayed within {args.max_growth_mb} MiB of the baseline over {args.rounds * args.operations} operations (grew {growth:.1f} MiB).")
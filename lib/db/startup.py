@@ -0,0 +1,75 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import re
+import subprocess
+
+from lib.db.config import load_settings
+
+# (name, python arguments, import-time budget in ms, modules that mustn't be imported)
+SCENARIOS = [
+    ("help and usage errors", ['lib/cli.py', '--help'], 150,
+     ('sqlalchemy',)),
+    ("one-shot command", ['-c', 'import lib.db.commands, lib.db.operations'], 750,
+     ('lib.db.analytics', 'lib.db.search', 'lib.db.overdue', 'lib.db.catalogue', 'faker', 'pyarrow')),
+    ("interactive menu", ['-c', 'import lib.cli'], 750,
+     ('faker', 'pyarrow')),
+]
+# the PostgreSQL dialect is only wanted when the database is PostgreSQL
+SQLITE_ONLY_FORBIDDEN = ('sqlalchemy.dialects.postgresql',)
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$', re.M)
+
+
+def import_times(arguments):
+    """Runs python -X importtime with the arguments; returns [(module, self us, cumulative us, depth)]."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', *arguments],
+                            capture_output=True, text=True, cwd=os.getcwd())
+    return [(name, int(own), int(cumulative), len(indent))
+            for own, cumulative, indent, name in IMPORT_LINE.findall(result.stderr)]
+
+
+def check_scenario(arguments, budget_ms, forbidden, runs):
+    """Returns (import ms, forbidden modules imported, slowest modules) for one way of starting.
+
+    The import time is the best of runs cold starts, so one noisy run doesn't fail the check.
+    """
+    best = None
+    for _ in range(runs):
+        imports = import_times(arguments)
+        total = sum(cumulative for name, own, cumulative, depth in imports if depth == 0) / 1000
+        if best is None or total < best[0]:
+            best = (total, imports)
+    total, imports = best
+    names = {name for name, own, cumulative, depth in imports}
+    imported = sorted(module for module in forbidden if module in names)
+    slowest = sorted(((own / 1000, name) for name, own, cumulative, depth in imports), reverse=True)[:5]
+    return total, imported, slowest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the CLI's cold-start import time (python -X importtime) against its budget.")
+    parser.add_argument('--runs', type=int, default=3, help="cold starts per scenario; the fastest counts")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply every budget, for slower machines")
+    args = parser.parse_args()
+
+    sqlite = load_settings()['database_url'].startswith('sqlite')
+    failures = 0
+    for name, arguments, budget_ms, forbidden in SCENARIOS:
+        if sqlite:
+            forbidden += SQLITE_ONLY_FORBIDDEN
+        budget_ms *= args.scale
+        total, imported, slowest = check_scenario(arguments, budget_ms, forbidden, args.runs)
+        passed = total <= budget_ms and not imported
+        print(f"\n[{'OK' if passed else 'OVER BUDGET'}] {name}: {total:.0f} ms of imports (budget {budget_ms:.0f} ms)")
+        for module in imported:
+            print(f"    imports {module}, which it shouldn't")
+        print("    slowest: " + ", ".join(f"{module} {ms:.0f} ms" for ms, module in slowest))
+        if not passed:
+            failures += 1
+
+    if failures:
+        print(f"\n{failures} startup scenario(s) over budget.")
+        sys.exit(1)
+    print("\nEvery startup scenario is within its import-time budget.")
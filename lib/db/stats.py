@@ -0,0 +1,223 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+
+from sqlalchemy import event, select, insert, delete, func, cast, literal, union_all, or_, true, Integer
+
+from lib.db.models import Book, Loan, ArchivedLoan, BookLoanStat, BorrowerLoanStat, GenreMonthStat, all_loans, session, upsert
+
+book_stats_table = BookLoanStat.__table__
+borrower_stats_table = BorrowerLoanStat.__table__
+genre_month_stats_table = GenreMonthStat.__table__
+
+
+def month_key(loan_date):
+    """The 'YYYY-MM' month a loan date falls in, as stored in genre_month_stats."""
+    return loan_date.isoformat()[:7]
+
+
+def loan_month(session, loans):
+    """Loan date as 'YYYY-MM'. SQLite stores dates as ISO text, so that's just its first 7 characters."""
+    if session.get_bind().dialect.name == 'sqlite':
+        return func.substr(loans.c.loan_date, 1, 7)
+    return func.to_char(loans.c.loan_date, 'YYYY-MM')
+
+
+def loan_days(session, loans):
+    """Days between a loan's loan date and its return date."""
+    if session.get_bind().dialect.name == 'sqlite':
+        return func.julianday(loans.c.return_date) - func.julianday(loans.c.loan_date)
+    return loans.c.return_date - loans.c.loan_date
+
+
+# Incremental maintenance
+
+def add_to_stat(connection, table, keys, deltas):
+    """Adds deltas (column -> amount) to the stats row with the given keys, creating it if needed."""
+    connection.execute(upsert(connection)(table).values(**keys, **deltas).on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + amount for column, amount in deltas.items()} # bound values, no EXCLUDED alias to build
+    ))
+
+
+def add_to_stats(connection, table, keys, rows):
+    """Adds many rows of deltas at once, one executemany: each row holds the keys and the
+    amounts to add, and rows with the same keys are summed first."""
+    totals = {}
+    for row in rows:
+        key = tuple(row[column] for column in keys)
+        total = totals.setdefault(key, dict(row, **{column: 0 for column in row if column not in keys}))
+        for column in row:
+            if column not in keys:
+                total[column] += row[column]
+    statement = upsert(connection)(table)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + statement.excluded[column] for column in rows[0] if column not in keys}
+    ), list(totals.values()))
+
+
+def record_loans(connection, loans):
+    """Counts a set of new loans, given as (book_id, borrower_id, genre_id, loan_date): one statement per stats table."""
+    add_to_stats(connection, book_stats_table, ('book_id',), [
+        {'book_id': book_id, 'loan_count': 1} for book_id, borrower_id, genre_id, loan_date in loans])
+    add_to_stats(connection, borrower_stats_table, ('borrower_id',), [
+        {'borrower_id': borrower_id, 'loan_count': 1} for book_id, borrower_id, genre_id, loan_date in loans])
+    add_to_stats(connection, genre_month_stats_table, ('genre_id', 'month'), [
+        {'genre_id': genre_id, 'month': month_key(loan_date), 'loan_count': 1} for book_id, borrower_id, genre_id, loan_date in loans])
+
+
+def record_returns(connection, returns):
+    """Counts a set of returned loans, given as (book_id, genre_id, loan_date, return_date)."""
+    add_to_stats(connection, book_stats_table, ('book_id',), [
+        {'book_id': book_id, 'returned_count': 1, 'total_loan_days': (return_date - loan_date).days}
+        for book_id, genre_id, loan_date, return_date in returns])
+    add_to_stats(connection, genre_month_stats_table, ('genre_id', 'month'), [
+        {'genre_id': genre_id, 'month': month_key(loan_date), 'returned_count': 1, 'total_loan_days': (return_date - loan_date).days}
+        for book_id, genre_id, loan_date, return_date in returns])
+
+
+def record_loan(connection, book_id, borrower_id, genre_id, loan_date):
+    """Counts a new loan. Called by check_out inside its write transaction."""
+    add_to_stat(connection, book_stats_table, {'book_id': book_id}, {'loan_count': 1})
+    add_to_stat(connection, borrower_stats_table, {'borrower_id': borrower_id}, {'loan_count': 1})
+    add_to_stat(connection, genre_month_stats_table, {'genre_id': genre_id, 'month': month_key(loan_date)}, {'loan_count': 1})
+
+
+def record_return(connection, book_id, genre_id, loan_date, return_date):
+    """Counts a returned loan and its duration. Called by check_in inside its write transaction."""
+    returned = {'returned_count': 1, 'total_loan_days': (return_date - loan_date).days}
+    add_to_stat(connection, book_stats_table, {'book_id': book_id}, returned)
+    add_to_stat(connection, genre_month_stats_table, {'genre_id': genre_id, 'month': month_key(loan_date)}, returned)
+
+
+@event.listens_for(Loan, 'after_delete')
+def uncount_deleted_loan(mapper, connection, target):
+    """Takes a loan deleted through the ORM (e.g. with its borrower) back out of the totals."""
+    genre_id = connection.execute(select(Book.genre_id).where(Book.id == target.book_id)).scalar()
+    loans = {'loan_count': -1}
+    if target.return_date:
+        loans.update(returned_count=-1, total_loan_days=-(target.return_date - target.loan_date).days)
+    add_to_stat(connection, book_stats_table, {'book_id': target.book_id}, loans)
+    add_to_stat(connection, borrower_stats_table, {'borrower_id': target.borrower_id}, {'loan_count': -1})
+    if genre_id is not None:
+        add_to_stat(connection, genre_month_stats_table, {'genre_id': genre_id, 'month': month_key(target.loan_date)}, loans)
+
+
+def loans_where_in(column, ids):
+    """The loans and archived loans whose column is in ids, as an all_loans stand-in.
+
+    The filter goes inside each arm of the UNION ALL, so each table finds its loans in its
+    own index on column. Filtering the all_loans view instead, SQLite materializes the
+    whole view first: every loan ever made, read on every delete.
+    """
+    return union_all(*[
+        select(*[table.c[loan_column.name] for loan_column in all_loans.columns]).where(table.c[column].in_(ids))
+        for table in (Loan.__table__, ArchivedLoan.__table__)
+    ]).subquery('all_loans')
+
+
+def uncount_loans(session, column, ids):
+    """Takes the loans whose column ('book_id' or 'borrower_id') is in ids, archived ones
+    included, back out of the totals ahead of a bulk delete of them (which doesn't fire
+    uncount_deleted_loan): one INSERT ... SELECT ... ON CONFLICT per stats table, adding
+    the negated per-key totals of those loans."""
+    connection = session.connection()
+    for table, keys, query in expected_stats(session, loans_where_in(column, ids)):
+        counted = query.subquery()
+        columns = [column.name for column in query.selected_columns]
+        negated = select(*[counted.c[column] if column in keys else (-counted.c[column]).label(column) for column in columns])
+        statement = upsert(connection)(table).from_select(columns, negated.where(true())) # SQLite needs a WHERE before ON CONFLICT
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + statement.excluded[column] for column in columns if column not in keys}
+        ))
+
+
+# Rebuilding and verifying
+
+def expected_stats(session, loans=all_loans):
+    """(table, key columns, query) for each stats table, recomputed from loans: by default
+    every loan, through the all_loans view, so archived loans go on counting."""
+    days = cast(func.coalesce(func.sum(loan_days(session, loans)), 0), Integer)
+    month = loan_month(session, loans)
+    return [
+        (book_stats_table, ('book_id',), select(
+            loans.c.book_id, func.count(loans.c.id).label('loan_count'),
+            func.count(loans.c.return_date).label('returned_count'), days.label('total_loan_days'),
+        ).group_by(loans.c.book_id)),
+        (borrower_stats_table, ('borrower_id',), select(
+            loans.c.borrower_id, func.count(loans.c.id).label('loan_count'),
+        ).group_by(loans.c.borrower_id)),
+        (genre_month_stats_table, ('genre_id', 'month'), select(
+            Book.genre_id, month.label('month'), func.count(loans.c.id).label('loan_count'),
+            func.count(loans.c.return_date).label('returned_count'), days.label('total_loan_days'),
+        ).select_from(loans).join(Book, loans.c.book_id == Book.id).group_by(Book.genre_id, month)),
+    ]
+
+
+def rebuild_stats(session):
+    """Recomputes every stats table from the loans (archived ones included), one INSERT ... SELECT each. Returns the rows written."""
+    connection = session.connection()
+    written = 0
+    for table, keys, query in expected_stats(session):
+        connection.execute(delete(table))
+        written += connection.execute(insert(table).from_select([column.name for column in query.selected_columns], query)).rowcount
+    session.commit()
+    return written
+
+
+def verify_stats(session):
+    """Returns (table name, key, stored, expected) for every stats row that disagrees with
+    the loans, archived ones included. A missing row counts as all zeros, like the rows
+    deleted loans leave behind.
+
+    Stored and recomputed rows are stacked with UNION ALL and summed per key, so the check
+    is one sort rather than a join against the recomputed rows.
+    """
+    mismatches = []
+    for table, keys, query in expected_stats(session):
+        expected = query.subquery()
+        counts = [column.name for column in query.selected_columns if column.name not in keys]
+        both = union_all(
+            select(*[table.c[key] for key in keys],
+                   *[table.c[column].label('stored_' + column) for column in counts],
+                   *[literal(0).label('expected_' + column) for column in counts]),
+            select(*[expected.c[key] for key in keys],
+                   *[literal(0).label('stored_' + column) for column in counts],
+                   *[expected.c[column].label('expected_' + column) for column in counts]),
+        ).subquery()
+        stored = [func.sum(both.c['stored_' + column]) for column in counts]
+        recomputed = [func.sum(both.c['expected_' + column]) for column in counts]
+        rows = session.execute(
+            select(*[both.c[key] for key in keys], *stored, *recomputed)
+            .group_by(*[both.c[key] for key in keys])
+            .having(or_(*[mine != theirs for mine, theirs in zip(stored, recomputed)]))
+        )
+        for row in rows:
+            mismatches.append((
+                table.name, tuple(row[:len(keys)]),
+                dict(zip(counts, row[len(keys):len(keys) + len(counts)])),
+                dict(zip(counts, row[len(keys) + len(counts):])),
+            ))
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Verify (and optionally rebuild) the loan statistics tables.")
+    parser.add_argument('--rebuild', action='store_true', help="recompute the statistics from the loans (archived ones included)")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"Rebuilt the loan statistics ({rebuild_stats(session)} row(s)).")
+    else:
+        mismatches = verify_stats(session)
+        for table_name, key, stored, expected in mismatches[:20]:
+            print(f"{table_name} {key}: stored {stored}, expected {expected}")
+        if mismatches:
+            print(f"{len(mismatches)} statistics row(s) out of step. Run again with --rebuild to fix them.")
+            session.close()
+            sys.exit(1)
+        print("Loan statistics are consistent with the loans, archived ones included.")
+    session.close()
@@ -0,0 +1,97 @@
+import os
+import sys
+sys.path.append(os.getcwd())  # Ensure the current directory is in the path
+import argparse
+import multiprocessing
+import tempfile
+
+from sqlalchemy.orm import sessionmaker
+
+from lib.db.models import Author, Genre, Book, Borrower, Loan, Base, create_libmate_engine
+from lib.db.circulation import check_out, check_in, CirculationError
+
+
+def borrow_worker(db_url, borrower_id, book_id, start, results):
+    """One circulation desk: waits for the start signal, then tries to borrow the book."""
+    engine = create_libmate_engine(db_url)
+    session = sessionmaker(bind=engine)()
+    start.wait()
+    try:
+        check_out(session, borrower_id, book_id)
+        results.put('borrowed')
+    except CirculationError:
+        results.put('refused')
+    except Exception as e:
+        results.put(f"error: {e}")
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def setup_database(db_url, borrowers):
+    """Creates a fresh database with one book and the given number of borrowers."""
+    engine = create_libmate_engine(db_url)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    author = Author(name="Stress Author")
+    genre = Genre(name="Stress Genre")
+    book = Book(title="The Contested Copy", published_year=2024, author=author, genre=genre)
+    session.add_all([author, genre, book])
+    session.add_all([Borrower(name=f"Desk {i}", phone_number=f"555-{i:04d}") for i in range(borrowers)])
+    session.commit()
+    return engine, session, book.id
+
+
+def run_round(db_url, book_id, workers):
+    """Starts every worker at once and returns the list of their outcomes."""
+    start = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=borrow_worker, args=(db_url, borrower_id, book_id, start, results))
+        for borrower_id in range(1, workers + 1)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return outcomes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hammer one book from many processes and check only one borrow wins.")
+    parser.add_argument('--workers', type=int, default=16, help="concurrent borrowing processes per round")
+    parser.add_argument('--rounds', type=int, default=5, help="borrow/return rounds to run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'stress.db')}"
+        engine, session, book_id = setup_database(db_url, args.workers)
+
+        failures = 0
+        for round_number in range(1, args.rounds + 1):
+            outcomes = run_round(db_url, book_id, args.workers)
+            borrowed = outcomes.count('borrowed')
+            errors = [outcome for outcome in outcomes if outcome.startswith('error')]
+
+            session.expire_all()
+            open_loans = session.query(Loan).filter(Loan.book_id == book_id, Loan.return_date == None).all()
+            book = session.get(Book, book_id)
+            passed = (borrowed == 1 and not errors and len(open_loans) == 1
+                      and book.current_loan_id == open_loans[0].id)
+            print(f"Round {round_number}: {borrowed} borrowed, {outcomes.count('refused')} refused, "
+                  f"{len(errors)} errors, {len(open_loans)} open loan(s) - {'OK' if passed else 'FAILED'}")
+            for error in errors:
+                print(f"    {error}")
+            if not passed:
+                failures += 1
+            for loan in open_loans:
+                check_in(session, loan) # put the book back for the next round
+
+        session.close()
+        engine.dispose()
+
+    if failures:
+        print(f"\n{failures} of {args.rounds} round(s) double-lent the book or failed.")
+        sys.exit(1)
+    print(f"\nAll {args.rounds} round(s) lent the book exactly once.")
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Ensure the repo root is in the path
+
+# the engine reads the database URL from the settings when it's first used, so point it at a scratch database first
+scratch = tempfile.mkdtemp()
+os.environ['LIBMATE_DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'test.db')}"
+
+from lib.db.models import Base, session as app_session, get_engine
+
+
+@pytest.fixture
+def session():
+    """The application's session over freshly created, empty tables."""
+    engine = get_engine()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield app_session
+    app_session.rollback()
+    app_session.remove()
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import insert
+
+import lib.db.fuzzy
+from lib.db.fuzzy import fuzzy_search, similarity, trigrams, SIMILARITY_THRESHOLD
+from lib.db.models import Author, Book, Genre
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_books(session, *titles):
+    author, genre = Author(name='Jane Doe'), Genre(name='Fiction')
+    session.add_all([author, genre])
+    session.flush()
+    session.add_all([Book(title=title, published_year=2000, author_id=author.id, genre_id=genre.id) for title in titles])
+    session.commit()
+
+
+def test_one_misspelled_word_finds_a_multi_word_title(session):
+    add_books(session, 'Visionary stable synergy', 'Organic asymmetric matrices', 'Total solution-oriented capacity')
+
+    for typo, title in [('synegry', 'Visionary stable synergy'), ('matrics', 'Organic asymmetric matrices')]:
+        matches = fuzzy_search(session, typo, kinds=('book',))
+        assert matches and matches[0][2] == title
+
+
+def test_a_misspelled_surname_finds_the_full_name(session):
+    session.add_all([Author(name='Ryan Johnson'), Author(name='Leah Brown')])
+    session.commit()
+
+    assert [text for kind, entity_id, text, score in fuzzy_search(session, 'Jonson', kinds=('author',))] == ['Ryan Johnson']
+
+
+def test_the_closest_whole_name_ranks_first(session):
+    add_books(session, 'Extended stable synergy', 'Stable synergy')
+
+    assert [match[2] for match in fuzzy_search(session, 'stable synergy', kinds=('book',))] == ['Stable synergy', 'Extended stable synergy']
+
+
+def test_unrelated_text_scores_below_the_threshold():
+    assert similarity(trigrams('xqzw'), trigrams('Visionary stable synergy')) < SIMILARITY_THRESHOLD
+
+
+def test_a_writer_that_only_imports_the_models_keeps_the_index_up_to_date(session, monkeypatch):
+    session.commit() # the tables exist before the other process opens the database
+    monkeypatch.setattr(lib.db.fuzzy, 'index_checked', True) # no rebuild to cover for a missed insert
+    subprocess.run([sys.executable, '-c', (
+        "from lib.db.models import Author, session\n"
+        "session.add(Author(name='Ryan Johnson'))\n"
+        "session.commit()\n"
+    )], cwd=REPO_ROOT, check=True)
+
+    assert [match[2] for match in fuzzy_search(session, 'Jonson', kinds=('author',))] == ['Ryan Johnson']
+
+
+def test_an_empty_index_is_built_on_the_first_search(session, monkeypatch):
+    # names loaded without the ORM events, as in a database just migrated to the fuzzy tables
+    session.execute(insert(Author.__table__), [{'name': 'Ryan Johnson'}, {'name': 'Leah Brown'}])
+    session.commit()
+    monkeypatch.setattr(lib.db.fuzzy, 'index_checked', False)
+
+    assert [match[2] for match in fuzzy_search(session, 'Jonson', kinds=('author',))] == ['Ryan Johnson']
@@ -0,0 +1,49 @@
+from sqlalchemy import insert, select
+
+from lib.db.importer import ImportReport, import_borrowers, import_file, clean_record
+from lib.db.models import Borrower
+
+
+def borrower_records(*rows):
+    """(line, values) records as check_batch would pass them on, from (name, phone_number) rows."""
+    return [(line, clean_record('borrowers', {'name': name, 'phone_number': phone})[0]) for line, (name, phone) in enumerate(rows, start=2)]
+
+
+def borrowers(session):
+    return session.execute(select(Borrower.name, Borrower.phone_number).order_by(Borrower.id)).all()
+
+
+def test_a_clash_on_the_phone_number_as_written_is_rejected(session, capsys):
+    # a borrower the phone key backfill couldn't key still holds its phone_number
+    session.execute(insert(Borrower.__table__).values(name='Old Entry', phone_number='555-010-0100', phone_key=None))
+    report = ImportReport()
+
+    import_borrowers(session, borrower_records(('Ada', '555-010-0100'), ('Grace', '555-010-0200')), report)
+    session.commit()
+
+    assert (report.inserted, report.rejected) == (1, 1)
+    assert "Rejected line 2: duplicate phone_number '555-010-0100'" in capsys.readouterr().out
+    assert borrowers(session) == [('Old Entry', '555-010-0100'), ('Grace', '555-010-0200')]
+
+
+def test_records_of_a_batch_with_the_same_phone_key_are_rejected(session, capsys):
+    report = ImportReport()
+
+    import_borrowers(session, borrower_records(('Ada', '(555) 010-0100'), ('Grace', '555.010.0100'), ('Alan', '+1 555 010 0100')), report)
+    session.commit()
+
+    assert (report.inserted, report.rejected) == (1, 2)
+    out = capsys.readouterr().out
+    assert "Rejected line 3: duplicate phone_number '555.010.0100'" in out
+    assert "Rejected line 4: duplicate phone_number '+1 555 010 0100'" in out
+    assert borrowers(session) == [('Ada', '(555) 010-0100')]
+
+
+def test_every_record_of_a_file_is_inserted_or_rejected(session, tmp_path):
+    path = tmp_path / 'borrowers.csv'
+    path.write_text("name,phone_number\nAda,555-010-0100\nGrace,555 010 0100\nAlan,555-010-0200\nEdsger,(555) 010-0200\nBarbara,555-010-0300\n")
+
+    report = import_file(session, 'borrowers', str(path), batch_size=2) # duplicates within and across batches
+
+    assert (report.inserted, report.updated, report.rejected) == (3, 0, 2)
+    assert [name for name, phone in borrowers(session)] == ['Ada', 'Alan', 'Barbara']
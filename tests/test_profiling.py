@@ -0,0 +1,34 @@
+import io
+
+import pytest
+from sqlalchemy import create_engine, event, exc
+
+from lib.db.profiling import QueryProfiler
+
+
+def profiled_engine(profiler):
+    engine = create_engine('sqlite://')
+    event.listen(engine, 'before_cursor_execute', profiler.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', profiler.after_cursor_execute)
+    return engine
+
+
+def test_a_failing_statement_leaves_nothing_behind():
+    output = io.StringIO()
+    profiler = QueryProfiler(slow_query_ms=10000, n_plus_one_threshold=5, output=output)
+    engine = profiled_engine(profiler)
+
+    profiler.start('failing')
+    with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(exc.OperationalError):
+                connection.exec_driver_sql("SELECT * FROM no_such_table")
+        assert connection.exec_driver_sql("SELECT 1").scalar() == 1
+        assert connection.info == {} # no start times pile up on the pooled connection
+    profiler.finish()
+
+    # only the statement that ran is counted, and it's timed from its own start
+    summary = output.getvalue().splitlines()
+    assert summary[0].startswith("[profile] failing: 1 statement(s), 1 distinct")
+    count, _, milliseconds = summary[1].split()[:3]
+    assert int(count) == 1 and float(milliseconds) < 1000
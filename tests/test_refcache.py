@@ -0,0 +1,24 @@
+from sqlalchemy import insert
+
+from lib.db.models import Author
+from lib.db.refcache import ReferenceCache, reference_cache, author_row
+
+
+def test_a_missing_row_is_not_cached():
+    cache = ReferenceCache(max_entries=10, ttl=60)
+    rows = iter([None, ('found',)])
+
+    assert cache.get(('authors', 'id', 1), lambda: next(rows)) is None
+    assert cache.get(('authors', 'id', 1), lambda: next(rows)) == ('found',)
+    assert cache.stats()['entries'] == 1
+
+
+def test_an_author_added_by_another_desk_is_found_straight_away(session):
+    reference_cache.invalidate()
+    assert author_row(session, 1) is None
+
+    # a Core insert fires none of this process's invalidation events, as if another process made it
+    session.execute(insert(Author.__table__).values(id=1, name='Jane Doe'))
+    session.commit()
+
+    assert tuple(author_row(session, 1)) == (1, 'Jane Doe')
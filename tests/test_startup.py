@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+from lib.db.startup import SCENARIOS, SQLITE_ONLY_FORBIDDEN, check_scenario
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# like startup.py --scale, for slower machines: LIBMATE_STARTUP_SCALE=2 doubles every budget
+BUDGET_SCALE = float(os.environ.get('LIBMATE_STARTUP_SCALE', '1'))
+
+
+@pytest.mark.parametrize('name, arguments, budget_ms, forbidden', SCENARIOS, ids=[scenario[0] for scenario in SCENARIOS])
+def test_cold_start_stays_within_its_import_time_budget(name, arguments, budget_ms, forbidden, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT) # the scenarios run lib/cli.py and import lib.* from the repo root
+    # the tests run on SQLite (see conftest.py), so the PostgreSQL dialect mustn't load either
+    total, imported, slowest = check_scenario(arguments, budget_ms, forbidden + SQLITE_ONLY_FORBIDDEN, runs=3)
+
+    assert not imported, f"{name} imports {', '.join(imported)}"
+    assert total <= budget_ms * BUDGET_SCALE, (
+        f"{name}: {total:.0f} ms of imports (budget {budget_ms * BUDGET_SCALE:.0f} ms); slowest: "
+        + ", ".join(f"{module} {ms:.0f} ms" for ms, module in slowest)
+    )